@@ -0,0 +1,170 @@
+"""Compares the binary archive format with the CSV and JSON files it is converted
+from, on file size and on how long reading takes.
+
+An hour of a station's departures is written the way DeparturesQuerier writes
+them, and an hour of railtimes.py snapshots as JSON lines, both from fixture
+boards.  Each is converted to a binary archive and read back in full, one column
+at a time and one record at a time, and filtered on a serviceID.
+
+Run with:
+    python -m benchmarks.bench_binary_archive --output binary.json
+    python -m benchmarks.bench_binary_archive --compare binary.json
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict
+
+from benchmarks.fixtures import make_board, railtimes_rows
+from benchmarks.run import compare, measure, _git_commit
+from national_rail_pipeline.archive_query import (
+    RowFilter,
+    convert_to_binary,
+    iter_file_rows,
+)
+from national_rail_pipeline.binary_archive import (
+    BINARY_ARCHIVE_EXTENSION,
+    BinaryArchiveReader,
+)
+from national_rail_pipeline.board_flattening import flatten_departure_board
+from national_rail_pipeline.raw_snapshots import snapshot_line
+from national_rail_pipeline.segment_writer import SegmentWriter
+
+RANDOM_RECORDS = 100
+
+
+def write_departures_csv(work_directory: str, polls: int, num_services: int) -> str:
+    segment_writer = SegmentWriter(work_directory)
+    for poll in range(polls):
+        board = make_board(num_services, 10, seed=poll)
+        segment_writer.append("NCL", flatten_departure_board(board))
+    segment_writer.close()
+    return os.path.join(work_directory, "NCL.csv")
+
+
+def write_snapshots_ndjson(work_directory: str, polls: int, num_services: int) -> str:
+    file_path = os.path.join(work_directory, "NCL.ndjson")
+    with open(file_path, "w") as ndjson_file:
+        for poll in range(polls):
+            board = make_board(num_services, 10, seed=poll)
+            ndjson_file.write(
+                snapshot_line(f"{poll:06d}-NCL.json", "NCL", railtimes_rows(board))
+            )
+    return file_path
+
+
+def bench_format(file_path: str) -> Dict[str, Dict]:
+    binary_path = file_path + BINARY_ARCHIVE_EXTENSION
+    convert_to_binary(file_path)
+    gzip_path = file_path + ".gz"
+    with open(file_path, "rb") as source_file, gzip.open(gzip_path, "wb") as gz_file:
+        shutil.copyfileobj(source_file, gz_file)
+
+    with BinaryArchiveReader(binary_path) as reader:
+        record_count = len(reader)
+        service_id = reader.record(record_count // 2)["id"]
+    indices = random.Random(0).sample(range(record_count), RANDOM_RECORDS)
+    service_filter = RowFilter(service_id=service_id)
+
+    def read_all(path):
+        return lambda: sum(1 for _ in iter_file_rows(path, RowFilter()))
+
+    def read_filtered(path):
+        return lambda: sum(1 for _ in iter_file_rows(path, service_filter))
+
+    def read_column_text():
+        return [row["id"] for row in iter_file_rows(file_path, RowFilter())]
+
+    def read_column_binary():
+        with BinaryArchiveReader(binary_path) as reader:
+            return list(reader.column("id"))
+
+    def read_random_text():
+        rows = list(iter_file_rows(file_path, RowFilter()))
+        return [rows[index] for index in indices]
+
+    def read_random_binary():
+        with BinaryArchiveReader(binary_path) as reader:
+            return [reader.record(index) for index in indices]
+
+    return {
+        "size_bytes": {
+            "rows": record_count,
+            "text": os.path.getsize(file_path),
+            "text_gzip": os.path.getsize(gzip_path),
+            "binary": os.path.getsize(binary_path),
+        },
+        "read_all_text": measure(read_all(file_path)),
+        "read_all_text_gzip": measure(read_all(gzip_path)),
+        "read_all_binary": measure(read_all(binary_path)),
+        "read_column_text": measure(read_column_text),
+        "read_column_binary": measure(read_column_binary),
+        f"read_{RANDOM_RECORDS}_random_text": measure(read_random_text),
+        f"read_{RANDOM_RECORDS}_random_binary": measure(read_random_binary),
+        "filter_service_text": measure(read_filtered(file_path)),
+        "filter_service_binary": measure(read_filtered(binary_path)),
+    }
+
+
+def run(polls: int, num_services: int) -> Dict:
+    work_directory = tempfile.mkdtemp(prefix="nr_binary_")
+    try:
+        results = {
+            "departures_csv": bench_format(
+                write_departures_csv(work_directory, polls, num_services)
+            ),
+            "snapshots_ndjson": bench_format(
+                write_snapshots_ndjson(work_directory, polls, num_services)
+            ),
+        }
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+    sizes = {
+        label: format_results.pop("size_bytes")
+        for label, format_results in results.items()
+    }
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+        "sizes": sizes,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Path to write the JSON results to")
+    parser.add_argument("--compare", help="Path of a baseline results file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Fractional slowdown against the baseline reported as a regression",
+    )
+    parser.add_argument(
+        "--polls", type=int, default=60, help="Boards written to each file"
+    )
+    parser.add_argument("--services", type=int, default=50, help="Services per board")
+    args = parser.parse_args()
+
+    run_results = run(args.polls, args.services)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(run_results, output_file, indent=2)
+    else:
+        print(json.dumps(run_results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline_results = json.load(baseline_file)
+        if compare(run_results, baseline_results, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,142 @@
+"""Compares decoding boards in the calling thread with decoding them in a pool of
+worker processes, and checks both give the same rows.
+
+Decoding needs real SOAP responses and the WSDL, so it uses the responses saved by
+``python -m benchmarks.record_fixture NCL KGX --raw`` and LDB_TOKEN must be set
+for the workers to load the WSDL.  The responses are repeated until there are
+--boards of them, then decoded by decode_board in this process and by pools of
+each size given with --processes.
+
+Run with:
+    python -m benchmarks.bench_decode_pool --processes 1 2 4 --output decode.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.fixtures import RECORDED_DIRECTORY
+from benchmarks.run import _git_commit
+from national_rail_pipeline.api import RawResponse
+from national_rail_pipeline.board_flattening import BOARD_MODES
+from national_rail_pipeline.response_decoding import (
+    create_decode_pool,
+    decode_board,
+    init_decode_worker,
+)
+
+_MODES_BY_SUFFIX = {mode.replace("+", ""): mode for mode in BOARD_MODES}
+
+
+def recorded_responses(directory: str) -> List[Tuple[str, RawResponse]]:
+    responses = []
+    for file_path in sorted(glob.glob(os.path.join(directory, "*.xml"))):
+        suffix = os.path.splitext(os.path.basename(file_path))[0].split("-")[-1]
+        with open(file_path, "rb") as response_file:
+            content = response_file.read()
+        responses.append(
+            (
+                _MODES_BY_SUFFIX[suffix],
+                RawResponse(
+                    200, {"Content-Type": "text/xml; charset=utf-8"}, content, "utf-8"
+                ),
+            )
+        )
+    return responses
+
+
+def decode_in_thread(boards: List[Tuple[str, RawResponse]]) -> Tuple[float, List]:
+    start = time.perf_counter()
+    results = [decode_board(mode, response) for mode, response in boards]
+    return time.perf_counter() - start, results
+
+
+def decode_in_pool(
+    boards: List[Tuple[str, RawResponse]], processes: int
+) -> Tuple[float, List]:
+    pool = create_decode_pool(processes)
+    try:
+        # Start every worker and load its WSDL before timing
+        list(pool.map(decode_board, *zip(*boards[:processes])))
+        start = time.perf_counter()
+        futures = [
+            pool.submit(decode_board, mode, response) for mode, response in boards
+        ]
+        results = [future.result() for future in futures]
+        return time.perf_counter() - start, results
+    finally:
+        pool.shutdown()
+
+
+def run(num_boards: int, pool_sizes: List[int], directory: str) -> Dict:
+    responses = recorded_responses(directory)
+    if not responses:
+        raise SystemExit(
+            f"No recorded responses in {directory}, record some with "
+            "python -m benchmarks.record_fixture --raw"
+        )
+    boards = [responses[index % len(responses)] for index in range(num_boards)]
+
+    init_decode_worker()
+    seconds, expected = decode_in_thread(boards)
+    results = {
+        "in_thread": {
+            "seconds": round(seconds, 3),
+            "boards_per_second": round(num_boards / seconds, 1),
+        }
+    }
+    mismatches = []
+    for processes in pool_sizes:
+        seconds, decoded = decode_in_pool(boards, processes)
+        results[f"pool_{processes}"] = {
+            "seconds": round(seconds, 3),
+            "boards_per_second": round(num_boards / seconds, 1),
+            "speedup": round(results["in_thread"]["seconds"] / seconds, 2),
+        }
+        if decoded != expected:
+            mismatches.append(processes)
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "boards": num_boards,
+        "recorded_responses": len(responses),
+        "results": results,
+        "mismatched_pool_sizes": mismatches,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Path to write the JSON results to")
+    parser.add_argument("--boards", type=int, default=500, help="Boards decoded")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="Pool sizes to measure",
+    )
+    parser.add_argument("--directory", default=RECORDED_DIRECTORY)
+    args = parser.parse_args()
+
+    run_results = run(args.boards, args.processes, args.directory)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(run_results, output_file, indent=2)
+    else:
+        print(json.dumps(run_results, indent=2))
+
+    if run_results["mismatched_pool_sizes"]:
+        print(
+            "Rows decoded in pools of "
+            f"{run_results['mismatched_pool_sizes']} differ from the in-thread rows",
+            file=sys.stderr,
+        )
+        sys.exit(1)
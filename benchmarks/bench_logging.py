@@ -0,0 +1,106 @@
+"""Compares the time the logging thread spends on per service log lines with a
+synchronous StreamHandler and eager string formatting (the previous setup) against
+the QueueHandler pipeline with lazy formatting, with and without sampling.
+
+Run with:
+    python -m benchmarks.bench_logging --lines 20000
+"""
+import argparse
+import json
+import logging
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+from national_rail_pipeline.utils.util import (
+    DEFAULT_LOG_FORMAT,
+    LazyQueueHandler,
+    SamplingFilter,
+)
+
+SERVICE = {
+    "id": "1234567LEEDS___",
+    "rsid": "GR123400",
+    "operatorCode": "GR",
+    "platform": "4",
+    "origin": "London Kings Cross",
+    "origin_crs": "KGX",
+    "destination": "Edinburgh",
+    "destination_crs": "EDB",
+    "sched_dep": "10:04",
+    "curr_dep": "On time",
+}
+
+
+def _log_eager(logger: logging.Logger, lines: int) -> None:
+    for _ in range(lines):
+        logger.info(
+            "{} ({}) - {} - Plat. {} - {} ({}) -> {} ({}); Sched_dep: {}; "
+            "Curr_dep: {}".format(*SERVICE.values())
+        )
+
+
+def _log_lazy(logger: logging.Logger, lines: int) -> None:
+    for _ in range(lines):
+        logger.info(
+            "%s (%s) - %s - Plat. %s - %s (%s) -> %s (%s); Sched_dep: %s; "
+            "Curr_dep: %s",
+            *SERVICE.values(),
+            extra={"sampled": True},
+        )
+
+
+def bench_sync(lines: int, log_file) -> dict:
+    logger = logging.getLogger("bench.sync")
+    logger.propagate = False
+    handler = logging.StreamHandler(log_file)
+    handler.setFormatter(logging.Formatter(DEFAULT_LOG_FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    start = time.perf_counter()
+    _log_eager(logger, lines)
+    elapsed = time.perf_counter() - start
+    logger.removeHandler(handler)
+    return {"caller_seconds": elapsed, "total_seconds": elapsed}
+
+
+def bench_queue(lines: int, log_file, sample_every: int = 1) -> dict:
+    logger = logging.getLogger(f"bench.queue.{sample_every}")
+    logger.propagate = False
+    handler = logging.StreamHandler(log_file)
+    handler.setFormatter(logging.Formatter(DEFAULT_LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_every))
+    logger.addHandler(queue_handler)
+    logger.setLevel(logging.INFO)
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+
+    start = time.perf_counter()
+    _log_lazy(logger, lines)
+    caller_elapsed = time.perf_counter() - start
+    listener.stop()
+    total_elapsed = time.perf_counter() - start
+    logger.removeHandler(queue_handler)
+    return {"caller_seconds": caller_elapsed, "total_seconds": total_elapsed}
+
+
+def run(lines: int) -> dict:
+    results = {}
+    with tempfile.TemporaryFile("w") as log_file:
+        results["sync_eager"] = bench_sync(lines, log_file)
+        results["queue_lazy"] = bench_queue(lines, log_file)
+        results["queue_lazy_sampled_10"] = bench_queue(lines, log_file, 10)
+    for result in results.values():
+        result["caller_us_per_line"] = 1e6 * result["caller_seconds"] / lines
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.lines), indent=2))
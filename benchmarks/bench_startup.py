@@ -0,0 +1,183 @@
+"""Measures how long the entry points of the pipeline take to import, using the
+interpreter's -X importtime report.  For railtimes.py, which runs once per poll,
+this is the time spent before the first request can be sent.
+
+Each entry point is imported in a fresh interpreter several times and the median
+cumulative import time is reported along with the modules which cost the most.
+Results are written in the same layout as benchmarks.run so runs on different
+commits can be compared.
+
+Run with:
+    python -m benchmarks.bench_startup --output startup.json
+    python -m benchmarks.bench_startup --compare startup.json
+"""
+import argparse
+import json
+import platform
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from benchmarks.run import compare, _git_commit
+
+ENTRY_POINTS = (
+    "railtimes",
+    "main",
+    "processfiles",
+    "national_rail_pipeline.api",
+    "national_rail_pipeline.__main__",
+    "national_rail_pipeline.threads.departures_querier_thread",
+)
+
+IMPORT_TIME_LINE = re.compile(
+    r"^import time:\s+(?P<self>\d+)\s+\|\s+(?P<cumulative>\d+)\s+\|(?P<name>.*)$"
+)
+
+
+def parse_import_times(report: str) -> List[Tuple[str, int, int, int]]:
+    """Parses -X importtime output.
+
+    Returns:
+        List[Tuple[str, int, int, int]]: Module name, nesting depth, self and
+            cumulative import time in microseconds for each imported module
+    """
+    modules = []
+    for line in report.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        name = match.group("name")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append(
+            (
+                name.strip(),
+                depth,
+                int(match.group("self")),
+                int(match.group("cumulative")),
+            )
+        )
+    return modules
+
+
+def startup_modules() -> Set[str]:
+    """Modules the interpreter imports before running any code."""
+    _, modules = import_once(None)
+    return {name for name, _, _, _ in modules}
+
+
+def import_once(module: Optional[str]) -> Tuple[float, List[Tuple[str, int, int, int]]]:
+    """Imports a module in a fresh interpreter.  If module is None nothing is
+    imported beyond what the interpreter needs to start.
+
+    Returns:
+        Tuple[float, List]: Wall clock seconds for the whole interpreter run and
+            the parsed import time report
+
+    Raises:
+        ImportError: If the module or one of its dependencies cannot be imported
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import {module}" if module is not None else "pass",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    wall_seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise ImportError(process.stderr.strip().splitlines()[-1])
+    return wall_seconds, parse_import_times(process.stderr)
+
+
+def bench_entry_point(
+    module: str, repeats: int, top: int, skip_modules: Set[str]
+) -> Dict:
+    import_ms = []
+    wall_ms = []
+    heaviest = {}
+    for _ in range(repeats):
+        wall_seconds, modules = import_once(module)
+        wall_ms.append(1000 * wall_seconds)
+        # Only modules imported by the entry point, not by site at start up
+        import_ms.append(
+            sum(
+                cumulative
+                for name, depth, _, cumulative in modules
+                if depth == 0 and name not in skip_modules
+            )
+            / 1000
+        )
+        for name, _, self_us, _ in modules:
+            if name in skip_modules:
+                continue
+            heaviest[name] = heaviest.get(name, 0) + self_us / 1000 / repeats
+    import_ms.sort()
+    wall_ms.sort()
+    return {
+        "iterations": repeats,
+        "median_ms": import_ms[repeats // 2],
+        "min_ms": import_ms[0],
+        "interpreter_median_ms": wall_ms[repeats // 2],
+        "heaviest_self_ms": dict(
+            sorted(heaviest.items(), key=lambda item: item[1], reverse=True)[:top]
+        ),
+    }
+
+
+def run(repeats: int, top: int) -> Dict:
+    skip_modules = startup_modules()
+    results = {}
+    skipped = {}
+    for module in ENTRY_POINTS:
+        print(f"Importing {module}...", file=sys.stderr)
+        try:
+            results[module] = bench_entry_point(module, repeats, top, skip_modules)
+        except ImportError as e:
+            # Entry points needing zeep or marshmallow cannot run without them
+            print(f"Skipping {module}: {e}", file=sys.stderr)
+            skipped[module] = str(e)
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": {"import": results},
+        "skipped": skipped,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Path to write the JSON results to")
+    parser.add_argument("--compare", help="Path of a baseline results file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Fractional slowdown against the baseline reported as a regression",
+    )
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of heaviest modules to list"
+    )
+    args = parser.parse_args()
+
+    run_results = run(args.repeats, args.top)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(run_results, output_file, indent=2)
+    else:
+        print(json.dumps(run_results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline_results = json.load(baseline_file)
+        if compare(run_results, baseline_results, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,249 @@
+"""Board fixtures for the benchmarks.
+
+Synthetic boards are generated in the shape of the objects zeep returns for
+GetDepBoardWithDetails / GetArrDepBoardWithDetails.  Recorded boards are real
+responses saved by ``python -m benchmarks.record_fixture`` into
+``benchmarks/recorded``.  Both are built from ``FixtureObject``, a dict with
+attribute access, so the flatteners can read them like zeep objects and
+``zeep.helpers.serialize_object`` walks them like zeep compound values.
+"""
+import datetime
+import glob
+import json
+import os
+import random
+from typing import Any, Dict, List
+
+RECORDED_DIRECTORY = os.path.join(os.path.dirname(__file__), "recorded")
+
+SERVICE_COUNTS = (10, 50, 150)
+CALLING_POINT_COUNTS = (0, 10, 40)
+
+_STATIONS = [
+    ("NCL", "Newcastle"),
+    ("YRK", "York"),
+    ("DAR", "Darlington"),
+    ("DHM", "Durham"),
+    ("LDS", "Leeds"),
+    ("KGX", "London Kings Cross"),
+    ("EDB", "Edinburgh"),
+    ("MAN", "Manchester Piccadilly"),
+    ("LIV", "Liverpool Lime Street"),
+    ("BHM", "Birmingham New Street"),
+    ("SHF", "Sheffield"),
+    ("DON", "Doncaster"),
+    ("PBO", "Peterborough"),
+    ("BWK", "Berwick-upon-Tweed"),
+    ("MBR", "Middlesbrough"),
+    ("SUN", "Sunderland"),
+]
+_OPERATORS = [
+    ("LNER", "GR"),
+    ("CrossCountry", "XC"),
+    ("TransPennine Express", "TP"),
+    ("Northern", "NT"),
+]
+
+
+class FixtureObject(dict):
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def to_fixture_object(value: Any) -> Any:
+    if isinstance(value, dict):
+        return FixtureObject((k, to_fixture_object(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [to_fixture_object(v) for v in value]
+    return value
+
+
+def _clock(minutes: int) -> str:
+    return f"{(minutes // 60) % 24:02d}:{minutes % 60:02d}"
+
+
+def _location(crs: str, name: str) -> Dict:
+    return {"locationName": name, "crs": crs, "via": None, "futureChangeTo": None}
+
+
+def _calling_points(rng: random.Random, count: int, start: int) -> Dict:
+    if count == 0:
+        return None
+    points = []
+    for index in range(count):
+        crs, name = rng.choice(_STATIONS)
+        scheduled = start + 4 * (index + 1)
+        points.append(
+            {
+                "locationName": name,
+                "crs": crs,
+                "st": _clock(scheduled),
+                "et": rng.choice(["On time", _clock(scheduled + 2), "Delayed"]),
+                "at": None,
+                "isCancelled": None,
+                "length": None,
+                "detachFront": None,
+                "adhocAlerts": None,
+            }
+        )
+    return {"callingPointList": [{"callingPoint": points}]}
+
+
+def make_board_dict(
+    num_services: int,
+    num_calling_points: int,
+    crs: str = "NCL",
+    seed: int = 0,
+    arrivals: bool = False,
+) -> Dict:
+    """Generates a board as plain dicts.
+
+    Args:
+        num_services (int): Number of services on the board
+        num_calling_points (int): Calling points listed per service
+        crs (str, optional): CRS code of the board's station
+        seed (int, optional): Seed making the board reproducible
+        arrivals (bool, optional): Also fill in arrival times and previous
+            calling points, as on a combined arrival and departure board
+
+    Returns:
+        Dict: The board
+    """
+    rng = random.Random(f"{crs}-{seed}-{num_services}-{num_calling_points}")
+    station_name = dict(_STATIONS).get(crs, crs)
+    services = []
+    for index in range(num_services):
+        origin = rng.choice(_STATIONS)
+        destination = rng.choice(_STATIONS)
+        operator, operator_code = rng.choice(_OPERATORS)
+        departure = 360 + 3 * index
+        services.append(
+            {
+                "sta": _clock(departure - 2) if arrivals else None,
+                "eta": "On time" if arrivals else None,
+                "std": _clock(departure),
+                "etd": rng.choice(["On time", _clock(departure + 3), "Cancelled"]),
+                "platform": str(rng.randint(1, 12)),
+                "operator": operator,
+                "operatorCode": operator_code,
+                "isCircularRoute": None,
+                "isCancelled": None,
+                "filterLocationCancelled": None,
+                "serviceType": "train",
+                "length": None,
+                "detachFront": None,
+                "isReverseFormation": None,
+                "cancelReason": None,
+                "delayReason": None,
+                "serviceID": f"{seed:04d}{index:04d}{crs}____",
+                "rsid": f"{operator_code}{index:04d}00",
+                "adhocAlerts": None,
+                "origin": {"location": [_location(*origin)]},
+                "destination": {"location": [_location(*destination)]},
+                "currentOrigins": None,
+                "currentDestinations": None,
+                "previousCallingPoints": (
+                    _calling_points(rng, num_calling_points, departure - 120)
+                    if arrivals
+                    else None
+                ),
+                "subsequentCallingPoints": _calling_points(
+                    rng, num_calling_points, departure
+                ),
+            }
+        )
+    return {
+        "generatedAt": datetime.datetime(2025, 1, 16, 6, 0, seed % 60),
+        "locationName": station_name,
+        "crs": crs,
+        "filterLocationName": None,
+        "filtercrs": None,
+        "filterType": None,
+        "nrccMessages": None,
+        "platformAvailable": True,
+        "areServicesAvailable": True,
+        "trainServices": {"service": services},
+        "busServices": None,
+        "ferryServices": None,
+    }
+
+
+def make_board(
+    num_services: int,
+    num_calling_points: int,
+    crs: str = "NCL",
+    seed: int = 0,
+    arrivals: bool = False,
+) -> FixtureObject:
+    """Generates a board readable like a zeep response, see make_board_dict."""
+    return to_fixture_object(
+        make_board_dict(num_services, num_calling_points, crs, seed, arrivals)
+    )
+
+
+def synthetic_boards() -> Dict[str, FixtureObject]:
+    """Every combination of SERVICE_COUNTS and CALLING_POINT_COUNTS, keyed by a
+    label such as "s50_cp10"."""
+    return {
+        f"s{services}_cp{calling_points}": make_board(services, calling_points)
+        for services in SERVICE_COUNTS
+        for calling_points in CALLING_POINT_COUNTS
+    }
+
+
+def recorded_boards(directory: str = RECORDED_DIRECTORY) -> Dict[str, FixtureObject]:
+    """Loads every board saved by benchmarks.record_fixture, keyed by file name."""
+    boards = {}
+    for file_path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(file_path) as board_file:
+            board = json.load(board_file)
+        label = os.path.splitext(os.path.basename(file_path))[0]
+        boards[f"recorded_{label}"] = to_fixture_object(board)
+    return boards
+
+
+def railtimes_rows(board: FixtureObject) -> List[Dict]:
+    """The rows railtimes.py would store for a board, used to build raw/ files."""
+    rows = []
+    for trainservice in board.trainServices.service:
+        calling_points = []
+        if trainservice.subsequentCallingPoints:
+            for cp in trainservice.subsequentCallingPoints.callingPointList[
+                0
+            ].callingPoint:
+                calling_points.append(
+                    {
+                        "name": cp.locationName,
+                        "crs": cp.crs,
+                        "is_cancelled": cp.isCancelled,
+                        "sched_time": cp.st,
+                        "est_time": cp.et,
+                    }
+                )
+        rows.append(
+            {
+                "service_from": board.locationName,
+                "dt_timestamp": str(board.generatedAt),
+                "origin": trainservice.origin.location[0].locationName,
+                "origin_crs": trainservice.origin.location[0].crs,
+                "destination": trainservice.destination.location[0].locationName,
+                "destination_crs": trainservice.destination.location[0].crs,
+                "sched_dep": trainservice.std,
+                "curr_dep": trainservice.etd,
+                "sched_arr": trainservice.sta,
+                "curr_arr": trainservice.eta,
+                "platform": trainservice.platform,
+                "operator": trainservice.operator,
+                "operatorCode": trainservice.operatorCode,
+                "length": trainservice.length,
+                "id": trainservice.serviceID,
+                "rsid": trainservice.rsid,
+                "cancelReason": trainservice.cancelReason,
+                "delayReason": trainservice.delayReason,
+                "calling_points": calling_points,
+            }
+        )
+    return rows
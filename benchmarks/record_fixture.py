@@ -0,0 +1,67 @@
+"""Saves live boards from the National Rail API as benchmark fixtures.
+
+Requires LDB_TOKEN.  Run with:
+    python -m benchmarks.record_fixture NCL KGX --mode arr+dep --num-rows 150
+
+With --raw the undecoded SOAP responses are saved as .xml instead, for
+benchmarks.bench_decode_pool.
+"""
+import argparse
+import json
+import os
+
+from zeep.helpers import serialize_object
+
+from benchmarks.fixtures import RECORDED_DIRECTORY
+from national_rail_pipeline.api import RailQuerier
+from national_rail_pipeline.response_decoding import board_operation
+
+
+def record(crs_codes, mode: str, num_rows: int, raw: bool = False) -> None:
+    rail_querier = RailQuerier()
+    if raw:
+        record_raw(rail_querier, crs_codes, mode, num_rows)
+        return
+    fetch = {
+        "dep": rail_querier.get_departure_board,
+        "arr": rail_querier.get_arrival_board,
+        "arr+dep": rail_querier.get_arr_dep_board,
+    }[mode]
+    os.makedirs(RECORDED_DIRECTORY, exist_ok=True)
+    for crs in crs_codes:
+        board = serialize_object(fetch(crs, num_rows=num_rows), dict)
+        file_path = os.path.join(
+            RECORDED_DIRECTORY, f"{crs}-{mode.replace('+', '')}.json"
+        )
+        with open(file_path, "w") as fixture_file:
+            json.dump(board, fixture_file, default=str)
+        print(f"Recorded {crs} to {file_path}")
+
+
+def record_raw(rail_querier: RailQuerier, crs_codes, mode: str, num_rows: int):
+    os.makedirs(RECORDED_DIRECTORY, exist_ok=True)
+    for crs in crs_codes:
+        response = rail_querier.fetch_raw_response(
+            board_operation(mode), numRows=num_rows, crs=crs, timeWindow=None
+        )
+        if response.status_code != 200:
+            print(f"Skipped {crs}, the API returned {response.status_code}")
+            continue
+        file_path = os.path.join(
+            RECORDED_DIRECTORY, f"{crs}-{mode.replace('+', '')}.xml"
+        )
+        with open(file_path, "wb") as fixture_file:
+            fixture_file.write(response.content)
+        print(f"Recorded {crs} to {file_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("crs_codes", nargs="+")
+    parser.add_argument("--mode", choices=["dep", "arr", "arr+dep"], default="dep")
+    parser.add_argument("--num-rows", type=int, default=150)
+    parser.add_argument(
+        "--raw", action="store_true", help="Save the undecoded SOAP responses"
+    )
+    args = parser.parse_args()
+    record(args.crs_codes, args.mode, args.num_rows, args.raw)
@@ -0,0 +1,321 @@
+"""Benchmarks each stage of the ingestion pipeline and a full querier loop.
+
+Stages are measured on their own against synthetic boards of 10 to 150 services
+with 0 to 40 calling points, plus any recorded boards in benchmarks/recorded.
+The full loop runs DeparturesQuerier.loop over N stations with the API replaced
+by a stub returning fixture boards.  Results are written as JSON so runs on
+different commits can be compared.
+
+Run with:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --output new.json --compare results.json
+"""
+import argparse
+import contextlib
+import copy
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from benchmarks.fixtures import (
+    make_board,
+    railtimes_rows,
+    recorded_boards,
+    synthetic_boards,
+)
+from national_rail_pipeline.board_flattening import flatten_departure_board
+
+Stats = Dict[str, float]
+
+
+def measure(
+    func: Callable,
+    setup: Optional[Callable] = None,
+    min_seconds: float = 0.2,
+    min_iterations: int = 3,
+    max_iterations: int = 500,
+) -> Stats:
+    """Times repeated calls of func, running setup untimed before each call and
+    passing its result to func."""
+    durations = []
+    while len(durations) < min_iterations or (
+        sum(durations) < min_seconds and len(durations) < max_iterations
+    ):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        if setup is not None:
+            func(state)
+        else:
+            func()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return {
+        "iterations": len(durations),
+        "mean_ms": 1000 * sum(durations) / len(durations),
+        "median_ms": 1000 * durations[len(durations) // 2],
+        "min_ms": 1000 * durations[0],
+    }
+
+
+def bench_flatten(boards) -> Dict[str, Stats]:
+    return {
+        label: measure(lambda board=board: flatten_departure_board(board))
+        for label, board in boards.items()
+    }
+
+
+def bench_validate(boards) -> Dict[str, Stats]:
+    from national_rail_pipeline.departure_board_schema import (
+        validate_departure_board,
+    )
+
+    return {
+        label: measure(lambda board=board: validate_departure_board(board))
+        for label, board in boards.items()
+    }
+
+
+def bench_calling_point_store(boards, work_directory: str) -> Dict[str, Stats]:
+    from national_rail_pipeline.calling_point_store import CallingPointStore
+
+    results = {}
+    for label, board in boards.items():
+        rows = flatten_departure_board(board)
+        store = CallingPointStore(os.path.join(work_directory, f"{label}.jsonl"))
+        store.open()
+        results[label] = measure(
+            store.replace_calling_points, setup=lambda rows=rows: copy.deepcopy(rows)
+        )
+        store.close()
+    return results
+
+
+def bench_append(boards, work_directory: str) -> Dict[str, Stats]:
+    from national_rail_pipeline.segment_writer import DURABILITY_MODES, SegmentWriter
+
+    results = {}
+    for durability in DURABILITY_MODES:
+        out_directory = os.path.join(work_directory, f"append_{durability}")
+        os.makedirs(out_directory)
+        segment_writer = SegmentWriter(out_directory, durability=durability)
+
+        def append(label, rows):
+            segment_writer.append(label, rows)
+            segment_writer.commit()
+
+        for label, board in boards.items():
+            rows = flatten_departure_board(board)
+            results[f"{label}_{durability}"] = measure(
+                lambda label=label, rows=rows: append(label, rows)
+            )
+        segment_writer.close()
+    return results
+
+
+def bench_archive(work_directory: str, num_files: int) -> Dict[str, Stats]:
+    from national_rail_pipeline.segment_writer import sealed_segment_name
+    from national_rail_pipeline.threads.file_archiver_thread import FileArchiver
+
+    out_directory = os.path.join(work_directory, "archive_bench")
+    content = "a,b,c\n" + "1,2,3\n" * 100
+
+    def setup():
+        shutil.rmtree(out_directory, ignore_errors=True)
+        archiver = FileArchiver(
+            out_directory=out_directory,
+            log_file_access_lock=threading.Lock(),
+            archive_access_lock=threading.Lock(),
+            interval_timeout=1,
+        )
+        archiver.setup()
+        archiver.is_first_run = False
+        sealed_at = datetime.datetime.now()
+        for index in range(num_files):
+            file_name = sealed_segment_name(f"S{index:03d}", sealed_at)
+            with open(os.path.join(out_directory, file_name), "w") as f:
+                f.write(content)
+        return archiver
+
+    return {f"files{num_files}": measure(lambda archiver: archiver.loop(), setup)}
+
+
+def bench_processfiles(
+    work_directory: str, num_files: int, num_services: int
+) -> Dict[str, Stats]:
+    from national_rail_pipeline.raw_snapshots import compact_day
+    from processfiles import consolidate_services
+
+    day_directory = os.path.join(work_directory, "raw", "2025", "01", "16")
+    os.makedirs(day_directory, exist_ok=True)
+    for index in range(num_files):
+        board = make_board(num_services, 10, seed=index % 3)
+        file_name = f"{index // 60:02d}{index % 60:02d}00-NCL.json"
+        with open(os.path.join(day_directory, file_name), "w") as raw_file:
+            json.dump(railtimes_rows(board), raw_file)
+
+    def consolidate():
+        with contextlib.redirect_stdout(io.StringIO()):
+            consolidate_services(day_directory)
+
+    label = f"files{num_files}_s{num_services}"
+    results = {label: measure(consolidate)}
+    compact_day(day_directory)
+    results[f"{label}_packed"] = measure(consolidate)
+    return results
+
+
+class StubRailQuerier:
+    """Stands in for RailQuerier, answering every request with a fixture board."""
+
+    def __init__(self, *args, **kwargs):
+        self.rate_limiter = None
+        self._boards = {}
+
+    def _board(self, crs: str, num_rows: int, arrivals: bool):
+        key = (crs, num_rows, arrivals)
+        if key not in self._boards:
+            self._boards[key] = make_board(num_rows, 10, crs=crs, arrivals=arrivals)
+        return self._boards[key]
+
+    def get_departure_board(self, crs, num_rows=10, time_window=None, priority=1):
+        return self._board(crs, num_rows, False)
+
+    def get_arrival_board(self, crs, num_rows=10, time_window=None, priority=1):
+        return self._board(crs, num_rows, True)
+
+    def get_arr_dep_board(self, crs, num_rows=10, time_window=None, priority=1):
+        return self._board(crs, num_rows, True)
+
+
+def bench_full_loop(work_directory: str, num_stations: int) -> Dict[str, Stats]:
+    from national_rail_pipeline.threads import departures_querier_thread
+
+    crs_codes = [f"S{index:02d}" for index in range(num_stations)]
+    original_rail_querier = departures_querier_thread.RailQuerier
+    departures_querier_thread.RailQuerier = StubRailQuerier
+    try:
+        results = {}
+        for board_mode in ["dep", "arr+dep"]:
+            querier = departures_querier_thread.DeparturesQuerier(
+                crs_codes=crs_codes,
+                out_directory=os.path.join(work_directory, f"loop_{board_mode}"),
+                log_file_access_lock=threading.Lock(),
+                interval_timeout=60,
+                default_board_mode=board_mode,
+                num_rows=50,
+            )
+            querier.setup()
+            results[f"stations{num_stations}_{board_mode}"] = measure(querier.loop)
+            querier.teardown()
+    finally:
+        departures_querier_thread.RailQuerier = original_rail_querier
+    return results
+
+
+def run(num_stations: int) -> Dict:
+    boards = {**synthetic_boards(), **recorded_boards()}
+    work_directory = tempfile.mkdtemp(prefix="nr_bench_")
+    stages = {
+        "flatten": lambda: bench_flatten(boards),
+        "validate": lambda: bench_validate(boards),
+        "calling_point_store": lambda: bench_calling_point_store(
+            boards, work_directory
+        ),
+        "append_csv": lambda: bench_append(boards, work_directory),
+        "archive": lambda: bench_archive(work_directory, num_stations),
+        "processfiles": lambda: bench_processfiles(work_directory, 120, 20),
+        "full_loop": lambda: bench_full_loop(work_directory, num_stations),
+    }
+    results = {}
+    try:
+        for stage, bench in stages.items():
+            print(f"Running {stage}...", file=sys.stderr)
+            try:
+                results[stage] = bench()
+            except ImportError as e:
+                # Stages needing zeep or marshmallow cannot run without them
+                print(f"Skipping {stage}: {e}", file=sys.stderr)
+                results[stage] = {"skipped": str(e)}
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> int:
+    """Prints the change in median time of every benchmark present in both runs.
+
+    Returns:
+        int: The number of benchmarks slower than the baseline by more than
+            the threshold
+    """
+    regressions = 0
+    for stage, labels in current["results"].items():
+        baseline_labels = baseline["results"].get(stage, {})
+        for label, stats in labels.items():
+            baseline_stats = baseline_labels.get(label)
+            if not isinstance(stats, dict) or not isinstance(baseline_stats, dict):
+                continue
+            ratio = stats["median_ms"] / baseline_stats["median_ms"]
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(
+                f"{stage:20} {label:28} {baseline_stats['median_ms']:10.3f}ms -> "
+                f"{stats['median_ms']:10.3f}ms ({ratio - 1:+.1%}){flag}"
+            )
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Path to write the JSON results to")
+    parser.add_argument("--compare", help="Path of a baseline results file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Fractional slowdown against the baseline reported as a regression",
+    )
+    parser.add_argument("--stations", type=int, default=20)
+    args = parser.parse_args()
+
+    run_results = run(args.stations)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(run_results, output_file, indent=2)
+    else:
+        print(json.dumps(run_results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline_results = json.load(baseline_file)
+        if compare(run_results, baseline_results, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,303 @@
+"""Runs the querier for simulated days to check its memory stays bounded.
+
+DeparturesQuerier.loop is driven back to back against a stub API which returns
+a fresh board per station per cycle, stamped with a simulated clock advancing by
+the polling interval.  Services are replaced as the day goes on, so every cache
+and the network state see a realistic churn of new keys.  The FileArchiver runs
+once per simulated hour.
+
+A tracemalloc snapshot and the resident set size are taken every simulated hour.
+After the warm up hours, memory is expected to plateau: the run fails if the
+traced total, the resident set size or any single allocation site grew by more
+than the tolerance over the second half of the run.
+
+Run with:
+    python -m benchmarks.soak --days 2 --output soak.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.fixtures import make_board
+from benchmarks.run import _git_commit
+
+SOAK_START = datetime.datetime(2025, 1, 16, 0, 0, tzinfo=datetime.timezone.utc)
+
+# Cycles a service stays on the boards before it is replaced by new ones
+SERVICE_LIFETIME_CYCLES = 30
+
+_TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+
+
+class SoakRailQuerier:
+    """Stands in for RailQuerier, building a new board for every request."""
+
+    def __init__(self, *args, **kwargs):
+        self.rate_limiter = None
+        self.num_calling_points = 10
+        self.cycle = 0
+
+    def _board(self, crs: str, num_rows: int, arrivals: bool):
+        board = make_board(
+            num_rows,
+            self.num_calling_points,
+            crs=crs,
+            seed=self.cycle // SERVICE_LIFETIME_CYCLES,
+            arrivals=arrivals,
+        )
+        board["generatedAt"] = self.now
+        return board
+
+    @property
+    def now(self) -> datetime.datetime:
+        return self.start + datetime.timedelta(seconds=self.cycle * self.interval)
+
+    def get_departure_board(self, crs, num_rows=10, time_window=None, priority=1):
+        return self._board(crs, num_rows, False)
+
+    def get_arrival_board(self, crs, num_rows=10, time_window=None, priority=1):
+        return self._board(crs, num_rows, True)
+
+    def get_arr_dep_board(self, crs, num_rows=10, time_window=None, priority=1):
+        return self._board(crs, num_rows, True)
+
+
+def resident_set_bytes() -> int:
+    """The current resident set size, or the peak where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def take_sample(hour: int) -> Tuple[Dict, tracemalloc.Snapshot]:
+    snapshot = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+    traced_bytes, _ = tracemalloc.get_traced_memory()
+    return (
+        {"hour": hour, "traced_bytes": traced_bytes, "rss_bytes": resident_set_bytes()},
+        snapshot,
+    )
+
+
+def growing_sites(
+    midpoint: tracemalloc.Snapshot,
+    end: tracemalloc.Snapshot,
+    tolerance_bytes: int,
+    top: int,
+) -> List[Dict]:
+    """Allocation sites holding more memory at the end than at the midpoint."""
+    return [
+        {
+            "site": str(statistic.traceback),
+            "size_bytes": statistic.size,
+            "growth_bytes": statistic.size_diff,
+            "count_growth": statistic.count_diff,
+        }
+        for statistic in end.compare_to(midpoint, "lineno")[:top]
+        if statistic.size_diff > tolerance_bytes
+    ]
+
+
+def soak(
+    days: float,
+    interval: float,
+    num_stations: int,
+    num_rows: int,
+    board_mode: str,
+    warm_up_hours: int,
+    network_state_mb: Optional[float],
+    tolerance_bytes: int,
+    rss_tolerance_bytes: int,
+    top: int,
+) -> Dict:
+    from national_rail_pipeline.network_state import NetworkStateStore
+    from national_rail_pipeline.segment_writer import SegmentWriter
+    from national_rail_pipeline.threads import departures_querier_thread
+    from national_rail_pipeline.threads.file_archiver_thread import FileArchiver
+
+    work_directory = tempfile.mkdtemp(prefix="nr_soak_")
+    crs_codes = [f"S{index:02d}" for index in range(num_stations)]
+    cycles_per_hour = max(1, round(3600 / interval))
+    total_hours = max(2, round(24 * days))
+    warm_up_hours = min(warm_up_hours, total_hours - 1)
+    midpoint_hour = (warm_up_hours + total_hours) // 2
+
+    original_rail_querier = departures_querier_thread.RailQuerier
+    departures_querier_thread.RailQuerier = SoakRailQuerier
+    log_file_access_lock = threading.Lock()
+    segment_writer = SegmentWriter(work_directory)
+    querier = departures_querier_thread.DeparturesQuerier(
+        crs_codes=crs_codes,
+        out_directory=work_directory,
+        log_file_access_lock=log_file_access_lock,
+        interval_timeout=interval,
+        default_board_mode=board_mode,
+        num_rows=num_rows,
+        segment_writer=segment_writer,
+        network_state=(
+            NetworkStateStore(int(network_state_mb * 1024 * 1024))
+            if network_state_mb is not None
+            else None
+        ),
+    )
+    archiver = FileArchiver(
+        out_directory=work_directory,
+        log_file_access_lock=log_file_access_lock,
+        archive_access_lock=threading.Lock(),
+        interval_timeout=3600,
+        segment_writer=segment_writer,
+    )
+    stub = querier._rail_querier
+    stub.start = SOAK_START
+    stub.interval = interval
+
+    samples = []
+    snapshots = {}
+    start = time.perf_counter()
+    tracemalloc.start()
+    try:
+        querier.setup()
+        archiver.setup()
+        for hour in range(1, total_hours + 1):
+            for _ in range(cycles_per_hour):
+                querier.loop()
+                stub.cycle += 1
+            archiver.loop()
+            sample, snapshot = take_sample(hour)
+            samples.append(sample)
+            # Only the snapshots compared at the end are kept
+            if hour in (midpoint_hour, total_hours):
+                snapshots[hour] = snapshot
+            print(
+                f"Hour {hour}/{total_hours}: traced "
+                f"{sample['traced_bytes'] / 1024 / 1024:.1f}MB, resident "
+                f"{sample['rss_bytes'] / 1024 / 1024:.1f}MB",
+                file=sys.stderr,
+            )
+    finally:
+        querier.teardown()
+        tracemalloc.stop()
+        departures_querier_thread.RailQuerier = original_rail_querier
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    midpoint, end = samples[midpoint_hour - 1], samples[-1]
+    traced_growth = end["traced_bytes"] - midpoint["traced_bytes"]
+    rss_growth = end["rss_bytes"] - midpoint["rss_bytes"]
+    sites = growing_sites(
+        snapshots[midpoint_hour], snapshots[total_hours], tolerance_bytes, top
+    )
+    failures = []
+    if traced_growth > tolerance_bytes:
+        failures.append(f"traced memory grew by {traced_growth} bytes")
+    if rss_growth > rss_tolerance_bytes:
+        failures.append(f"resident set grew by {rss_growth} bytes")
+    failures.extend(
+        f"{site['site']} grew by {site['growth_bytes']} bytes" for site in sites
+    )
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parameters": {
+            "days": days,
+            "interval": interval,
+            "stations": num_stations,
+            "rows": num_rows,
+            "board_mode": board_mode,
+            "warm_up_hours": warm_up_hours,
+            "network_state_mb": network_state_mb,
+        },
+        "wall_seconds": round(time.perf_counter() - start, 1),
+        "samples": samples,
+        "growth": {
+            "from_hour": midpoint_hour,
+            "traced_bytes": traced_growth,
+            "rss_bytes": rss_growth,
+            "sites": sites,
+        },
+        "failures": failures,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Path to write the JSON results to")
+    parser.add_argument("--days", type=float, default=1, help="Simulated days to run")
+    parser.add_argument(
+        "--interval", type=float, default=60, help="Simulated seconds between polls"
+    )
+    parser.add_argument("--stations", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument(
+        "--board-mode", default="dep", choices=["dep", "arr", "arr+dep"]
+    )
+    parser.add_argument(
+        "--warm-up-hours",
+        type=int,
+        default=3,
+        help="Simulated hours allowed for caches to fill before growth is measured",
+    )
+    parser.add_argument(
+        "--network-state-mb",
+        type=float,
+        default=8,
+        help="Memory budget of the network state, or 0 to leave it out",
+    )
+    parser.add_argument(
+        "--tolerance-kb",
+        type=float,
+        default=512,
+        help="Growth of traced memory or of a single allocation site allowed "
+        "over the second half of the run",
+    )
+    parser.add_argument(
+        "--rss-tolerance-mb",
+        type=float,
+        default=8,
+        help="Growth of the resident set allowed over the second half of the run",
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of allocation sites compared"
+    )
+    args = parser.parse_args()
+
+    soak_results = soak(
+        args.days,
+        args.interval,
+        args.stations,
+        args.rows,
+        args.board_mode,
+        args.warm_up_hours,
+        args.network_state_mb or None,
+        int(args.tolerance_kb * 1024),
+        int(args.rss_tolerance_mb * 1024 * 1024),
+        args.top,
+    )
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(soak_results, output_file, indent=2)
+    else:
+        print(json.dumps(soak_results, indent=2))
+
+    for failure in soak_results["failures"]:
+        print(f"Unbounded growth: {failure}", file=sys.stderr)
+    if soak_results["failures"]:
+        sys.exit(1)
@@ -0,0 +1,130 @@
+"""Stress test of the segment writer and FileArchiver running concurrently.
+
+A writer thread appends numbered rows for a set of stations as fast as it can
+while an archiver thread requests rollovers and archives sealed segments every
+few milliseconds.  Afterwards every archived file is read back to check each row
+was archived exactly once, and the append latencies seen by the writer are
+reported to show it is never held up by archival.
+
+Run with:
+    python -m benchmarks.stress_segments --seconds 10 --stations 50
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from national_rail_pipeline.segment_writer import SegmentWriter
+from national_rail_pipeline.threads.file_archiver_thread import FileArchiver
+
+
+def _percentile(sorted_values, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def run(
+    seconds: float, num_stations: int, rows_per_append: int, rollover_seconds: float
+):
+    out_directory = tempfile.mkdtemp(prefix="nr_segments_")
+    segment_writer = SegmentWriter(out_directory)
+    archiver = FileArchiver(
+        out_directory=out_directory,
+        log_file_access_lock=threading.Lock(),
+        archive_access_lock=threading.Lock(),
+        interval_timeout=rollover_seconds,
+        segment_writer=segment_writer,
+    )
+    archiver.setup()
+    archiver.is_first_run = False
+    segment_writer.open()
+
+    stems = [f"S{index:02d}" for index in range(num_stations)]
+    stop_event = threading.Event()
+    latencies = []
+    rows_written = [0]
+
+    def write():
+        sequence = 0
+        while not stop_event.is_set():
+            for stem in stems:
+                rows = []
+                for _ in range(rows_per_append):
+                    rows.append(
+                        {
+                            "dt_timestamp": "2025-01-16 06:00:00+00:00",
+                            "station": stem,
+                            "sequence": sequence,
+                        }
+                    )
+                    sequence += 1
+                start = time.perf_counter()
+                segment_writer.append(stem, rows)
+                latencies.append(time.perf_counter() - start)
+            segment_writer.seal_stale_segments()
+        rows_written[0] = sequence
+
+    def archive():
+        while not stop_event.is_set():
+            archiver.loop()
+            time.sleep(rollover_seconds)
+
+    writer_thread = threading.Thread(target=write, name="Writer")
+    archiver_thread = threading.Thread(target=archive, name="Archiver")
+    writer_thread.start()
+    archiver_thread.start()
+    time.sleep(seconds)
+    stop_event.set()
+    writer_thread.join()
+    archiver_thread.join()
+
+    # Drain whatever is left, waiting out the one seal per second limit
+    time.sleep(1.1)
+    segment_writer.request_rollover()
+    segment_writer.seal_stale_segments()
+    segment_writer.close()
+    archiver.loop()
+
+    counts = Counter()
+    for file_name in os.listdir(archiver.archive_directory):
+        if not file_name.endswith(".csv"):
+            continue
+        with open(os.path.join(archiver.archive_directory, file_name), newline="") as f:
+            for row in csv.DictReader(f):
+                counts[int(row["sequence"])] += 1
+    left_behind = sorted(os.listdir(out_directory))
+    archived_files = len(archiver.manifest.entries())
+    shutil.rmtree(out_directory, ignore_errors=True)
+
+    latencies.sort()
+    return {
+        "rows_written": rows_written[0],
+        "rows_archived": sum(counts.values()),
+        "lost_rows": rows_written[0] - len(counts),
+        "duplicated_rows": sum(1 for count in counts.values() if count > 1),
+        "archived_files": archived_files,
+        "left_behind": [name for name in left_behind if name != "archive"],
+        "append_p50_ms": 1000 * _percentile(latencies, 0.5),
+        "append_p99_ms": 1000 * _percentile(latencies, 0.99),
+        "append_max_ms": 1000 * latencies[-1],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--stations", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=10, help="Rows per append")
+    parser.add_argument("--rollover-seconds", type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = run(args.seconds, args.stations, args.rows, args.rollover_seconds)
+    print(json.dumps(results, indent=2))
+    if results["lost_rows"] or results["duplicated_rows"] or results["left_behind"]:
+        sys.exit(1)
@@ -1,7 +1,12 @@
+import argparse
+import csv
+import io
 import os
-from typing import Dict
-
-from national_rail_pipeline.api import RailQuerier
+import shutil
+import sys
+import time
+from functools import lru_cache
+from typing import Dict, IO, List, Optional, Tuple
 
 
 def format_departure_board(departure_board) -> Dict:
@@ -64,14 +69,10 @@ def print_departure_board(formatted_departure_board: Dict) -> None:
     boarder = 39 * "-" + "\n"
     departure_board_header = format_departure_board_header()
     train_services = formatted_departure_board["trainServices"]
-    formatted_train_services = [
-        format_train_service_for_departure_board(x) for x in train_services
-    ]
-    departure_board = white_space + boarder + departure_board_header
-    for formatted_train_service in formatted_train_services:
-        departure_board += formatted_train_service
-    departure_board += boarder + white_space
-    print(departure_board)
+    parts = [white_space, boarder, departure_board_header]
+    parts.extend(format_train_service_for_departure_board(x) for x in train_services)
+    parts.extend([boarder, white_space])
+    print("".join(parts))
 
 
 def format_departure_board_header() -> str:
@@ -125,12 +126,265 @@ def format_field(field: str, max_field_length: int) -> str:
         return field[: max_field_length - 1] + "."
 
 
+@lru_cache(maxsize=4096)
+def _cached_format_field(field: Optional[str], max_field_length: int) -> str:
+    # Destinations, platforms and times repeat across boards and refreshes
+    return format_field(field, max_field_length)
+
+
+class BoardLayout:
+    # Column key and width, matching format_departure_board_header
+    COLUMNS = (("destination", 18), ("platform", 5), ("sched_dep", 6), ("curr_dep", 7))
+
+    def __init__(self, rows_per_board: int):
+        """The fixed layout of a board tile in the live view.  Every string which
+        does not depend on the services is built once here.
+
+        Args:
+            rows_per_board (int): Services shown per board
+        """
+        self.rows_per_board = rows_per_board
+        self.width = sum(width for _, width in self.COLUMNS) + len(self.COLUMNS) - 1
+        self.header_lines = format_departure_board_header().splitlines()
+        self.blank_line = " " * self.width
+        # Title line, header lines, service rows and a spacer line
+        self.height = 1 + len(self.header_lines) + rows_per_board + 1
+
+    def title_line(self, title: str) -> str:
+        return _cached_format_field(title, self.width)
+
+    def service_line(self, train_service: Dict) -> str:
+        return " ".join(
+            _cached_format_field(train_service.get(key), width)
+            for key, width in self.COLUMNS
+        )
+
+    def board_lines(self, title: str, train_services: List[Dict]) -> List[str]:
+        lines = [self.title_line(title), *self.header_lines]
+        for index in range(self.rows_per_board):
+            if index < len(train_services):
+                lines.append(self.service_line(train_services[index]))
+            else:
+                lines.append(self.blank_line)
+        lines.append(self.blank_line)
+        return lines
+
+
+class LiveBoardRenderer:
+    def __init__(
+        self,
+        stations: List[str],
+        rows_per_board: int = 10,
+        out: IO[str] = sys.stdout,
+        terminal_columns: Optional[int] = None,
+    ):
+        """Draws a grid of departure boards and redraws only the lines which
+        changed since the last frame, using ANSI cursor addressing.
+
+        Args:
+            stations (List[str]): CRS codes, one board each in this order
+            rows_per_board (int, optional): Services shown per board
+            out (IO[str], optional): Terminal to draw on
+            terminal_columns (int, optional): Width of the terminal. If set to
+                None, it is read from the terminal.
+        """
+        self.stations = stations
+        self.layout = BoardLayout(rows_per_board)
+        self.out = out
+        columns = terminal_columns or shutil.get_terminal_size().columns
+        self.tiles_per_row = max(1, (columns + 2) // (self.layout.width + 2))
+        self._origins = {
+            crs: self.__tile_origin(index) for index, crs in enumerate(stations)
+        }
+        self._screen: Dict[Tuple[str, int], str] = {}
+        self.lines_drawn = 0
+
+    def render(self, boards: Dict[str, Tuple[str, List[Dict]]]) -> int:
+        """Draws the boards, writing only the lines which differ from the screen.
+
+        Args:
+            boards (Dict[str, Tuple[str, List[Dict]]]): Title and services per CRS
+                code. Stations without a board yet show a blank board.
+
+        Returns:
+            int: The number of lines redrawn
+        """
+        commands = []
+        if not self._screen:
+            # Clear the screen and hide the cursor on the first frame
+            commands.append("\x1b[2J\x1b[?25l")
+        redrawn = 0
+        for crs in self.stations:
+            title, train_services = boards.get(crs, (crs, []))
+            top, left = self._origins[crs]
+            lines = self.layout.board_lines(title, train_services)
+            for line_number, line in enumerate(lines):
+                if self._screen.get((crs, line_number)) == line:
+                    continue
+                self._screen[(crs, line_number)] = line
+                commands.append(f"\x1b[{top + line_number};{left}H{line}")
+                redrawn += 1
+        if commands:
+            # Park the cursor below the grid so the terminal does not scroll
+            commands.append(f"\x1b[{self.__grid_height() + 1};1H")
+            self.out.write("".join(commands))
+            self.out.flush()
+        self.lines_drawn += redrawn
+        return redrawn
+
+    def close(self) -> None:
+        self.out.write("\x1b[?25h")
+        self.out.flush()
+
+    def __tile_origin(self, index: int) -> Tuple[int, int]:
+        row, column = divmod(index, self.tiles_per_row)
+        return 1 + row * self.layout.height, 1 + column * (self.layout.width + 2)
+
+    def __grid_height(self) -> int:
+        tile_rows = -(-len(self.stations) // self.tiles_per_row)
+        return tile_rows * self.layout.height
+
+
+class LiveSegmentReader:
+    def __init__(self, file_path: str):
+        """Follows the active CSV segment a DeparturesQuerier writes for a station
+        and keeps the latest board in it.  Only bytes appended since the last call
+        are read, and a segment rolled over by the archiver is followed to the
+        new file.
+
+        Args:
+            file_path (str): Path of the station's active segment, such as
+                logs/NCL.csv
+        """
+        self.file_path = file_path
+        self._file = None
+        self._inode = None
+        self._fieldnames = None
+        self._partial_line = ""
+        self._latest_timestamp = None
+        self.title = None
+        self.train_services: List[Dict] = []
+
+    def poll(self) -> bool:
+        """Reads whatever was appended since the last poll.
+
+        Returns:
+            bool: Whether a newer board was read
+        """
+        changed = False
+        if self._file is not None:
+            changed = self.__read_new_lines()
+        try:
+            inode = os.stat(self.file_path).st_ino
+        except FileNotFoundError:
+            return changed
+        if inode != self._inode:
+            # First poll, or the segment was sealed and a new one started
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.file_path, newline="")
+            self._inode = inode
+            self._fieldnames = None
+            self._partial_line = ""
+            changed = self.__read_new_lines() or changed
+        return changed
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __read_new_lines(self) -> bool:
+        data = self._file.read()
+        if not data:
+            return False
+        data = self._partial_line + data
+        complete, _, self._partial_line = data.rpartition("\n")
+        if not complete:
+            self._partial_line = data
+            return False
+        reader = csv.reader(io.StringIO(complete + "\n"))
+        changed = False
+        for values in reader:
+            if self._fieldnames is None:
+                self._fieldnames = values
+                continue
+            # Empty cells were None on the board, which format_field shows as ?
+            row = {
+                key: value if value != "" else None
+                for key, value in zip(self._fieldnames, values)
+            }
+            timestamp = row.get("dt_timestamp")
+            if timestamp != self._latest_timestamp:
+                # Rows of a board share its generatedAt, a new one starts a board
+                self._latest_timestamp = timestamp
+                self.train_services = []
+                self.title = row.get("service_from")
+            self.train_services.append(row)
+            changed = True
+        return changed
+
+
+def run_live_boards(
+    stations: List[str],
+    log_directory: str,
+    refresh_seconds: float = 2,
+    rows_per_board: int = 10,
+) -> None:
+    """Shows a live grid of boards built from the segments the pipeline is
+    writing, so no API calls are made however many boards are shown.
+
+    Args:
+        stations (List[str]): CRS codes to show
+        log_directory (str): The pipeline's LOG_FILE_DIRECTORY
+        refresh_seconds (float, optional): Interval between checks for new boards
+        rows_per_board (int, optional): Services shown per board
+    """
+    readers = {
+        crs: LiveSegmentReader(os.path.join(log_directory, f"{crs}.csv"))
+        for crs in stations
+    }
+    renderer = LiveBoardRenderer(stations, rows_per_board)
+    boards = {}
+    try:
+        while True:
+            for crs, reader in readers.items():
+                if reader.poll():
+                    boards[crs] = (reader.title or crs, reader.train_services)
+            renderer.render(boards)
+            time.sleep(refresh_seconds)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        renderer.close()
+        for reader in readers.values():
+            reader.close()
+
+
 if __name__ == "__main__":
     """A main body to execute the logic to fetch departure board information from
     the National Rail Api and then output a pretty departure board to standard out.
+    With --live, boards for many stations are instead followed from the files the
+    pipeline writes.
     """
-    station = os.getenv("STATION", "LHS")
-    rail_querier = RailQuerier()
-    departure_board = rail_querier.get_departure_board(station)
-    formatted_depature_board = format_departure_board(departure_board)
-    print_departure_board(formatted_depature_board)
+    parser = argparse.ArgumentParser(description="Show departure boards")
+    parser.add_argument(
+        "--live", nargs="+", metavar="CRS", help="Stations to show live boards for"
+    )
+    parser.add_argument(
+        "--log-dir", default="logs", help="LOG_FILE_DIRECTORY of the pipeline"
+    )
+    parser.add_argument("--refresh", type=float, default=2, help="Seconds")
+    parser.add_argument("--rows", type=int, default=10, help="Services per board")
+    args = parser.parse_args()
+
+    if args.live:
+        run_live_boards(args.live, args.log_dir, args.refresh, args.rows)
+    else:
+        from national_rail_pipeline.api import RailQuerier
+
+        station = os.getenv("STATION", "LHS")
+        rail_querier = RailQuerier()
+        departure_board = rail_querier.get_departure_board(station)
+        formatted_depature_board = format_departure_board(departure_board)
+        print_departure_board(formatted_depature_board)
@@ -1,11 +1,10 @@
+import os
 import threading
-import time
 import logging
 
 
-from national_rail_pipeline.threads.departures_querier_thread import DeparturesQuerier
-from national_rail_pipeline.threads.file_archiver_thread import FileArchiver
 from national_rail_pipeline.utils.config import Config
+from national_rail_pipeline.utils.exceptions import InvalidConfigError
 from national_rail_pipeline.utils.util import configure_logging
 
 
@@ -14,8 +13,30 @@ def run() -> None:
         application_name="National Rail Pipeline",
         description="An application concerned with National Rail API Ingestion",
     )
+
+    # The threads pull in zeep and marshmallow, so they are only imported once the
+    # arguments and config are known to be valid. --help and config errors return
+    # without paying for them.
+    from national_rail_pipeline.network_state import NetworkStateStore
+    from national_rail_pipeline.segment_writer import SegmentWriter
+    from national_rail_pipeline.threads.config_watcher_thread import ConfigWatcher
+    from national_rail_pipeline.threads.departures_querier_thread import (
+        DeparturesQuerier,
+    )
+    from national_rail_pipeline.threads.file_archiver_thread import FileArchiver
+    from national_rail_pipeline.threads.shard_coordinator_thread import (
+        ShardCoordinator,
+    )
+    from national_rail_pipeline.utils.instrumentation import LoopProfiler, StageTimer
+    from national_rail_pipeline.utils.shutdown import ShutdownSupervisor
+
     logger = logging.getLogger("national_rail_pipeline")
-    configure_logging(logger, debug=config.run_config["DEBUG"])
+    configure_logging(
+        logger,
+        debug=config.run_config["DEBUG"],
+        json_lines=config.run_config.get("LOG_JSON", False),
+        sample_every=config.run_config.get("LOG_SAMPLE_EVERY", 1),
+    )
     config.log_config()
 
     # Set up various locks for file accesss
@@ -24,47 +45,171 @@ def run() -> None:
 
     threads = []
 
+    # Stage timings are emitted every STAGE_TIMING_EMIT_SECONDS when it is set
+    stage_timing_emit_seconds = config.run_config.get("STAGE_TIMING_EMIT_SECONDS")
+    stage_timer = StageTimer(
+        enabled=stage_timing_emit_seconds is not None,
+        emit_interval_seconds=stage_timing_emit_seconds or 60,
+    )
+
+    # In sharded mode each worker polls its share of the stations and writes to
+    # its own partition of the log directory. The worker ID must stay the same
+    # across restarts, as only the worker writing a partition seals and archives
+    # the segments left in it.
+    is_sharded = config.run_config.get("SHARD_COORDINATION_DB") is not None
+    out_directory = config.run_config["LOG_FILE_DIRECTORY"]
+    if is_sharded:
+        worker_id = config.run_config.get("SHARD_WORKER_ID")
+        if not worker_id:
+            raise InvalidConfigError(
+                "SHARD_WORKER_ID or --worker-id must be set to a stable identifier "
+                "when SHARD_COORDINATION_DB is set"
+            )
+        out_directory = os.path.join(out_directory, f"shard-{worker_id}")
+
+    # The querier appends to rolling segments and the archiver only moves sealed
+    # ones, so neither waits on the other. SEGMENT_DURABILITY decides when the
+    # appended rows are fsynced.
+    segment_writer = SegmentWriter(
+        out_directory,
+        durability=config.run_config.get("SEGMENT_DURABILITY", "none"),
+        group_commit_ms=config.run_config.get("SEGMENT_GROUP_COMMIT_MS", 200),
+    )
+
+    # Boards are merged into a view of every service across the polled stations
+    # when NETWORK_STATE_MEMORY_MB is set
+    network_state = None
+    if config.run_config.get("NETWORK_STATE_MEMORY_MB") is not None:
+        network_state = NetworkStateStore(
+            memory_budget_bytes=int(
+                config.run_config["NETWORK_STATE_MEMORY_MB"] * 1024 * 1024
+            )
+        )
+
     departures_querier_thread = DeparturesQuerier(
-        crs_codes=config.run_config["STATIONS_TO_QUERY"],
-        out_directory=config.run_config["LOG_FILE_DIRECTORY"],
+        crs_codes=[] if is_sharded else config.run_config["STATIONS_TO_QUERY"],
+        out_directory=out_directory,
         log_file_access_lock=live_log_file_access_lock,
         interval_timeout=config.run_config["QUERY_FREQUENCY_SECONDS"],
         required_precision=config.run_config["QUERY_FREQUENCY_PRECISION_SECONDS"],
+        default_board_mode=config.run_config.get("BOARD_MODE", "dep"),
+        station_board_modes=config.run_config.get("STATION_BOARD_MODES"),
+        num_rows=config.run_config.get("BOARD_NUM_ROWS", 10),
+        time_window=config.run_config.get("BOARD_TIME_WINDOW_MINUTES"),
+        deduplicate_calling_points=config.run_config.get(
+            "DEDUPLICATE_CALLING_POINTS", False
+        ),
+        station_priorities=config.run_config.get("STATION_PRIORITIES"),
+        base_backoff_seconds=config.run_config.get("STATION_BASE_BACKOFF_SECONDS"),
+        max_backoff_seconds=config.run_config.get("STATION_MAX_BACKOFF_SECONDS", 3600),
+        stage_timer=stage_timer,
+        segment_writer=segment_writer,
+        network_state=network_state,
+        fetch_concurrency=config.run_config.get("FETCH_CONCURRENCY", 1),
+        parse_concurrency=config.run_config.get("PARSE_CONCURRENCY", 1),
+        sink_concurrency=config.run_config.get("SINK_CONCURRENCY", 1),
+        stage_queue_size=config.run_config.get("STAGE_QUEUE_SIZE", 64),
+        service_details_ttl_seconds=config.run_config.get(
+            "SERVICE_DETAILS_TTL_SECONDS"
+        ),
+        service_details_max_entries=config.run_config.get(
+            "SERVICE_DETAILS_MAX_ENTRIES", 5000
+        ),
+        enrich_concurrency=config.run_config.get("ENRICH_CONCURRENCY", 1),
+        # Boards are decoded in this many worker processes when set, so
+        # decoding is not held up by the GIL
+        decode_processes=config.run_config.get("DECODE_PROCESSES"),
     )
 
     file_archiver_thread = FileArchiver(
-        out_directory=config.run_config["LOG_FILE_DIRECTORY"],
+        out_directory=out_directory,
         log_file_access_lock=live_log_file_access_lock,
         archive_access_lock=archive_access_lock,
         interval_timeout=config.run_config["LOG_FILE_ROLLOVER_PERIOD_SECONDS"],
         required_precision=config.run_config[
             "LOG_FILE_ROLLOVER_PERIOD_PRECISION_SECONDS"
         ],
+        stage_timer=stage_timer,
+        segment_writer=segment_writer,
     )
 
     threads.extend([departures_querier_thread, file_archiver_thread])
 
-    logger.debug("Starting threads")
-    for thread in threads:
-        thread.start()
+    if config.command_line_args.profile is not None:
+        for thread in [departures_querier_thread, file_archiver_thread]:
+            thread.profiler = LoopProfiler(
+                mode=config.command_line_args.profile,
+                cycles=config.command_line_args.profile_cycles,
+                out_directory=config.command_line_args.profile_dir,
+                name=thread.name,
+            )
 
-    # Main Loop
-    logger.debug("Starting main loop")
-    while True:
-        try:
-            time.sleep(1)
-            # logger.info("Sleeping!")
-        except KeyboardInterrupt:
-            time.sleep(1)
-            logger.error("Received KILL-Signal")
-            break
+    if is_sharded:
+        shard_coordinator_thread = ShardCoordinator(
+            worker_id=worker_id,
+            crs_codes=config.run_config["STATIONS_TO_QUERY"],
+            departures_querier=departures_querier_thread,
+            coordination_db_path=config.run_config["SHARD_COORDINATION_DB"],
+            interval_timeout=config.run_config.get("SHARD_HEARTBEAT_SECONDS", 30),
+            lease_seconds=config.run_config.get("SHARD_LEASE_SECONDS"),
+        )
+        # Claim a share before the querier's first cycle
+        shard_coordinator_thread.rebalance()
+        threads.append(shard_coordinator_thread)
 
-    for thread in threads:
-        thread.stop()
+    # Apply edits to the yaml config to the running threads without a restart
+    config_watcher_thread = ConfigWatcher(
+        config=config,
+        interval_timeout=config.run_config.get("CONFIG_RELOAD_CHECK_SECONDS", 5),
+    )
+    config_watcher_thread.on_change(
+        "STATIONS_TO_QUERY",
+        shard_coordinator_thread.update_crs_codes
+        if is_sharded
+        else departures_querier_thread.update_crs_codes,
+    )
+    for key in ["QUERY_FREQUENCY_SECONDS", "QUERY_FREQUENCY_PRECISION_SECONDS"]:
+        config_watcher_thread.on_change(
+            key,
+            lambda _: departures_querier_thread.set_interval(
+                config.run_config["QUERY_FREQUENCY_SECONDS"],
+                config.run_config.get("QUERY_FREQUENCY_PRECISION_SECONDS"),
+            ),
+        )
+    for key in [
+        "LOG_FILE_ROLLOVER_PERIOD_SECONDS",
+        "LOG_FILE_ROLLOVER_PERIOD_PRECISION_SECONDS",
+    ]:
+        config_watcher_thread.on_change(
+            key,
+            lambda _: file_archiver_thread.set_interval(
+                config.run_config["LOG_FILE_ROLLOVER_PERIOD_SECONDS"],
+                config.run_config.get("LOG_FILE_ROLLOVER_PERIOD_PRECISION_SECONDS"),
+            ),
+        )
+    threads.append(config_watcher_thread)
 
+    # On SIGTERM or SIGINT the threads are stopped in this order: nothing changes
+    # the stations any more, the querier finishes its in-flight boards and closes
+    # its segments, then the archiver seals and archives them
+    supervisor = ShutdownSupervisor(
+        [
+            config_watcher_thread,
+            *([shard_coordinator_thread] if is_sharded else []),
+            departures_querier_thread,
+            file_archiver_thread,
+        ],
+        deadline_seconds=config.run_config.get("SHUTDOWN_DEADLINE_SECONDS", 30),
+        logger=logger,
+    )
+    supervisor.install_signal_handlers()
+
+    logger.debug("Starting threads")
     for thread in threads:
-        thread.join(6)
-        logger.debug("Thread " + str(thread) + " stopped.")
+        thread.start()
+
+    supervisor.wait()
+    supervisor.shutdown()
 
 
 if __name__ == "__main__":
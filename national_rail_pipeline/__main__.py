@@ -0,0 +1,164 @@
+"""Command line tools for working with the data collected by the pipeline.
+
+Run with:
+    python -m national_rail_pipeline query logs/archive --station NCL \
+        --start 2025-01-13T00:00 --end 2025-01-20T00:00 --operator GR
+    python -m national_rail_pipeline rebuild-manifest logs/archive
+    python -m national_rail_pipeline compact raw
+    python -m national_rail_pipeline convert logs/archive
+"""
+import datetime
+import os
+import sys
+from argparse import ArgumentParser
+from typing import List, Optional
+
+from national_rail_pipeline.archive_manifest import (
+    ArchiveManifest,
+    MANIFEST_FILE_NAME,
+)
+from national_rail_pipeline.archive_query import (
+    RowFilter,
+    convert_to_binary,
+    discover_files,
+    iter_rows,
+    write_rows,
+)
+from national_rail_pipeline.binary_archive import BINARY_ARCHIVE_EXTENSION
+from national_rail_pipeline.calling_point_store import CallingPointResolver
+from national_rail_pipeline.raw_snapshots import (
+    compact_day,
+    day_of_directory,
+    find_day_directories,
+)
+
+
+def _prepare_arg_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="national_rail_pipeline",
+        description="Tools for the data collected by the National Rail Pipeline",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = subparsers.add_parser(
+        "query", help="Stream matching archived rows to stdout"
+    )
+    query_parser.add_argument(
+        "paths", nargs="+", help="Archived files or directories to search"
+    )
+    query_parser.add_argument("--station", help="CRS code of the station")
+    query_parser.add_argument("--start", help="Earliest generatedAt (ISO 8601)")
+    query_parser.add_argument("--end", help="Latest generatedAt (ISO 8601)")
+    query_parser.add_argument("--operator", help="Operator name or code")
+    query_parser.add_argument("--service-id", help="serviceID of the service")
+    query_parser.add_argument(
+        "--format", choices=["csv", "jsonl"], default="csv", help="Output format"
+    )
+    query_parser.add_argument(
+        "--calling-points-store",
+        help="Path of calling_points.jsonl to restore deduplicated calling points",
+    )
+
+    manifest_parser = subparsers.add_parser(
+        "rebuild-manifest", help="Recreate the manifest of an archive directory"
+    )
+    manifest_parser.add_argument("archive_directory")
+
+    compact_parser = subparsers.add_parser(
+        "compact", help="Pack each day of raw snapshots into one gzip file"
+    )
+    compact_parser.add_argument(
+        "paths", nargs="+", help="raw directories or single day directories"
+    )
+    compact_parser.add_argument(
+        "--include-today",
+        action="store_true",
+        help="Also compact today, which railtimes.py may still be writing to",
+    )
+    compact_parser.add_argument(
+        "--keep-sources",
+        action="store_true",
+        help="Keep the snapshot files once they are packed",
+    )
+
+    convert_parser = subparsers.add_parser(
+        "convert", help="Write a binary archive next to each archived file"
+    )
+    convert_parser.add_argument(
+        "paths", nargs="+", help="Archived files or directories to convert"
+    )
+    convert_parser.add_argument(
+        "--remove-sources",
+        action="store_true",
+        help="Delete each file once its binary archive is written",
+    )
+    return parser
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    args = _prepare_arg_parser().parse_args(arguments)
+
+    if args.command == "rebuild-manifest":
+        file_count = ArchiveManifest(args.archive_directory).rebuild()
+        print(f"Recorded {file_count} files", file=sys.stderr)
+        return 0
+
+    if args.command == "compact":
+        today = datetime.date.today()
+        for path in args.paths:
+            for directory in find_day_directories(path):
+                if not args.include_today and day_of_directory(directory) >= today:
+                    continue
+                snapshot_count = compact_day(
+                    directory, remove_sources=not args.keep_sources
+                )
+                print(
+                    f"Packed {snapshot_count} snapshots in {directory}",
+                    file=sys.stderr,
+                )
+        return 0
+
+    if args.command == "convert":
+        for file_path in discover_files(args.paths, RowFilter()):
+            if file_path.endswith(BINARY_ARCHIVE_EXTENSION) or os.path.exists(
+                file_path + BINARY_ARCHIVE_EXTENSION
+            ):
+                continue
+            row_count = convert_to_binary(file_path)
+            if row_count is None:
+                continue
+            directory = os.path.dirname(file_path)
+            manifest = None
+            if os.path.exists(os.path.join(directory, MANIFEST_FILE_NAME)):
+                manifest = ArchiveManifest(directory)
+                manifest.record(file_path + BINARY_ARCHIVE_EXTENSION)
+            if args.remove_sources:
+                os.remove(file_path)
+                if manifest is not None:
+                    manifest.forget(file_path)
+            print(f"Converted {row_count} rows from {file_path}", file=sys.stderr)
+        return 0
+
+    row_filter = RowFilter(
+        station=args.station,
+        start=args.start,
+        end=args.end,
+        operator=args.operator,
+        service_id=args.service_id,
+    )
+    resolver = None
+    if args.calling_points_store is not None:
+        resolver = CallingPointResolver(args.calling_points_store)
+    try:
+        write_rows(iter_rows(args.paths, row_filter, resolver), sys.stdout, args.format)
+    except BrokenPipeError:
+        # The reader, such as head, stopped early
+        sys.stderr.close()
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
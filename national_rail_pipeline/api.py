@@ -15,19 +15,49 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 import os
+from typing import Dict, NamedTuple, Optional
 
 from zeep import Client
 from zeep import xsd
 from zeep.plugins import HistoryPlugin
+from zeep.transports import Transport
+
+from national_rail_pipeline.utils.rate_limiter import (
+    PRIORITY_NORMAL,
+    TokenBucketRateLimiter,
+    get_shared_rate_limiter,
+)
+
+
+class RawResponse(NamedTuple):
+    """The parts of an HTTP response zeep needs to decode it, which unlike
+    requests.Response can be sent to another process."""
+
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+    encoding: Optional[str]
 
 
 class RailQuerier:
-    def __init__(self):
+    def __init__(
+        self,
+        rate_limiter: Optional[TokenBucketRateLimiter] = None,
+        history_size: Optional[int] = None,
+    ):
         """The RailQuerier object is a central interface for the National Rail API.
         During instantiation of the RailQuerier object it searches for an environment
         variable named "LDB_TOKEN" and expects this variable to hold a valid National
         Rail API token.  The National Rail API is a SOAP implementation and the
         RailQuerier class intends to abstract the logic required to query the API.
+        Every request first takes a token from the rate limiter.  If no limiter is
+        given the process wide limiter configured through LDB_RATE_LIMIT_PER_SECOND
+        is used, and requests are not limited if that is unset.
+        The last raw SOAP envelopes are kept in self.history for debugging only when
+        history_size, or LDB_HISTORY_SIZE if it is None, is above zero.  Each one
+        keeps a whole parsed response alive, so it is off by default.
+        :param rate_limiter: An optional limiter shared with other RailQuerier objects
+        :param history_size: The number of requests and responses to keep
         """
         self.LDB_TOKEN = os.environ.get("LDB_TOKEN")
         self.WSDL = (
@@ -37,15 +67,40 @@ class RailQuerier:
             raise Exception(
                 "Please configure your OpenLDBWS token in getDepartureBoardExample!"
             )
-        self.history = HistoryPlugin()
-        self.client = Client(wsdl=self.WSDL, plugins=[self.history])
+        if history_size is None:
+            history_size = int(os.environ.get("LDB_HISTORY_SIZE", "0"))
+        self.history = HistoryPlugin(maxlen=history_size) if history_size > 0 else None
+        # Bound each call so one unresponsive request cannot stall a whole cycle
+        operation_timeout = os.environ.get("LDB_OPERATION_TIMEOUT_SECONDS", "30")
+        self.client = Client(
+            wsdl=self.WSDL,
+            plugins=[self.history] if self.history is not None else [],
+            transport=Transport(operation_timeout=float(operation_timeout)),
+        )
+        self.rate_limiter = (
+            rate_limiter if rate_limiter is not None else get_shared_rate_limiter()
+        )
 
-    def get_departure_board(self, station_crs_code: str):
+    def _throttle(self, priority: int) -> None:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(priority)
+
+    def get_departure_board(
+        self,
+        station_crs_code: str,
+        num_rows: int = 10,
+        time_window: Optional[int] = None,
+        priority: int = PRIORITY_NORMAL,
+    ):
         """
         This method is used to query the National Rail API and fetch departure board
         information.  The raw response of the API request is returned to the client.
         :param station_crs_code: The CRS code of the station for which the departure
         board information is desired.
+        :param num_rows: The maximum number of services to return (API limit is 150).
+        :param time_window: The number of minutes ahead to include services for.  If
+        None the API default (120 minutes) is used.
+        :param priority: The rate limiter priority class of the request.
         :return: Raw departure board information returned by the API call
         """
         header = xsd.Element(
@@ -60,17 +115,31 @@ class RailQuerier:
             ),
         )
         header_value = header(TokenValue=self.LDB_TOKEN)
+        self._throttle(priority)
         res = self.client.service.GetDepBoardWithDetails(
-            numRows=10, crs=station_crs_code, _soapheaders=[header_value]
+            numRows=num_rows,
+            crs=station_crs_code,
+            timeWindow=time_window,
+            _soapheaders=[header_value],
         )
         return res
 
-    def get_arrival_board(self, station_crs_code: str):
+    def get_arrival_board(
+        self,
+        station_crs_code: str,
+        num_rows: int = 10,
+        time_window: Optional[int] = None,
+        priority: int = PRIORITY_NORMAL,
+    ):
         """
         This method is used to query the National Rail API and fetch arrival board
         information.  The raw response of the API request is returned to the client.
         :param station_crs_code: The CRS code of the station for which the arrival
         board information is desired.
+        :param num_rows: The maximum number of services to return (API limit is 150).
+        :param time_window: The number of minutes ahead to include services for.  If
+        None the API default (120 minutes) is used.
+        :param priority: The rate limiter priority class of the request.
         :return: Raw arrival board information returned by the API call
         """
         header = xsd.Element(
@@ -85,17 +154,31 @@ class RailQuerier:
             ),
         )
         header_value = header(TokenValue=self.LDB_TOKEN)
+        self._throttle(priority)
         res = self.client.service.GetArrBoardWithDetails(
-            numRows=10, crs=station_crs_code, _soapheaders=[header_value]
+            numRows=num_rows,
+            crs=station_crs_code,
+            timeWindow=time_window,
+            _soapheaders=[header_value],
         )
         return res
 
-    def get_arr_dep_board(self, station_crs_code: str):
+    def get_arr_dep_board(
+        self,
+        station_crs_code: str,
+        num_rows: int = 10,
+        time_window: Optional[int] = None,
+        priority: int = PRIORITY_NORMAL,
+    ):
         """
         This method is used to query the National Rail API and fetch arrival and departure board
         information.  The raw response of the API request is returned to the client.
         :param station_crs_code: The CRS code of the station for which the arrival and departure
         board information is desired.
+        :param num_rows: The maximum number of services to return (API limit is 150).
+        :param time_window: The number of minutes ahead to include services for.  If
+        None the API default (120 minutes) is used.
+        :param priority: The rate limiter priority class of the request.
         :return: Raw arrival and departure board information returned by the API call
         """
         header = xsd.Element(
@@ -110,7 +193,98 @@ class RailQuerier:
             ),
         )
         header_value = header(TokenValue=self.LDB_TOKEN)
+        self._throttle(priority)
         res = self.client.service.GetArrDepBoardWithDetails(
-            numRows=10, crs=station_crs_code, _soapheaders=[header_value]
+            numRows=num_rows,
+            crs=station_crs_code,
+            timeWindow=time_window,
+            _soapheaders=[header_value],
         )
         return res
+
+    def get_service_details(
+        self,
+        service_id: str,
+        priority: int = PRIORITY_NORMAL,
+    ):
+        """
+        This method is used to query the National Rail API and fetch the details of a
+        single service, including its calling points before and after the station
+        it was looked up from.  The raw response of the API request is returned.
+        :param service_id: The serviceID of a service on a board returned within the
+        last few minutes.
+        :param priority: The rate limiter priority class of the request.
+        :return: Raw service details returned by the API call
+        """
+        header = xsd.Element(
+            "{http://thalesgroup.com/RTTI/2013-11-28/Token/types}AccessToken",
+            xsd.ComplexType(
+                [
+                    xsd.Element(
+                        "{http://thalesgroup.com/RTTI/2013-11-28/Token/types}TokenValue",  # noqa: B950
+                        xsd.String(),
+                    ),
+                ]
+            ),
+        )
+        header_value = header(TokenValue=self.LDB_TOKEN)
+        self._throttle(priority)
+        res = self.client.service.GetServiceDetails(
+            serviceID=service_id,
+            _soapheaders=[header_value],
+        )
+        return res
+
+    def fetch_raw_response(
+        self, operation_name: str, priority: int = PRIORITY_NORMAL, **parameters
+    ) -> RawResponse:
+        """
+        This method is used to query the National Rail API without decoding the
+        response, so it can be decoded later with decode_raw_response, possibly by
+        another RailQuerier in another process.
+        :param operation_name: The API operation, such as GetDepBoardWithDetails.
+        :param priority: The rate limiter priority class of the request.
+        :param parameters: The parameters of the operation, such as crs and numRows.
+        :return: The status code, content type and body of the response
+        """
+        header = xsd.Element(
+            "{http://thalesgroup.com/RTTI/2013-11-28/Token/types}AccessToken",
+            xsd.ComplexType(
+                [
+                    xsd.Element(
+                        "{http://thalesgroup.com/RTTI/2013-11-28/Token/types}TokenValue",  # noqa: B950
+                        xsd.String(),
+                    ),
+                ]
+            ),
+        )
+        header_value = header(TokenValue=self.LDB_TOKEN)
+        self._throttle(priority)
+        with self.client.settings(raw_response=True):
+            response = getattr(self.client.service, operation_name)(
+                _soapheaders=[header_value], **parameters
+            )
+        return RawResponse(
+            status_code=response.status_code,
+            # zeep only reads the content type, and requests' case insensitive
+            # headers are a plain dict once they are sent to another process
+            headers={
+                "Content-Type": response.headers.get("Content-Type", "text/xml")
+            },
+            content=response.content,
+            encoding=response.encoding,
+        )
+
+    def decode_raw_response(self, operation_name: str, response: RawResponse):
+        """
+        This method is used to decode a response fetched with fetch_raw_response
+        into the same object the operation's method would have returned.  SOAP
+        faults and malformed responses raise the same zeep exceptions as well.
+        :param operation_name: The API operation the response was fetched with.
+        :param response: The raw response.
+        :return: Raw board information, as returned by the other methods
+        """
+        binding = self.client.service._binding
+        return binding.process_reply(
+            self.client, binding.get(operation_name), response
+        )
@@ -0,0 +1,276 @@
+"""This module contains the manifest of archived log files.  The FileArchiver records
+each file it archives: its station, the first and last generatedAt of its rows, its
+row count, size and checksum.  Lookups by station and time range then only need to
+open the files which can hold matching rows instead of listing and reading the
+whole archive directory.  Binary archives converted from archived files are
+recorded under their own name, with the station and time of their source.
+"""
+import csv
+import datetime
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Union
+
+from national_rail_pipeline.binary_archive import (
+    BINARY_ARCHIVE_EXTENSION,
+    BinaryArchiveReader,
+    InvalidBinaryArchiveError,
+)
+
+MANIFEST_FILE_NAME = "manifest.sqlite"
+
+ARCHIVED_FILE_PATTERN = re.compile(
+    r"^(?P<station>[A-Z0-9]{3})(?P<arrivals>_arr)?"
+    r"-(?P<archived_at>\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})\.csv$"
+)
+
+TimeBound = Optional[Union[str, datetime.datetime]]
+
+logger = logging.getLogger(__name__)
+
+
+def normalise_timestamp(timestamp: Union[str, datetime.datetime]) -> str:
+    """Converts a generatedAt value to a UTC ISO 8601 string so that timestamps
+    compare correctly as strings.  Naive timestamps are taken to be UTC."""
+    if isinstance(timestamp, str):
+        timestamp = datetime.datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return timestamp.isoformat()
+
+
+def parse_archived_file_name(file_name: str) -> Optional[Dict[str, str]]:
+    """Extracts the station and board direction from an archived file name.
+
+    Args:
+        file_name (str): Name such as NCL-2025-01-16-06-00-00.csv
+
+    Returns:
+        Optional[Dict[str, str]]: The station, direction and archive time, or None
+            if the name is not that of an archived log file
+    """
+    match = ARCHIVED_FILE_PATTERN.match(file_name)
+    if match is None:
+        return None
+    return {
+        "station": match.group("station"),
+        "direction": "arrivals" if match.group("arrivals") else "departures",
+        "archived_at": match.group("archived_at"),
+    }
+
+
+def _iter_generated_at(file_path: str) -> Iterator[str]:
+    if file_path.endswith(BINARY_ARCHIVE_EXTENSION):
+        with BinaryArchiveReader(file_path) as reader:
+            yield from reader.column("dt_timestamp")
+        return
+    with open(file_path, newline="") as archived_file:
+        for row in csv.DictReader(archived_file):
+            yield row["dt_timestamp"]
+
+
+class ArchiveManifest:
+    def __init__(self, archive_directory: str, manifest_path: Optional[str] = None):
+        """An SQLite index over the files in an archive directory.
+
+        Args:
+            archive_directory (str): Directory holding the archived files
+            manifest_path (str, optional): Path of the SQLite database. If set to
+                None, defaults to manifest.sqlite inside the archive directory.
+        """
+        self.archive_directory = archive_directory
+        self.manifest_path = (
+            manifest_path
+            if manifest_path is not None
+            else os.path.join(archive_directory, MANIFEST_FILE_NAME)
+        )
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS archived_files ("
+                "file_name TEXT PRIMARY KEY, station TEXT NOT NULL, "
+                "direction TEXT NOT NULL, first_generated_at TEXT, "
+                "last_generated_at TEXT, row_count INTEGER NOT NULL, "
+                "byte_size INTEGER NOT NULL, sha256 TEXT NOT NULL, "
+                "archived_at TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS archived_files_station_time "
+                "ON archived_files (station, first_generated_at, last_generated_at)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.manifest_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def forget(self, file_path: str) -> None:
+        """Removes a file's manifest entry, such as once it has been deleted."""
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM archived_files WHERE file_name = ?",
+                (os.path.basename(file_path),),
+            )
+
+    def record(self, file_path: str) -> Optional[Dict]:
+        """Scans an archived file and adds or replaces its manifest entry.
+
+        Args:
+            file_path (str): Path of a file inside the archive directory
+
+        Returns:
+            Optional[Dict]: The manifest entry, or None if the file name is not
+                that of an archived log file
+        """
+        entry = self.describe(file_path)
+        if entry is None:
+            return None
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO archived_files VALUES "
+                "(:file_name, :station, :direction, :first_generated_at, "
+                ":last_generated_at, :row_count, :byte_size, :sha256, :archived_at)",
+                entry,
+            )
+        return entry
+
+    @staticmethod
+    def describe(file_path: str) -> Optional[Dict]:
+        file_name = os.path.basename(file_path)
+        source_name = file_name
+        if source_name.endswith(BINARY_ARCHIVE_EXTENSION):
+            source_name = source_name[: -len(BINARY_ARCHIVE_EXTENSION)]
+        name_parts = parse_archived_file_name(source_name)
+        if name_parts is None:
+            return None
+
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as archived_file:
+            for chunk in iter(lambda: archived_file.read(1 << 20), b""):
+                sha256.update(chunk)
+
+        first_generated_at = None
+        last_generated_at = None
+        row_count = 0
+        unreadable_count = 0
+        for timestamp in _iter_generated_at(file_path):
+            row_count += 1
+            try:
+                generated_at = normalise_timestamp(timestamp)
+            except (TypeError, ValueError):
+                # Such as a row torn by a crash, it still counts as a row but
+                # cannot narrow the file's time range
+                unreadable_count += 1
+                continue
+            if first_generated_at is None or generated_at < first_generated_at:
+                first_generated_at = generated_at
+            if last_generated_at is None or generated_at > last_generated_at:
+                last_generated_at = generated_at
+        if unreadable_count:
+            logger.warning(
+                f"Skipped {unreadable_count} rows of {file_path} without a "
+                "readable dt_timestamp"
+            )
+
+        return {
+            "file_name": file_name,
+            "station": name_parts["station"],
+            "direction": name_parts["direction"],
+            "first_generated_at": first_generated_at,
+            "last_generated_at": last_generated_at,
+            "row_count": row_count,
+            "byte_size": os.path.getsize(file_path),
+            "sha256": sha256.hexdigest(),
+            "archived_at": name_parts["archived_at"],
+        }
+
+    def query(
+        self,
+        station: Optional[str] = None,
+        start: TimeBound = None,
+        end: TimeBound = None,
+        direction: Optional[str] = None,
+    ) -> List[str]:
+        """Finds the archived files which can hold rows matching the filters.
+
+        Args:
+            station (str, optional): CRS code of the station
+            start (TimeBound, optional): Earliest generatedAt of interest
+            end (TimeBound, optional): Latest generatedAt of interest
+            direction (str, optional): Either "arrivals" or "departures"
+
+        Returns:
+            List[str]: Paths of the matching files, oldest first
+        """
+        clauses = ["row_count > 0"]
+        parameters = []
+        if station is not None:
+            clauses.append("station = ?")
+            parameters.append(station)
+        if direction is not None:
+            clauses.append("direction = ?")
+            parameters.append(direction)
+        if start is not None:
+            clauses.append("last_generated_at >= ?")
+            parameters.append(normalise_timestamp(start))
+        if end is not None:
+            clauses.append("first_generated_at <= ?")
+            parameters.append(normalise_timestamp(end))
+
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT file_name FROM archived_files WHERE "
+                + " AND ".join(clauses)
+                + " ORDER BY first_generated_at, file_name",
+                parameters,
+            ).fetchall()
+        return [os.path.join(self.archive_directory, name) for (name,) in rows]
+
+    def entries(self) -> List[Dict]:
+        with self._connect() as connection:
+            connection.row_factory = sqlite3.Row
+            rows = connection.execute(
+                "SELECT * FROM archived_files ORDER BY file_name"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def rebuild(self) -> int:
+        """Recreates the manifest from the files in the archive directory.  Files
+        which cannot be read are logged and left out.  The new manifest is
+        written to a temporary file which only replaces the current one once
+        every file has been recorded.
+
+        Returns:
+            int: The number of files recorded
+        """
+        entries = []
+        for file_name in sorted(os.listdir(self.archive_directory)):
+            file_path = os.path.join(self.archive_directory, file_name)
+            try:
+                entry = self.describe(file_path)
+            except (OSError, ValueError, csv.Error, InvalidBinaryArchiveError) as e:
+                logger.error(f"Left {file_path} out of the manifest: {e}")
+                continue
+            if entry is not None:
+                entries.append(entry)
+
+        temporary_path = self.manifest_path + ".tmp"
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        temporary_manifest = ArchiveManifest(self.archive_directory, temporary_path)
+        with temporary_manifest._connect() as connection:
+            connection.executemany(
+                "INSERT INTO archived_files VALUES "
+                "(:file_name, :station, :direction, :first_generated_at, "
+                ":last_generated_at, :row_count, :byte_size, :sha256, :archived_at)",
+                entries,
+            )
+        os.replace(temporary_path, self.manifest_path)
+        return len(entries)
@@ -0,0 +1,411 @@
+"""This module streams rows out of archived data with filters applied as early as
+possible.  Files are first skipped using what is known about them without opening
+them: the archive manifest, or the station and date in their name and directory.
+Within a file, lines which cannot contain the wanted operator or service ID are
+dropped before they are parsed.  Rows are produced by generators so memory use
+does not depend on the size of the archive.
+
+Supported inputs are the CSV files written by DeparturesQuerier (optionally
+gzipped), the JSON snapshots written by railtimes.py, JSON lines files and binary
+archives converted from any of those.  Binary archives are filtered on the
+columns the filters need before the rest of each record is decoded.
+"""
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import re
+from typing import Dict, IO, Iterable, Iterator, Optional
+
+from national_rail_pipeline.archive_manifest import (
+    ArchiveManifest,
+    MANIFEST_FILE_NAME,
+    normalise_timestamp,
+    parse_archived_file_name,
+)
+from national_rail_pipeline.binary_archive import (
+    BINARY_ARCHIVE_EXTENSION,
+    BinaryArchiveReader,
+    write_binary_archive,
+)
+from national_rail_pipeline.calling_point_store import (
+    CALLING_POINTS_REF_COLUMN,
+    CallingPointResolver,
+)
+
+RAW_SNAPSHOT_PATTERN = re.compile(r"^\d{6}-(?P<station>[A-Z0-9]{3})\.json$")
+RAW_DAY_PATTERN = re.compile(r"(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})$")
+JSON_LINES_EXTENSIONS = (".jsonl", ".ndjson")
+# Columns read from binary archives to decide whether a record matches
+FILTER_COLUMNS = ("id", "operator", "operatorCode", "dt_timestamp")
+# Every column of the rows DeparturesQuerier writes, for both directions, so CSV
+# output of departure and arrival files together keeps every column
+QUERIER_COLUMNS = (
+    "service_from",
+    "dt_timestamp",
+    "origin",
+    "destination",
+    "sched_dep",
+    "curr_dep",
+    "sched_arr",
+    "curr_arr",
+    "platform",
+    "operator",
+    "length",
+    "id",
+    "calling_points",
+    CALLING_POINTS_REF_COLUMN,
+    "journey_calling_points",
+)
+# Rows converted from board snapshots keep the station of their snapshot in this
+# column, as the station is otherwise only recorded on the snapshot line
+STATION_COLUMN = "_crs"
+
+
+class RowFilter:
+    def __init__(
+        self,
+        station: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        operator: Optional[str] = None,
+        service_id: Optional[str] = None,
+    ):
+        """Filters applied to archived rows.  Any filter left as None matches
+        every row.
+
+        Args:
+            station (str, optional): CRS code of the station the board was for
+            start (str, optional): Earliest generatedAt, as an ISO 8601 string
+            end (str, optional): Latest generatedAt, as an ISO 8601 string
+            operator (str, optional): Operator name or operator code
+            service_id (str, optional): The serviceID of the service
+        """
+        self.station = station
+        self.start = normalise_timestamp(start) if start is not None else None
+        self.end = normalise_timestamp(end) if end is not None else None
+        self.operator = operator
+        self.service_id = service_id
+
+    @property
+    def has_time_range(self) -> bool:
+        return self.start is not None or self.end is not None
+
+    def line_may_match(self, line: str) -> bool:
+        """A cheap substring check on a raw line before it is parsed."""
+        if self.service_id is not None and self.service_id not in line:
+            return False
+        if self.operator is not None and self.operator not in line:
+            return False
+        return True
+
+    def day_may_match(self, day: datetime.date) -> bool:
+        # Directory dates are in the poller's local time, so allow a day either side
+        if self.start is not None and day < _date_of(self.start) - _ONE_DAY:
+            return False
+        if self.end is not None and day > _date_of(self.end) + _ONE_DAY:
+            return False
+        return True
+
+    def matches(self, row: Dict) -> bool:
+        if self.service_id is not None and row.get("id") != self.service_id:
+            return False
+        if self.operator is not None and self.operator not in (
+            row.get("operator"),
+            row.get("operatorCode"),
+        ):
+            return False
+        if self.has_time_range:
+            generated_at = normalise_timestamp(row["dt_timestamp"])
+            if self.start is not None and generated_at < self.start:
+                return False
+            if self.end is not None and generated_at > self.end:
+                return False
+        return True
+
+
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+def _date_of(timestamp: str) -> datetime.date:
+    return datetime.date.fromisoformat(timestamp[:10])
+
+
+def discover_files(paths: Iterable[str], row_filter: RowFilter) -> Iterator[str]:
+    """Walks the given files and directories yielding only files which can hold
+    matching rows.
+
+    Args:
+        paths (Iterable[str]): Files or directories to search
+        row_filter (RowFilter): The filters of the query
+
+    Yields:
+        str: Path of each file to read, in name order within each directory
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, sub_directories, file_names in os.walk(path):
+            sub_directories.sort()
+            day_match = RAW_DAY_PATTERN.search(directory.replace(os.sep, "/"))
+            if day_match is not None and not row_filter.day_may_match(
+                datetime.date(*(int(part) for part in day_match.groups()))
+            ):
+                sub_directories.clear()
+                continue
+
+            manifest_files = None
+            if MANIFEST_FILE_NAME in file_names and (
+                row_filter.station is not None or row_filter.has_time_range
+            ):
+                manifest_files = set(
+                    ArchiveManifest(directory).query(
+                        station=row_filter.station,
+                        start=row_filter.start,
+                        end=row_filter.end,
+                    )
+                )
+
+            file_name_set = set(file_names)
+            for file_name in sorted(file_names):
+                file_path = os.path.join(directory, file_name)
+                if file_name == MANIFEST_FILE_NAME or file_name.startswith("."):
+                    continue
+                if file_name + BINARY_ARCHIVE_EXTENSION in file_name_set:
+                    # Read from the faster binary archive converted from it
+                    continue
+                source_path = file_path
+                if file_name.endswith(BINARY_ARCHIVE_EXTENSION):
+                    # Converted files are pruned on their own entry or that of
+                    # the file they were converted from
+                    source_path = file_path[: -len(BINARY_ARCHIVE_EXTENSION)]
+                if manifest_files is not None and parse_archived_file_name(
+                    os.path.basename(source_path)
+                ):
+                    if file_path in manifest_files or source_path in manifest_files:
+                        yield file_path
+                    continue
+                station = station_of_file(file_name)
+                if row_filter.station is not None and station not in (
+                    None,
+                    row_filter.station,
+                ):
+                    continue
+                yield file_path
+
+
+def station_of_file(file_name: str) -> Optional[str]:
+    """The station a file holds rows for, if its name records it."""
+    if file_name.endswith(BINARY_ARCHIVE_EXTENSION):
+        # Converted files keep the name of their source
+        file_name = file_name[: -len(BINARY_ARCHIVE_EXTENSION)]
+    archived = parse_archived_file_name(file_name)
+    if archived is not None:
+        return archived["station"]
+    raw = RAW_SNAPSHOT_PATTERN.match(file_name)
+    if raw is not None:
+        return raw.group("station")
+    return None
+
+
+def _open_text(file_path: str) -> IO[str]:
+    if file_path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(file_path, "rb"), newline="")
+    return open(file_path, newline="")
+
+
+def _base_name(file_path: str) -> str:
+    return file_path[:-3] if file_path.endswith(".gz") else file_path
+
+
+def iter_file_rows(file_path: str, row_filter: RowFilter) -> Iterator[Dict]:
+    """Lazily reads the matching rows of a single file.
+
+    Args:
+        file_path (str): Path of a CSV, JSON or JSON lines file
+        row_filter (RowFilter): The filters of the query
+
+    Yields:
+        Dict: Each matching row
+    """
+    if file_path.endswith(BINARY_ARCHIVE_EXTENSION):
+        yield from _iter_binary_rows(file_path, row_filter)
+        return
+    yield from _iter_text_rows(file_path, row_filter)
+
+
+def _iter_text_rows(
+    file_path: str, row_filter: RowFilter, station_column: Optional[str] = None
+) -> Iterator[Dict]:
+    base_name = _base_name(file_path)
+    with _open_text(file_path) as data_file:
+        if base_name.endswith(".csv"):
+            header = next(data_file, None)
+            if header is None:
+                return
+            lines = (line for line in data_file if row_filter.line_may_match(line))
+            rows = csv.DictReader(lines, fieldnames=next(csv.reader([header])))
+        elif base_name.endswith(JSON_LINES_EXTENSIONS):
+            rows = _iter_json_lines(data_file, row_filter, station_column)
+        elif base_name.endswith(".json"):
+            # Each railtimes.py snapshot is a single small JSON array
+            rows = iter(json.load(data_file))
+        else:
+            return
+        for row in rows:
+            if row_filter.matches(row):
+                yield row
+
+
+def _iter_binary_rows(file_path: str, row_filter: RowFilter) -> Iterator[Dict]:
+    with BinaryArchiveReader(file_path) as reader:
+        filters_station = (
+            row_filter.station is not None and STATION_COLUMN in reader.columns
+        )
+        has_filters = row_filter.service_id is not None or (
+            row_filter.operator is not None
+            or row_filter.has_time_range
+            or filters_station
+        )
+        filter_columns = [
+            column
+            for column in (*FILTER_COLUMNS, STATION_COLUMN)
+            if column in reader.columns
+        ]
+        columns = [column for column in reader.columns if column != STATION_COLUMN]
+        for index in range(len(reader)):
+            if has_filters:
+                filter_values = reader.record(index, filter_columns)
+                if filters_station and filter_values.get(STATION_COLUMN) not in (
+                    None,
+                    row_filter.station,
+                ):
+                    continue
+                if not row_filter.matches(filter_values):
+                    continue
+            yield reader.record(index, columns)
+
+
+def convert_to_binary(
+    file_path: str, destination_path: Optional[str] = None
+) -> Optional[int]:
+    """Converts a CSV, JSON or JSON lines file to a binary archive.
+
+    Args:
+        file_path (str): Path of the file
+        destination_path (str, optional): Path of the binary archive. If set to
+            None, the file's path with .nrb appended.
+
+    Returns:
+        Optional[int]: The number of rows converted, or None if the file is not
+            in a supported format
+    """
+    base_name = _base_name(file_path)
+    if not base_name.endswith((".csv", ".json", *JSON_LINES_EXTENSIONS)):
+        return None
+    if destination_path is None:
+        destination_path = file_path + BINARY_ARCHIVE_EXTENSION
+    return write_binary_archive(
+        destination_path,
+        _iter_text_rows(file_path, RowFilter(), station_column=STATION_COLUMN),
+        source=os.path.basename(file_path),
+    )
+
+
+def _iter_json_lines(
+    data_file: IO[str], row_filter: RowFilter, station_column: Optional[str] = None
+) -> Iterator[Dict]:
+    for line in data_file:
+        if not line.strip() or not row_filter.line_may_match(line):
+            continue
+        entry = json.loads(line)
+        # A line either holds a single row or a whole board snapshot
+        if "services" in entry:
+            if row_filter.station is not None and entry.get("crs") not in (
+                None,
+                row_filter.station,
+            ):
+                continue
+            if station_column is None:
+                yield from entry["services"]
+            else:
+                for row in entry["services"]:
+                    yield {**row, station_column: entry.get("crs")}
+        else:
+            yield entry
+
+
+def iter_rows(
+    paths: Iterable[str],
+    row_filter: RowFilter,
+    calling_point_resolver: Optional[CallingPointResolver] = None,
+) -> Iterator[Dict]:
+    """Lazily reads every matching row under the given paths.
+
+    Args:
+        paths (Iterable[str]): Files or directories to search
+        row_filter (RowFilter): The filters of the query
+        calling_point_resolver (CallingPointResolver, optional): Restores calling
+            point lists of rows written with calling point deduplication
+
+    Yields:
+        Dict: Each matching row
+    """
+    for file_path in discover_files(paths, row_filter):
+        rows = iter_file_rows(file_path, row_filter)
+        if calling_point_resolver is not None:
+            rows = calling_point_resolver.resolve_rows(rows)
+        yield from rows
+
+
+def write_rows(rows: Iterable[Dict], output: IO[str], output_format: str) -> int:
+    """Writes rows as CSV or JSON lines as they arrive.
+
+    CSV output has every column DeparturesQuerier writes when the first row only
+    holds those, otherwise the columns of the first row.
+
+    Args:
+        rows (Iterable[Dict]): The rows to write
+        output (IO[str]): Text stream to write to
+        output_format (str): Either "csv" or "jsonl"
+
+    Raises:
+        ValueError: If a CSV row has a column missing from the header
+
+    Returns:
+        int: The number of rows written
+    """
+    row_count = 0
+    writer = None
+    header_columns = None
+    for row in rows:
+        if output_format == "jsonl":
+            output.write(json.dumps(row, default=str))
+            output.write("\n")
+        else:
+            if writer is None:
+                fieldnames = (
+                    list(QUERIER_COLUMNS)
+                    if set(row) <= set(QUERIER_COLUMNS)
+                    else list(row)
+                )
+                writer = csv.DictWriter(output, fieldnames=fieldnames)
+                writer.writeheader()
+                header_columns = set(fieldnames)
+            unknown_columns = set(row) - header_columns
+            if unknown_columns:
+                raise ValueError(
+                    f"Rows have columns {sorted(unknown_columns)} which are not in "
+                    "the CSV header, query them with --format jsonl instead"
+                )
+            writer.writerow(
+                {
+                    key: json.dumps(value) if isinstance(value, list) else value
+                    for key, value in row.items()
+                }
+            )
+        row_count += 1
+    return row_count
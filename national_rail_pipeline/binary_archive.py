@@ -0,0 +1,262 @@
+"""This module contains a compact binary format for archived rows, read through mmap
+so only the records and columns asked for are decoded.
+
+Every distinct value of a file is stored once in a string table and records only
+hold 4 byte references to it, so the station, operator, platform and time values
+repeated on every row, and calling point lists unchanged between polls, cost
+4 bytes each after their first use.  A record is a count of values followed by
+that many references, one per column, so a single record is located through the
+offset index and decoded with one struct call.
+
+Layout, with every integer little endian:
+- The magic number
+- The records, each a u16 value count and that many u32 references.  Reference 0
+  is None, otherwise the low 31 bits are the string's index plus one, and the
+  high bit marks values stored as JSON because they are not strings
+- The string table, the UTF-8 strings one after the other
+- The u64 offsets of each string and of the end of the last one
+- The u64 offsets of each record
+- Metadata as JSON: the format version, the column names and the counts
+- A trailer locating the sections above, ending with the magic number
+
+The format only uses the standard library, as msgpack is not a dependency.
+"""
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+BINARY_ARCHIVE_EXTENSION = ".nrb"
+MAGIC = b"NRB1"
+FORMAT_VERSION = 1
+
+_TRAILER = struct.Struct("<QQQQI4s")
+_VALUE_COUNT = struct.Struct("<H")
+_JSON_FLAG = 0x80000000
+
+# Longer strings, such as calling point lists, are not kept once decoded
+_CACHED_STRING_LENGTH = 64
+
+
+class InvalidBinaryArchiveError(Exception):
+    pass
+
+
+def write_binary_archive(
+    file_path: str, rows: Iterable[Dict], source: Optional[str] = None
+) -> int:
+    """Writes rows to a binary archive.  Rows may have different columns, any a
+    row does not have are read back as None.
+
+    Args:
+        file_path (str): Path of the archive, written through a temporary file
+        rows (Iterable[Dict]): The rows
+        source (str, optional): Name of the file the rows were converted from,
+            kept in the metadata
+
+    Returns:
+        int: The number of rows written
+    """
+    columns: Dict[str, int] = {}
+    string_indices: Dict[str, int] = {}
+    strings: List[bytes] = []
+    record_offsets: List[int] = []
+
+    def reference(value: Any) -> int:
+        if value is None:
+            return 0
+        flag = 0
+        if not isinstance(value, str):
+            value = json.dumps(value)
+            flag = _JSON_FLAG
+        index = string_indices.get(value)
+        if index is None:
+            index = string_indices[value] = len(strings)
+            strings.append(value.encode("utf-8"))
+        return (index + 1) | flag
+
+    temporary_path = file_path + ".tmp"
+    with open(temporary_path, "wb") as archive_file:
+        archive_file.write(MAGIC)
+        offset = len(MAGIC)
+        for row in rows:
+            for column in row:
+                if column not in columns:
+                    columns[column] = len(columns)
+            references = [0] * len(columns)
+            for column, value in row.items():
+                references[columns[column]] = reference(value)
+            record = _VALUE_COUNT.pack(len(references)) + struct.pack(
+                f"<{len(references)}I", *references
+            )
+            archive_file.write(record)
+            record_offsets.append(offset)
+            offset += len(record)
+
+        strings_offset = offset
+        string_offsets = [0]
+        for string in strings:
+            archive_file.write(string)
+            string_offsets.append(string_offsets[-1] + len(string))
+        offset += string_offsets[-1]
+
+        string_offsets_offset = offset
+        archive_file.write(struct.pack(f"<{len(string_offsets)}Q", *string_offsets))
+        offset += 8 * len(string_offsets)
+
+        record_offsets_offset = offset
+        archive_file.write(struct.pack(f"<{len(record_offsets)}Q", *record_offsets))
+        offset += 8 * len(record_offsets)
+
+        metadata = json.dumps(
+            {
+                "version": FORMAT_VERSION,
+                "columns": list(columns),
+                "record_count": len(record_offsets),
+                "string_count": len(strings),
+                "source": source,
+            }
+        ).encode("utf-8")
+        archive_file.write(metadata)
+        archive_file.write(
+            _TRAILER.pack(
+                strings_offset,
+                string_offsets_offset,
+                record_offsets_offset,
+                offset,
+                len(metadata),
+                MAGIC,
+            )
+        )
+    os.replace(temporary_path, file_path)
+    return len(record_offsets)
+
+
+class BinaryArchiveReader:
+    def __init__(self, file_path: str):
+        """Maps a binary archive into memory.  Nothing is decoded until records
+        are read, and then only the columns asked for.
+
+        Args:
+            file_path (str): Path of the archive
+
+        Raises:
+            InvalidBinaryArchiveError: If the file is not a binary archive
+        """
+        self.file_path = file_path
+        self._file = open(file_path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise InvalidBinaryArchiveError(f"{file_path} is empty")
+        if len(self._map) < len(MAGIC) + _TRAILER.size or self._map[:4] != MAGIC:
+            self.close()
+            raise InvalidBinaryArchiveError(f"{file_path} is not a binary archive")
+        (
+            self._strings_offset,
+            string_offsets_offset,
+            record_offsets_offset,
+            metadata_offset,
+            metadata_length,
+            magic,
+        ) = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+        if magic != MAGIC:
+            self.close()
+            raise InvalidBinaryArchiveError(f"{file_path} is truncated")
+        self.metadata = json.loads(
+            self._map[metadata_offset:metadata_offset + metadata_length]
+        )
+        self.columns: List[str] = self.metadata["columns"]
+        self._column_indices = {name: i for i, name in enumerate(self.columns)}
+        # Views into the mapped file rather than copies
+        view = memoryview(self._map)
+        self._string_offsets = view[
+            string_offsets_offset:record_offsets_offset
+        ].cast("Q")
+        self._record_offsets = view[record_offsets_offset:metadata_offset].cast("Q")
+        view.release()
+        self._string_cache: Dict[int, Any] = {}
+
+    def __enter__(self) -> "BinaryArchiveReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.metadata["record_count"]
+
+    def close(self) -> None:
+        # The views must be released before the map can be closed
+        for view_name in ("_string_offsets", "_record_offsets"):
+            view = getattr(self, view_name, None)
+            if view is not None:
+                view.release()
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+        self._file.close()
+
+    def record(self, index: int, columns: Optional[List[str]] = None) -> Dict:
+        """Decodes a single record.
+
+        Args:
+            index (int): Position of the record in the file
+            columns (List[str], optional): Only decode these columns. If set to
+                None, every column is decoded.
+
+        Returns:
+            Dict: The record, with None for columns it does not have
+        """
+        offset = self._record_offsets[index]
+        (value_count,) = _VALUE_COUNT.unpack_from(self._map, offset)
+        references = struct.unpack_from(f"<{value_count}I", self._map, offset + 2)
+        if columns is None:
+            columns = self.columns
+        record = {}
+        for column in columns:
+            column_index = self._column_indices.get(column)
+            if column_index is None or column_index >= value_count:
+                record[column] = None
+            else:
+                record[column] = self.__value(references[column_index])
+        return record
+
+    def iter_records(self, columns: Optional[List[str]] = None) -> Iterator[Dict]:
+        """Decodes every record in order, see record."""
+        for index in range(len(self)):
+            yield self.record(index, columns)
+
+    def column(self, name: str) -> Iterator[Any]:
+        """Decodes a single column of every record."""
+        column_index = self._column_indices.get(name)
+        if column_index is None:
+            yield from (None for _ in range(len(self)))
+            return
+        reference_offset = 2 + 4 * column_index
+        for offset in self._record_offsets:
+            (value_count,) = _VALUE_COUNT.unpack_from(self._map, offset)
+            if column_index >= value_count:
+                yield None
+                continue
+            (reference,) = struct.unpack_from(
+                "<I", self._map, offset + reference_offset
+            )
+            yield self.__value(reference)
+
+    def __value(self, reference: int) -> Any:
+        if reference == 0:
+            return None
+        value = self._string_cache.get(reference)
+        if value is not None:
+            return value
+        index = (reference & ~_JSON_FLAG) - 1
+        start = self._strings_offset + self._string_offsets[index]
+        end = self._strings_offset + self._string_offsets[index + 1]
+        value = str(self._map[start:end], "utf-8")
+        if reference & _JSON_FLAG:
+            value = json.loads(value)
+        elif end - start <= _CACHED_STRING_LENGTH:
+            self._string_cache[reference] = value
+        return value
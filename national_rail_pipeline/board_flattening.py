@@ -0,0 +1,173 @@
+"""This module turns the nested board objects returned by the National Rail API into
+flat rows which can be written to CSV.  A combined arrival and departure board
+(GetArrDepBoardWithDetails) lists every service calling at the station once, so the
+same service can produce both an arrival row and a departure row.
+"""
+import json
+from typing import List, Dict, Union, Tuple
+
+Row = Dict[str, Union[str, int, float, bool, None]]
+
+ARRIVALS = "arrivals"
+DEPARTURES = "departures"
+
+BOARD_MODE_DEPARTURES = "dep"
+BOARD_MODE_ARRIVALS = "arr"
+BOARD_MODE_ARRIVALS_AND_DEPARTURES = "arr+dep"
+BOARD_MODES = (
+    BOARD_MODE_DEPARTURES,
+    BOARD_MODE_ARRIVALS,
+    BOARD_MODE_ARRIVALS_AND_DEPARTURES,
+)
+
+
+def flatten_departure_board(board) -> List[Row]:
+    """Flattens every departing service on a board into a row.
+
+    Args:
+        board: A departure board or combined arrival and departure board
+
+    Returns:
+        List[Row]: One row per service with a scheduled departure
+    """
+    return [
+        _flatten_departing_service(board, trainservice)
+        for trainservice in board.trainServices.service
+        if trainservice.std is not None
+    ]
+
+
+def flatten_arrival_board(board) -> List[Row]:
+    """Flattens every arriving service on a board into a row.
+
+    Args:
+        board: An arrival board or combined arrival and departure board
+
+    Returns:
+        List[Row]: One row per service with a scheduled arrival
+    """
+    return [
+        _flatten_arriving_service(board, trainservice)
+        for trainservice in board.trainServices.service
+        if trainservice.sta is not None
+    ]
+
+
+def split_arr_dep_board(board) -> Tuple[List[Row], List[Row]]:
+    """Splits a combined arrival and departure board into arrival and departure rows.
+
+    Args:
+        board: A board returned by GetArrDepBoardWithDetails
+
+    Returns:
+        Tuple[List[Row], List[Row]]: The arrival rows and the departure rows
+    """
+    return flatten_arrival_board(board), flatten_departure_board(board)
+
+
+def flatten_board(board, board_mode: str) -> Dict[str, List[Row]]:
+    """Flattens a board into the rows of each direction its board mode writes.
+
+    Args:
+        board: A board returned by the API for board_mode
+        board_mode (str): One of the BOARD_MODE_* values
+
+    Returns:
+        Dict[str, List[Row]]: The rows keyed by ARRIVALS or DEPARTURES
+    """
+    if board_mode == BOARD_MODE_ARRIVALS:
+        return {ARRIVALS: flatten_arrival_board(board)}
+    if board_mode == BOARD_MODE_ARRIVALS_AND_DEPARTURES:
+        arrival_rows, departure_rows = split_arr_dep_board(board)
+        return {ARRIVALS: arrival_rows, DEPARTURES: departure_rows}
+    return {DEPARTURES: flatten_departure_board(board)}
+
+
+def _flatten_departing_service(board, trainservice) -> Row:
+    service = _flatten_common_fields(board, trainservice)
+    service["sched_dep"] = trainservice.std
+    service["curr_dep"] = trainservice.etd
+    _add_trailing_fields(service, trainservice)
+    service["calling_points"] = json.dumps(
+        _flatten_calling_points(trainservice.subsequentCallingPoints)
+    )
+    return service
+
+
+def _flatten_arriving_service(board, trainservice) -> Row:
+    service = _flatten_common_fields(board, trainservice)
+    service["sched_arr"] = trainservice.sta
+    service["curr_arr"] = trainservice.eta
+    _add_trailing_fields(service, trainservice)
+    service["calling_points"] = json.dumps(
+        _flatten_calling_points(trainservice.previousCallingPoints)
+    )
+    return service
+
+
+def _flatten_common_fields(board, trainservice) -> Row:
+    service = {}
+    service["service_from"] = board.locationName
+    service["dt_timestamp"] = str(board.generatedAt)
+    service["origin"] = trainservice.origin.location[0].locationName
+    service["destination"] = trainservice.destination.location[0].locationName
+    return service
+
+
+def _add_trailing_fields(service: Row, trainservice) -> None:
+    service["platform"] = trainservice.platform
+    service["operator"] = trainservice.operator
+    service["length"] = trainservice.length
+    service["id"] = trainservice.serviceID
+
+
+def _flatten_calling_points(calling_points_container) -> List[Dict]:
+    calling_points = []
+    if calling_points_container and calling_points_container.callingPointList:
+        for cp in calling_points_container.callingPointList[0].callingPoint:
+            calling_point = {}
+            calling_point["name"] = cp.locationName
+            calling_point["is_cancelled"] = cp.isCancelled
+            calling_point["sched_time"] = cp.st
+            calling_point["est_time"] = cp.et
+            calling_points.append(calling_point)
+    return calling_points
+
+
+def flatten_service_details(details) -> List[Dict]:
+    """Flattens the response of GetServiceDetails into the service's whole journey.
+
+    Args:
+        details: Service details returned by the API
+
+    Returns:
+        List[Dict]: The calling points before the station the details were looked
+            up from, the station itself and the calling points after it
+    """
+    station = {}
+    station["name"] = details.locationName
+    station["crs"] = details.crs
+    station["is_cancelled"] = details.isCancelled
+    station["sched_time"] = details.std or details.sta
+    station["est_time"] = details.etd or details.eta
+    station["act_time"] = details.atd or details.ata
+    return [
+        *_flatten_journey_calling_points(details.previousCallingPoints),
+        station,
+        *_flatten_journey_calling_points(details.subsequentCallingPoints),
+    ]
+
+
+def _flatten_journey_calling_points(calling_points_container) -> List[Dict]:
+    calling_points = []
+    if calling_points_container and calling_points_container.callingPointList:
+        for cp in calling_points_container.callingPointList[0].callingPoint:
+            calling_point = {}
+            calling_point["name"] = cp.locationName
+            calling_point["crs"] = cp.crs
+            calling_point["is_cancelled"] = cp.isCancelled
+            calling_point["sched_time"] = cp.st
+            calling_point["est_time"] = cp.et
+            calling_point["act_time"] = cp.at
+            calling_points.append(calling_point)
+    return calling_points
@@ -0,0 +1,159 @@
+"""This module contains a content-addressed store for calling point lists.  Every
+station on a line reports the same subsequent calling points for a service on every
+poll, so storing the list inline in each row repeats the same JSON many times over.
+Instead each distinct list is written once to an append-only JSON lines file, keyed
+by a hash of its contents, and rows only keep the reference.
+"""
+import hashlib
+import json
+import os
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List
+
+from national_rail_pipeline.board_flattening import Row
+
+CALLING_POINTS_COLUMN = "calling_points"
+CALLING_POINTS_REF_COLUMN = "calling_points_ref"
+STORE_FILE_NAME = "calling_points.jsonl"
+
+
+def calling_points_ref(calling_points_json: str) -> str:
+    """Computes the reference of a serialised calling point list.
+
+    Args:
+        calling_points_json (str): The calling point list serialised as JSON
+
+    Returns:
+        str: A hex digest identifying the list contents
+    """
+    return hashlib.blake2b(
+        calling_points_json.encode("utf-8"), digest_size=12
+    ).hexdigest()
+
+
+class CallingPointStore:
+    def __init__(self, file_path: str):
+        """Writes each distinct calling point list once to an append-only file.
+
+        Args:
+            file_path (str): Path of the JSON lines file backing the store
+        """
+        self.file_path = file_path
+        self._lock = Lock()
+        self._known_refs = set()
+        self._file = None
+
+    def open(self) -> None:
+        """Loads the references already in the store and opens it for appending.
+        A torn trailing line left by a crash is truncated first."""
+        with self._lock:
+            if os.path.exists(self.file_path):
+                valid_length = 0
+                with open(self.file_path, "rb") as store_file:
+                    for line in store_file:
+                        if not line.endswith(b"\n"):
+                            break
+                        valid_length += len(line)
+                        self._known_refs.add(json.loads(line)["ref"])
+                if os.path.getsize(self.file_path) != valid_length:
+                    os.truncate(self.file_path, valid_length)
+            self._file = open(self.file_path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def put(self, calling_points_json: str) -> str:
+        """Stores a serialised calling point list unless it is already known.
+
+        Args:
+            calling_points_json (str): The calling point list serialised as JSON
+
+        Returns:
+            str: The reference to store in place of the list
+        """
+        ref = calling_points_ref(calling_points_json)
+        with self._lock:
+            if ref not in self._known_refs:
+                self._file.write(
+                    f'{{"ref": "{ref}", "calling_points": {calling_points_json}}}\n'
+                )
+                self._file.flush()
+                self._known_refs.add(ref)
+        return ref
+
+    def replace_calling_points(self, rows: List[Row]) -> List[Row]:
+        """Swaps the inline calling point list of each row for its reference.
+
+        Args:
+            rows (List[Row]): Flattened rows holding a "calling_points" column
+
+        Returns:
+            List[Row]: The same rows, modified in place
+        """
+        for row in rows:
+            row[CALLING_POINTS_REF_COLUMN] = self.put(row.pop(CALLING_POINTS_COLUMN))
+        return rows
+
+
+class CallingPointResolver:
+    def __init__(self, file_path: str):
+        """Resolves calling point references written by a CallingPointStore.
+        The store file is read incrementally, so a long lived resolver picks up
+        lists appended after it was created.
+
+        Args:
+            file_path (str): Path of the JSON lines file backing the store
+        """
+        self.file_path = file_path
+        self._lists: Dict[str, List[Dict]] = {}
+        self._offset = 0
+
+    def refresh(self) -> None:
+        """Reads any lists appended to the store since the last refresh."""
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, "rb") as store_file:
+            store_file.seek(self._offset)
+            for line in store_file:
+                if not line.endswith(b"\n"):
+                    # A writer is part way through this line
+                    break
+                self._offset += len(line)
+                entry = json.loads(line)
+                self._lists[entry["ref"]] = entry["calling_points"]
+
+    def resolve(self, ref: str) -> List[Dict]:
+        """Returns the calling point list for a reference.
+
+        Args:
+            ref (str): A reference produced by CallingPointStore.put
+
+        Raises:
+            KeyError: If the reference is not in the store
+
+        Returns:
+            List[Dict]: The calling point list
+        """
+        try:
+            return self._lists[ref]
+        except KeyError:
+            self.refresh()
+            return self._lists[ref]
+
+    def resolve_rows(self, rows: Iterable[Row]) -> Iterator[Row]:
+        """Restores the "calling_points" column of rows read back from storage.
+
+        Args:
+            rows (Iterable[Row]): Rows holding a "calling_points_ref" column
+
+        Yields:
+            Row: Each row with its calling point list serialised as JSON
+        """
+        for row in rows:
+            ref = row.pop(CALLING_POINTS_REF_COLUMN, None)
+            if ref is not None:
+                row[CALLING_POINTS_COLUMN] = json.dumps(self.resolve(ref))
+            yield row
@@ -57,6 +57,8 @@ class TrainServiceSchema(Schema):
 
     std = fields.Str(required=True, allow_none=True)
     etd = fields.Str(required=True, allow_none=True)
+    sta = fields.Str(required=False, allow_none=True)
+    eta = fields.Str(required=False, allow_none=True)
     platform = fields.Str(required=True, allow_none=True)
     operator = fields.Str(required=True)
     length = fields.Field(required=False, allow_none=True)
@@ -66,6 +68,9 @@ class TrainServiceSchema(Schema):
     subsequentCallingPoints = fields.Nested(  # noqa: N815
         SubsequentCallingPointsSchema, required=True, allow_none=True
     )
+    previousCallingPoints = fields.Nested(  # noqa: N815
+        SubsequentCallingPointsSchema, required=False, allow_none=True
+    )
 
 
 class TrainServicesSchema(Schema):
@@ -0,0 +1,365 @@
+"""This module contains an in-memory view of the network built from every board the
+pipeline polls.  Each station board only describes the services calling there, but
+the same service appears on the boards of every polled station it calls at and in
+their calling point lists.  Boards are merged into one record per service, keyed
+by its RSID (or its serviceID when it has none), holding the latest estimate known
+for each of its calling points.
+
+Merging a board only touches the services on it.  Records are kept in order of
+their last update and the least recently updated are evicted once the estimated
+memory use goes over budget, so services which have left the polled area age out.
+"""
+import datetime
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional
+
+# Rough per object sizes used for the memory budget, measured with tracemalloc
+SERVICE_RECORD_BYTES = 600
+CALLING_POINT_BYTES = 200
+
+# RSIDs are reused by the same timetabled service every day, so a record kept
+# alive by its RSID would otherwise collect a new serviceID each day forever
+MAX_SERVICE_IDS_PER_RECORD = 8
+
+_CLOCK_PATTERN = re.compile(r"^(\d{2}):(\d{2})$")
+
+
+def _parse_generated_at(generated_at) -> datetime.datetime:
+    if isinstance(generated_at, str):
+        generated_at = datetime.datetime.fromisoformat(generated_at)
+    if generated_at.tzinfo is None:
+        generated_at = generated_at.replace(tzinfo=datetime.timezone.utc)
+    return generated_at
+
+
+def resolve_clock_time(
+    clock: Optional[str], reference: datetime.datetime
+) -> Optional[datetime.datetime]:
+    """Turns an HH:MM time from a board into the nearest matching datetime to
+    when the board was generated, so times after midnight land on the next day.
+
+    Args:
+        clock (str, optional): A time such as 23:58, or text such as Delayed
+        reference (datetime.datetime): When the board was generated
+
+    Returns:
+        Optional[datetime.datetime]: The time, or None if clock is not a time
+    """
+    match = _CLOCK_PATTERN.match(clock or "")
+    if match is None:
+        return None
+    resolved = reference.replace(
+        hour=int(match.group(1)), minute=int(match.group(2)), second=0, microsecond=0
+    )
+    if resolved - reference > datetime.timedelta(hours=12):
+        resolved -= datetime.timedelta(days=1)
+    elif reference - resolved > datetime.timedelta(hours=12):
+        resolved += datetime.timedelta(days=1)
+    return resolved
+
+
+class CallingPointState:
+    __slots__ = (
+        "crs",
+        "name",
+        "scheduled",
+        "estimated",
+        "expected_at",
+        "is_cancelled",
+        "platform",
+        "observed_at",
+    )
+
+    def __init__(self, crs: str, name: str):
+        self.crs = crs
+        self.name = name
+        self.scheduled = None
+        self.estimated = None
+        self.expected_at = None
+        self.is_cancelled = False
+        self.platform = None
+        self.observed_at = None
+
+    def update(
+        self,
+        scheduled: Optional[str],
+        estimated: Optional[str],
+        is_cancelled: bool,
+        observed_at: datetime.datetime,
+        platform: Optional[str] = None,
+    ) -> None:
+        self.scheduled = scheduled
+        self.estimated = estimated
+        self.is_cancelled = is_cancelled
+        self.observed_at = observed_at
+        if platform is not None:
+            self.platform = platform
+        # "On time" and missing estimates fall back to the scheduled time
+        self.expected_at = resolve_clock_time(
+            estimated, observed_at
+        ) or resolve_clock_time(scheduled, observed_at)
+
+    def to_dict(self) -> Dict:
+        return {
+            "crs": self.crs,
+            "name": self.name,
+            "sched_time": self.scheduled,
+            "est_time": self.estimated,
+            "expected_at": self.expected_at,
+            "is_cancelled": self.is_cancelled,
+            "platform": self.platform,
+            "observed_at": self.observed_at,
+        }
+
+
+class ServiceRecord:
+    __slots__ = (
+        "key",
+        "rsid",
+        "service_ids",
+        "operator",
+        "operator_code",
+        "origin",
+        "destination",
+        "calling_points",
+        "last_generated_at",
+    )
+
+    def __init__(self, key: str):
+        self.key = key
+        self.rsid = None
+        # Ordered oldest first, values unused
+        self.service_ids: Dict[str, None] = {}
+        self.operator = None
+        self.operator_code = None
+        self.origin = None
+        self.destination = None
+        self.calling_points: Dict[str, CallingPointState] = {}
+        self.last_generated_at = None
+
+    def estimated_bytes(self) -> int:
+        return SERVICE_RECORD_BYTES + CALLING_POINT_BYTES * len(self.calling_points)
+
+    def to_dict(self) -> Dict:
+        calling_points = sorted(
+            (calling_point.to_dict() for calling_point in self.calling_points.values()),
+            key=lambda calling_point: (
+                calling_point["expected_at"] is None,
+                calling_point["expected_at"],
+            ),
+        )
+        return {
+            "key": self.key,
+            "rsid": self.rsid,
+            "service_ids": sorted(self.service_ids),
+            "operator": self.operator,
+            "operatorCode": self.operator_code,
+            "origin": self.origin,
+            "destination": self.destination,
+            "last_generated_at": self.last_generated_at,
+            "calling_points": calling_points,
+        }
+
+
+class NetworkStateStore:
+    def __init__(self, memory_budget_bytes: int = 64 * 1024 * 1024):
+        """Merges station boards into one record per service.
+
+        Args:
+            memory_budget_bytes (int, optional): Estimated memory the records may
+                use before the least recently updated are evicted
+        """
+        self.memory_budget_bytes = memory_budget_bytes
+        self._lock = Lock()
+        self._records: "OrderedDict[str, ServiceRecord]" = OrderedDict()
+        self._keys_by_service_id: Dict[str, str] = {}
+        self._keys_by_station: Dict[str, Dict[str, None]] = {}
+        self._estimated_bytes = 0
+        self.evicted_count = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def estimated_bytes(self) -> int:
+        return self._estimated_bytes
+
+    def merge_board(self, board) -> int:
+        """Merges every service on a board into the store.  Observations older
+        than the one already held for a calling point are ignored.
+
+        Args:
+            board: A departure, arrival or combined board returned by the API
+
+        Returns:
+            int: The number of services merged
+        """
+        generated_at = _parse_generated_at(board.generatedAt)
+        services = board.trainServices.service if board.trainServices else []
+        with self._lock:
+            for trainservice in services:
+                self.__merge_service(board, trainservice, generated_at)
+            self.__evict_over_budget()
+        return len(services)
+
+    def get(self, service_id: str) -> Optional[Dict]:
+        """Looks up a service by its RSID or by any serviceID it was seen with.
+
+        Returns:
+            Optional[Dict]: A copy of the service record, or None if unknown
+        """
+        with self._lock:
+            key = self._keys_by_service_id.get(service_id, service_id)
+            record = self._records.get(key)
+            return record.to_dict() if record is not None else None
+
+    def services_through(
+        self,
+        crs: str,
+        within_minutes: float,
+        now: Optional[datetime.datetime] = None,
+    ) -> List[Dict]:
+        """Finds the services expected at a station within the next few minutes,
+        whether or not the station itself is polled.
+
+        Args:
+            crs (str): CRS code of the station
+            within_minutes (float): How far ahead to look
+            now (datetime.datetime, optional): Start of the window. If set to None,
+                defaults to the current time.
+
+        Returns:
+            List[Dict]: Copies of the service records in expected time order, each
+                with the calling point at the station under "at"
+        """
+        start = now if now is not None else datetime.datetime.now(datetime.timezone.utc)
+        end = start + datetime.timedelta(minutes=within_minutes)
+        matches = []
+        with self._lock:
+            for key in self._keys_by_station.get(crs, {}):
+                calling_point = self._records[key].calling_points[crs]
+                expected_at = calling_point.expected_at
+                if expected_at is not None and start <= expected_at <= end:
+                    matches.append((expected_at, key, calling_point))
+            matches.sort(key=lambda match: (match[0], match[1]))
+            return [
+                {**self._records[key].to_dict(), "at": calling_point.to_dict()}
+                for _, key, calling_point in matches
+            ]
+
+    def __merge_service(
+        self, board, trainservice, generated_at: datetime.datetime
+    ) -> None:
+        record = self.__record_for(trainservice.rsid, trainservice.serviceID)
+        record.operator = trainservice.operator
+        record.operator_code = getattr(trainservice, "operatorCode", None)
+        record.origin = trainservice.origin.location[0].locationName
+        record.destination = trainservice.destination.location[0].locationName
+        if record.last_generated_at is None or generated_at > record.last_generated_at:
+            record.last_generated_at = generated_at
+
+        bytes_before = record.estimated_bytes()
+        is_departure = trainservice.std is not None
+        self.__merge_calling_point(
+            record,
+            board.crs,
+            board.locationName,
+            trainservice.std if is_departure else trainservice.sta,
+            trainservice.etd if is_departure else trainservice.eta,
+            bool(trainservice.isCancelled),
+            generated_at,
+            trainservice.platform,
+        )
+        for container in (
+            getattr(trainservice, "previousCallingPoints", None),
+            trainservice.subsequentCallingPoints,
+        ):
+            if not container or not container.callingPointList:
+                continue
+            for cp in container.callingPointList[0].callingPoint:
+                self.__merge_calling_point(
+                    record,
+                    cp.crs,
+                    cp.locationName,
+                    cp.st,
+                    cp.et,
+                    bool(cp.isCancelled),
+                    generated_at,
+                )
+        self._estimated_bytes += record.estimated_bytes() - bytes_before
+
+    def __record_for(self, rsid: Optional[str], service_id: str) -> ServiceRecord:
+        key = rsid or self._keys_by_service_id.get(service_id, service_id)
+        known_key = self._keys_by_service_id.get(service_id)
+        if rsid is not None and known_key is not None and known_key != rsid:
+            # First seen on a board which did not give its RSID
+            self.__rekey(known_key, rsid)
+        record = self._records.get(key)
+        if record is None:
+            record = ServiceRecord(key)
+            record.rsid = rsid
+            self._records[key] = record
+            self._estimated_bytes += record.estimated_bytes()
+        else:
+            self._records.move_to_end(key)
+        if service_id not in record.service_ids:
+            record.service_ids[service_id] = None
+            self._keys_by_service_id[service_id] = key
+            if len(record.service_ids) > MAX_SERVICE_IDS_PER_RECORD:
+                oldest_service_id = next(iter(record.service_ids))
+                del record.service_ids[oldest_service_id]
+                if self._keys_by_service_id.get(oldest_service_id) == key:
+                    del self._keys_by_service_id[oldest_service_id]
+        return record
+
+    def __rekey(self, old_key: str, new_key: str) -> None:
+        if old_key not in self._records or new_key in self._records:
+            return
+        record = self._records.pop(old_key)
+        record.key = new_key
+        record.rsid = new_key
+        self._records[new_key] = record
+        for service_id in record.service_ids:
+            self._keys_by_service_id[service_id] = new_key
+        for crs in record.calling_points:
+            station_keys = self._keys_by_station[crs]
+            station_keys.pop(old_key, None)
+            station_keys[new_key] = None
+
+    def __merge_calling_point(
+        self,
+        record: ServiceRecord,
+        crs: Optional[str],
+        name: str,
+        scheduled: Optional[str],
+        estimated: Optional[str],
+        is_cancelled: bool,
+        observed_at: datetime.datetime,
+        platform: Optional[str] = None,
+    ) -> None:
+        if crs is None:
+            return
+        calling_point = record.calling_points.get(crs)
+        if calling_point is None:
+            calling_point = CallingPointState(crs, name)
+            record.calling_points[crs] = calling_point
+            self._keys_by_station.setdefault(crs, {})[record.key] = None
+        elif calling_point.observed_at > observed_at:
+            return
+        calling_point.update(scheduled, estimated, is_cancelled, observed_at, platform)
+
+    def __evict_over_budget(self) -> None:
+        while self._estimated_bytes > self.memory_budget_bytes and self._records:
+            key, record = self._records.popitem(last=False)
+            self._estimated_bytes -= record.estimated_bytes()
+            for service_id in record.service_ids:
+                if self._keys_by_service_id.get(service_id) == key:
+                    del self._keys_by_service_id[service_id]
+            for crs in record.calling_points:
+                station_keys = self._keys_by_station[crs]
+                station_keys.pop(key, None)
+                if not station_keys:
+                    del self._keys_by_station[crs]
+            self.evicted_count += 1
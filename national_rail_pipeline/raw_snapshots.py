@@ -0,0 +1,268 @@
+"""This module contains the storage formats of the raw board snapshots written by
+railtimes.py under raw/YYYY/MM/DD.
+
+Snapshots are stored in one of three ways, all of which can be mixed in one day:
+- One small JSON array per poll, named HHMMSS-CRS.json (the original format)
+- One line per poll appended to CRS.ndjson, so a station makes one file a day
+- A packed day, written by compact_day: every snapshot of the day in name order
+  in a gzip file made of independently compressed blocks, with an index giving
+  the block and line of each snapshot so one can be read without the rest
+
+Every snapshot line holds the name the snapshot would have had as a file, the CRS
+code and the list of services, so readers see the same snapshots in the same order
+whichever format they were stored in.
+"""
+import gzip
+import heapq
+import json
+import os
+import re
+import zlib
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional
+
+from national_rail_pipeline.utils.util import truncate_torn_tail
+
+SNAPSHOT_FILE_PATTERN = re.compile(r"^\d{6}-(?P<crs>[A-Z0-9]{3})\.json$")
+NDJSON_EXTENSION = ".ndjson"
+PACK_FILE_NAME = "snapshots.ndjson.gz"
+PACK_INDEX_FILE_NAME = "snapshots.ndjson.idx"
+DAY_DIRECTORY_PATTERN = re.compile(r"(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})$")
+
+# Uncompressed size of each gzip block of a packed day.  Larger blocks compress
+# better, smaller ones are cheaper to decompress for a single snapshot.
+PACK_BLOCK_SIZE = 256 * 1024
+
+Snapshot = Dict
+
+
+def snapshot_name(polled_at: datetime, crs: str) -> str:
+    """The name of a snapshot, such as 162748-NCL.json."""
+    return f"{polled_at.strftime('%H%M%S')}-{crs}.json"
+
+
+def day_directory(polled_at: datetime) -> str:
+    return polled_at.strftime("raw/%Y/%m/%d")
+
+
+def snapshot_line(name: str, crs: str, services: List[Dict]) -> str:
+    return json.dumps({"name": name, "crs": crs, "services": services}) + "\n"
+
+
+def append_snapshot(
+    directory: str, name: str, crs: str, services: List[Dict], durable: bool = False
+) -> str:
+    """Appends a snapshot to the station's NDJSON file for the day.  The line is
+    written with a single write to a file opened for appending, so a reader never
+    sees half of it unless the process is killed mid-write.  A torn line left by
+    such a process is cut off before appending, so it does not swallow this one.
+
+    Args:
+        directory (str): The day directory
+        name (str): The snapshot name from snapshot_name
+        crs (str): CRS code of the station
+        services (List[Dict]): The services on the board
+        durable (bool, optional): Fsync the file before returning
+
+    Returns:
+        str: Path of the NDJSON file
+    """
+    os.makedirs(directory, exist_ok=True)
+    file_path = os.path.join(directory, crs + NDJSON_EXTENSION)
+    data = snapshot_line(name, crs, services).encode("utf-8")
+    file_descriptor = os.open(file_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        size = os.fstat(file_descriptor).st_size
+        if size and os.pread(file_descriptor, 1, size - 1) != b"\n":
+            truncate_torn_tail(file_path)
+        os.write(file_descriptor, data)
+        if durable:
+            os.fsync(file_descriptor)
+    finally:
+        os.close(file_descriptor)
+    return file_path
+
+
+def _iter_snapshot_file(file_path: str) -> Iterator[Snapshot]:
+    file_name = os.path.basename(file_path)
+    with open(file_path) as snapshot_file:
+        services = json.load(snapshot_file)
+    yield {
+        "name": file_name,
+        "crs": SNAPSHOT_FILE_PATTERN.match(file_name).group("crs"),
+        "services": services,
+    }
+
+
+def _iter_ndjson_file(file_path: str) -> Iterator[Snapshot]:
+    with open(file_path, "rb") as ndjson_file:
+        for line in ndjson_file:
+            # A torn last line is left by a poll killed mid-write
+            if line.endswith(b"\n"):
+                yield json.loads(line)
+
+
+def _iter_pack(directory: str) -> Iterator[Snapshot]:
+    with gzip.open(os.path.join(directory, PACK_FILE_NAME), "rb") as pack_file:
+        for line in pack_file:
+            yield json.loads(line)
+
+
+def _sources(directory: str) -> List[Iterator[Snapshot]]:
+    sources = []
+    file_names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+    snapshot_file_paths = [
+        os.path.join(directory, file_name)
+        for file_name in file_names
+        if SNAPSHOT_FILE_PATTERN.match(file_name)
+    ]
+    if snapshot_file_paths:
+        sources.append(
+            snapshot
+            for file_path in snapshot_file_paths
+            for snapshot in _iter_snapshot_file(file_path)
+        )
+    for file_name in file_names:
+        if file_name.endswith(NDJSON_EXTENSION):
+            sources.append(_iter_ndjson_file(os.path.join(directory, file_name)))
+    if PACK_FILE_NAME in file_names:
+        sources.append(_iter_pack(directory))
+    return sources
+
+
+def iter_snapshots(directory: str) -> Iterator[Snapshot]:
+    """Lazily reads every snapshot of a day in name order, whichever formats they
+    are stored in.
+
+    Args:
+        directory (str): The day directory
+
+    Yields:
+        Snapshot: Dicts with the name, crs and services of each snapshot
+    """
+    # Each source is already in name order, so they only need merging
+    return heapq.merge(*_sources(directory), key=lambda snapshot: snapshot["name"])
+
+
+def read_pack_index(directory: str) -> Optional[Dict]:
+    index_path = os.path.join(directory, PACK_INDEX_FILE_NAME)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as index_file:
+        return json.load(index_file)
+
+
+def read_snapshot(directory: str, name: str) -> Optional[Snapshot]:
+    """Reads a single snapshot of a packed day, decompressing only its block.
+
+    Args:
+        directory (str): The day directory
+        name (str): The snapshot name, such as 162748-NCL.json
+
+    Returns:
+        Optional[Snapshot]: The snapshot, or None if the pack does not hold it
+    """
+    index = read_pack_index(directory)
+    if index is None or name not in index["snapshots"]:
+        return None
+    block_number, line_number = index["snapshots"][name]
+    offset, length = index["blocks"][block_number]
+    with open(os.path.join(directory, PACK_FILE_NAME), "rb") as pack_file:
+        pack_file.seek(offset)
+        block = gzip.decompress(pack_file.read(length))
+    return json.loads(block.splitlines()[line_number])
+
+
+def _compress_block(lines: List[bytes]) -> bytes:
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return compressor.compress(b"".join(lines)) + compressor.flush()
+
+
+def compact_day(directory: str, remove_sources: bool = True) -> int:
+    """Packs every snapshot of a day into a single gzip file with an offset index.
+    Snapshots already in a pack are carried over, so a day can be compacted again
+    after late snapshots arrive.
+
+    The pack is a series of gzip members, so it can still be read by anything
+    which reads gzip files.  Only compact days which are no longer written to,
+    snapshots appended while a day is being compacted would be lost.
+
+    Args:
+        directory (str): The day directory
+        remove_sources (bool, optional): Delete the snapshot and NDJSON files once
+            the pack is written
+
+    Returns:
+        int: The number of snapshots in the pack
+    """
+    source_file_paths = [
+        os.path.join(directory, file_name)
+        for file_name in os.listdir(directory)
+        if SNAPSHOT_FILE_PATTERN.match(file_name)
+        or file_name.endswith(NDJSON_EXTENSION)
+    ]
+    pack_path = os.path.join(directory, PACK_FILE_NAME)
+    index_path = os.path.join(directory, PACK_INDEX_FILE_NAME)
+    if not source_file_paths:
+        index = read_pack_index(directory)
+        # Nothing new since the day was last packed
+        return len(index["snapshots"]) if index is not None else 0
+
+    blocks = []
+    snapshots = {}
+    block_lines = []
+    block_size = 0
+    offset = 0
+    with open(pack_path + ".tmp", "wb") as pack_file:
+
+        def write_block():
+            nonlocal offset
+            compressed = _compress_block(block_lines)
+            pack_file.write(compressed)
+            blocks.append([offset, len(compressed)])
+            offset += len(compressed)
+
+        for snapshot in iter_snapshots(directory):
+            if snapshot["name"] in snapshots:
+                # Already packed and still present as a source
+                continue
+            line = json.dumps(snapshot).encode("utf-8") + b"\n"
+            snapshots[snapshot["name"]] = [len(blocks), len(block_lines)]
+            block_lines.append(line)
+            block_size += len(line)
+            if block_size >= PACK_BLOCK_SIZE:
+                write_block()
+                block_lines = []
+                block_size = 0
+        if block_lines:
+            write_block()
+        pack_file.flush()
+        os.fsync(pack_file.fileno())
+
+    with open(index_path + ".tmp", "w") as index_file:
+        json.dump({"version": 1, "blocks": blocks, "snapshots": snapshots}, index_file)
+        index_file.flush()
+        os.fsync(index_file.fileno())
+
+    os.replace(pack_path + ".tmp", pack_path)
+    os.replace(index_path + ".tmp", index_path)
+    if remove_sources:
+        for file_path in source_file_paths:
+            os.remove(file_path)
+    return len(snapshots)
+
+
+def day_of_directory(directory: str) -> Optional[date]:
+    match = DAY_DIRECTORY_PATTERN.search(directory.replace(os.sep, "/"))
+    if match is None:
+        return None
+    return date(*(int(part) for part in match.groups()))
+
+
+def find_day_directories(root: str) -> Iterator[str]:
+    """Finds the YYYY/MM/DD day directories under a raw directory, oldest first."""
+    for directory, sub_directories, _ in os.walk(root):
+        sub_directories.sort()
+        if day_of_directory(directory) is not None:
+            sub_directories.clear()
+            yield directory
@@ -0,0 +1,139 @@
+"""This module decodes raw board responses in worker processes.  Binding the XML to
+zeep objects, validating them and flattening them into rows is CPU bound, so with
+many stations parse threads mostly wait on each other for the GIL.  Instead the
+querier's threads only fetch the response bytes and a ProcessPoolExecutor of
+workers set up with init_decode_worker turns them into rows.
+
+Each worker loads the WSDL once when it starts and keeps its own client, so decoding
+a board costs the same as in the querier's own threads.  The rows are produced by
+the same validation and flattening code, and only they, the failure kind and, when
+asked for, a plain copy of the board for the network state are sent back.
+"""
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from marshmallow import ValidationError
+from zeep.helpers import serialize_object
+
+from national_rail_pipeline.api import RailQuerier, RawResponse
+from national_rail_pipeline.board_flattening import (
+    BOARD_MODE_ARRIVALS,
+    BOARD_MODE_ARRIVALS_AND_DEPARTURES,
+    Row,
+    flatten_board,
+)
+from national_rail_pipeline.departure_board_schema import validate_departure_board
+from national_rail_pipeline.utils.circuit_breaker import (
+    FAILURE_EMPTY_BOARD,
+    FAILURE_VALIDATION,
+    classify_exception,
+)
+
+BOARD_OPERATIONS = {
+    BOARD_MODE_ARRIVALS: "GetArrBoardWithDetails",
+    BOARD_MODE_ARRIVALS_AND_DEPARTURES: "GetArrDepBoardWithDetails",
+}
+DEFAULT_BOARD_OPERATION = "GetDepBoardWithDetails"
+
+# Set in each worker process by init_decode_worker
+_worker_rail_querier: Optional[RailQuerier] = None
+
+
+class DecodedBoard(NamedTuple):
+    """A board decoded by a worker.  failure is one of the FAILURE_* kinds, with
+    error describing it, or None when rows_by_direction holds the rows."""
+
+    failure: Optional[str]
+    error: Optional[str]
+    rows_by_direction: Optional[Dict[str, List[Row]]]
+    board: Optional[Dict]
+
+
+class AttributeDict(dict):
+    """A dict whose keys can also be read as attributes, like zeep objects."""
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def to_attribute_dict(value: Any) -> Any:
+    """Wraps a board serialised by a worker so it can be read like the zeep
+    object it was serialised from, such as by NetworkStateStore.merge_board."""
+    if isinstance(value, dict):
+        return AttributeDict((k, to_attribute_dict(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [to_attribute_dict(v) for v in value]
+    return value
+
+
+def board_operation(board_mode: str) -> str:
+    """The API operation fetching boards in board_mode."""
+    return BOARD_OPERATIONS.get(board_mode, DEFAULT_BOARD_OPERATION)
+
+
+def init_decode_worker() -> None:
+    """Loads the WSDL in a newly started worker process."""
+    global _worker_rail_querier
+    # Workers share the terminal's process group, so Ctrl-C reaches them too.
+    # It is left to the parent's ShutdownSupervisor, which drains the boards
+    # still being decoded before the pool is shut down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_rail_querier = RailQuerier(history_size=0)
+
+
+def create_decode_pool(processes: int) -> ProcessPoolExecutor:
+    """Starts a pool of decode workers.
+
+    Workers are spawned rather than forked, as forking a process which is running
+    threads can leave locks held by them locked forever in the child.
+
+    Args:
+        processes (int): Number of worker processes
+    """
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_decode_worker,
+    )
+
+
+def decode_board(
+    board_mode: str, response: RawResponse, include_board: bool = False
+) -> DecodedBoard:
+    """Decodes, validates and flattens a board in a worker process, the way the
+    querier does in its parse stage.
+
+    Args:
+        board_mode (str): The board mode the response was fetched for
+        response (RawResponse): The response to the operation of board_mode
+        include_board (bool, optional): Also return the board serialised as
+            nested dicts, for callers merging it into a NetworkStateStore
+
+    Returns:
+        DecodedBoard: The rows, or why there are none
+    """
+    try:
+        board = _worker_rail_querier.decode_raw_response(
+            board_operation(board_mode), response
+        )
+    except Exception as e:
+        return DecodedBoard(
+            classify_exception(e), f"{type(e).__name__}: {e}", None, None
+        )
+    try:
+        validate_departure_board(board)
+    except ValidationError as e:
+        return DecodedBoard(FAILURE_VALIDATION, str(e), None, None)
+    if not board.trainServices:
+        return DecodedBoard(FAILURE_EMPTY_BOARD, None, None, None)
+    return DecodedBoard(
+        None,
+        None,
+        flatten_board(board, board_mode),
+        serialize_object(board, dict) if include_board else None,
+    )
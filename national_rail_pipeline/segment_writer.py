@@ -0,0 +1,306 @@
+"""This module contains the rolling segment files the live rows are written to.
+Each station and direction appends to its own active segment.  When the archiver
+asks for a rollover it only bumps a generation counter; the writer notices the new
+generation on its next write, closes its segment and renames it to a sealed name.
+The archiver only ever moves sealed segments, so it never touches a file that is
+being written and the writer never waits for it.
+
+Rows are flushed to the operating system after every append, which survives the
+process crashing but not the machine.  The durability mode decides when they are
+also fsynced to disk:
+- none: never, the operating system writes them back in its own time
+- group: the dirty segments of a writing thread are fsynced together at most
+  every group_commit_ms, so a power loss loses at most that much
+- strict: after every append
+Segments are always fsynced before being sealed in group and strict modes.
+"""
+import csv
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Set
+
+from national_rail_pipeline.board_flattening import Row
+from national_rail_pipeline.utils.exceptions import InvalidConfigError
+from national_rail_pipeline.utils.util import truncate_torn_tail
+
+ACTIVE_SEGMENT_EXTENSION = ".csv"
+SEALED_SEGMENT_EXTENSION = ".sealed"
+SEALED_TIME_FORMAT = "%Y-%m-%d-%H-%M-%S"
+
+DURABILITY_NONE = "none"
+DURABILITY_GROUP = "group"
+DURABILITY_STRICT = "strict"
+DURABILITY_MODES = (DURABILITY_NONE, DURABILITY_GROUP, DURABILITY_STRICT)
+
+SEALED_SEGMENT_PATTERN = re.compile(
+    r"^(?P<stem>.+)-(?P<sealed_at>\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})\.csv\.sealed$"
+)
+
+
+def sealed_segment_name(stem: str, sealed_at: datetime) -> str:
+    """The name of a sealed segment, such as NCL-2025-01-16-06-00-00.csv.sealed.
+    Removing the sealed extension gives the name of the archived file."""
+    return (
+        f"{stem}-{sealed_at.strftime(SEALED_TIME_FORMAT)}"
+        f"{ACTIVE_SEGMENT_EXTENSION}{SEALED_SEGMENT_EXTENSION}"
+    )
+
+
+class _ActiveSegment:
+    __slots__ = ("file", "writer", "generation")
+
+    def __init__(self, file, fieldnames, generation: int, is_new_file: bool):
+        self.file = file
+        self.writer = csv.DictWriter(file, fieldnames=fieldnames)
+        self.generation = generation
+        if is_new_file:
+            self.writer.writeheader()
+
+
+class SegmentWriter:
+    def __init__(
+        self,
+        out_directory: str,
+        durability: str = DURABILITY_NONE,
+        group_commit_ms: float = 200,
+    ):
+        """Appends rows to per-station segment files which roll over on request.
+
+        Each segment must only be appended to by one thread, while
+        request_rollover and sealed_segments may be called from any thread.
+
+        Args:
+            out_directory (str): Directory holding the active and sealed segments
+            durability (str, optional): When appended rows are fsynced. One of
+                "none", "group" or "strict".
+            group_commit_ms (float, optional): Longest a row waits to be fsynced
+                in group mode, as long as its thread keeps calling commit
+
+        Raises:
+            InvalidConfigError: If the durability mode is unknown
+        """
+        if durability not in DURABILITY_MODES:
+            raise InvalidConfigError(
+                f"Unknown durability mode {durability}, expected one of "
+                f"{DURABILITY_MODES}"
+            )
+        self.out_directory = out_directory
+        self.durability = durability
+        self.group_commit_seconds = group_commit_ms / 1000
+        self._dirty_stems: Set[str] = set()
+        self._last_commits: Dict[int, float] = {}
+        self.logger = logging.getLogger(__name__)
+        self._generation = 0
+        self._generation_lock = Lock()
+        self._segments: Dict[str, _ActiveSegment] = {}
+        self._last_sealed_names: Dict[str, str] = {}
+        self._is_closed = False
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def open(self) -> None:
+        """Seals the active segments left behind by a previous run so they are
+        archived rather than appended to.  A partial row left by a crash is cut
+        off first."""
+        self._is_closed = False
+        for file_name in sorted(os.listdir(self.out_directory)):
+            if file_name.endswith(ACTIVE_SEGMENT_EXTENSION):
+                removed_bytes = truncate_torn_tail(
+                    os.path.join(self.out_directory, file_name)
+                )
+                if removed_bytes:
+                    self.logger.warning(
+                        "Removed %s bytes of a torn row from %s",
+                        removed_bytes,
+                        file_name,
+                    )
+                self.__seal(file_name[: -len(ACTIVE_SEGMENT_EXTENSION)])
+
+    def close(self) -> None:
+        for segment in self._segments.values():
+            if self.durability != DURABILITY_NONE:
+                os.fsync(segment.file.fileno())
+            segment.file.close()
+        self._segments = {}
+        self._dirty_stems.clear()
+        self._is_closed = True
+
+    def seal_closed_segments(self) -> List[str]:
+        """Seals the active segments once the writer has been closed, so they can
+        be archived without waiting for the next run.  Does nothing while the
+        writer is open, as its segments may still be written to.
+
+        Returns:
+            List[str]: Paths of the segments sealed
+        """
+        if not self._is_closed:
+            return []
+        sealed_paths = []
+        for file_name in sorted(os.listdir(self.out_directory)):
+            if file_name.endswith(ACTIVE_SEGMENT_EXTENSION):
+                sealed_path = self.__seal(file_name[: -len(ACTIVE_SEGMENT_EXTENSION)])
+                if sealed_path is not None:
+                    sealed_paths.append(sealed_path)
+        return sealed_paths
+
+    def request_rollover(self) -> int:
+        """Asks for every active segment to be sealed.  Only a counter changes
+        here; segments are sealed by the writing thread on its next write or its
+        next call to seal_stale_segments.
+
+        Returns:
+            int: The new generation
+        """
+        with self._generation_lock:
+            self._generation += 1
+            return self._generation
+
+    def append(self, stem: str, rows: List[Row]) -> None:
+        """Appends rows to the active segment of a station and direction, first
+        sealing it if a rollover was requested since it was opened.
+
+        Args:
+            stem (str): Segment name without extension, such as NCL or NCL_arr
+            rows (List[Row]): Rows to append, all with the same fields
+        """
+        generation = self._generation
+        segment = self._segments.get(stem)
+        if segment is not None and segment.generation != generation:
+            if self.__close_and_seal(stem):
+                segment = None
+        if segment is None:
+            segment = self.__open_segment(stem, rows[0].keys(), generation)
+        segment.writer.writerows(rows)
+        segment.file.flush()
+        if self.durability == DURABILITY_STRICT:
+            os.fsync(segment.file.fileno())
+        elif self.durability == DURABILITY_GROUP:
+            self._dirty_stems.add(stem)
+
+    def commit(self, stems: Optional[Iterable[str]] = None, force: bool = False) -> int:
+        """Fsyncs the segments written since they were last fsynced, in group mode,
+        once group_commit_ms has passed since the calling thread's last commit.
+        Like append, it must be called by the thread writing the segments.
+
+        Args:
+            stems (Iterable[str], optional): Only commit these segments. If set to
+                None, every dirty segment is committed.
+            force (bool, optional): Commit without waiting for group_commit_ms
+
+        Returns:
+            int: The number of segments fsynced
+        """
+        if self.durability != DURABILITY_GROUP:
+            return 0
+        thread_id = threading.get_ident()
+        now = time.monotonic()
+        if (
+            not force
+            and now - self._last_commits.get(thread_id, 0) < self.group_commit_seconds
+        ):
+            return 0
+        self._last_commits[thread_id] = now
+        dirty_stems = [
+            stem
+            for stem in (list(stems) if stems is not None else list(self._dirty_stems))
+            if stem in self._dirty_stems
+        ]
+        for stem in dirty_stems:
+            self._dirty_stems.discard(stem)
+            segment = self._segments.get(stem)
+            if segment is not None:
+                os.fsync(segment.file.fileno())
+        return len(dirty_stems)
+
+    def seal_stale_segments(self, stems: Optional[Iterable[str]] = None) -> int:
+        """Seals segments opened before the latest rollover request, including
+        those of stations which have not been written to since.
+
+        Args:
+            stems (Iterable[str], optional): Only seal these segments, for when
+                several threads each write their own set of segments. If set to
+                None, every segment is checked.
+
+        Returns:
+            int: The number of segments sealed
+        """
+        generation = self._generation
+        if stems is None:
+            stems = list(self._segments)
+        stale_stems = []
+        for stem in list(stems):
+            segment = self._segments.get(stem)
+            if segment is not None and segment.generation != generation:
+                stale_stems.append(stem)
+        sealed_count = 0
+        for stem in stale_stems:
+            if self.__close_and_seal(stem):
+                sealed_count += 1
+        return sealed_count
+
+    def sealed_segments(self) -> List[str]:
+        """Paths of the sealed segments waiting to be archived, oldest first."""
+        file_names = [
+            file_name
+            for file_name in os.listdir(self.out_directory)
+            if SEALED_SEGMENT_PATTERN.match(file_name)
+        ]
+        file_names.sort(
+            key=lambda file_name: (
+                SEALED_SEGMENT_PATTERN.match(file_name).group("sealed_at"),
+                file_name,
+            )
+        )
+        return [os.path.join(self.out_directory, name) for name in file_names]
+
+    def __open_segment(self, stem: str, fieldnames, generation: int) -> _ActiveSegment:
+        file_path = self.__active_path(stem)
+        is_new_file = not os.path.exists(file_path)
+        segment = _ActiveSegment(
+            open(file_path, "a", newline=""), fieldnames, generation, is_new_file
+        )
+        self._segments[stem] = segment
+        return segment
+
+    def __close_and_seal(self, stem: str) -> bool:
+        sealed_path = self.__free_sealed_path(stem)
+        if sealed_path is None:
+            # Left open and stale, so sealing is retried on the next write
+            return False
+        segment = self._segments.pop(stem)
+        if self.durability != DURABILITY_NONE:
+            os.fsync(segment.file.fileno())
+        self._dirty_stems.discard(stem)
+        segment.file.close()
+        self.__seal(stem, sealed_path)
+        return True
+
+    def __free_sealed_path(self, stem: str) -> Optional[str]:
+        sealed_name = sealed_segment_name(stem, datetime.now())
+        sealed_path = os.path.join(self.out_directory, sealed_name)
+        if self._last_sealed_names.get(stem) == sealed_name or os.path.exists(
+            sealed_path
+        ):
+            # Sealing twice within a second would give two archived files the
+            # same name
+            return None
+        return sealed_path
+
+    def __seal(self, stem: str, sealed_path: Optional[str] = None) -> Optional[str]:
+        if sealed_path is None:
+            sealed_path = self.__free_sealed_path(stem)
+            if sealed_path is None:
+                return None
+        os.rename(self.__active_path(stem), sealed_path)
+        self._last_sealed_names[stem] = os.path.basename(sealed_path)
+        return sealed_path
+
+    def __active_path(self, stem: str) -> str:
+        return os.path.join(self.out_directory, stem + ACTIVE_SEGMENT_EXTENSION)
@@ -0,0 +1,160 @@
+"""This module caches the whole journeys of services looked up with GetServiceDetails.
+Boards only list a service's calling points on one side of the polled station, and
+the same service is on the boards of every polled station it calls at, so details
+are looked up once per serviceID and shared until they expire.
+
+Concurrent lookups of the same serviceID, such as from two stations' boards being
+parsed at once, wait for a single request instead of each making their own.
+"""
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from national_rail_pipeline.network_state import resolve_clock_time
+from national_rail_pipeline.utils.rate_limiter import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+)
+
+# Services leaving within these many minutes are looked up at a higher priority
+IMMINENT_MINUTES = 20
+SOON_MINUTES = 60
+
+
+def imminence_priority(clock: Optional[str], reference: datetime.datetime) -> int:
+    """The rate limiter priority to look up a service departing or arriving at
+    clock with, so the details of imminent services are refreshed first.
+
+    Args:
+        clock (str, optional): The scheduled time, such as 23:58
+        reference (datetime.datetime): When the board was generated
+    """
+    resolved = resolve_clock_time(clock, reference)
+    if resolved is None:
+        return PRIORITY_NORMAL
+    minutes_until = (resolved - reference).total_seconds() / 60
+    if minutes_until <= IMMINENT_MINUTES:
+        return PRIORITY_HIGH
+    if minutes_until <= SOON_MINUTES:
+        return PRIORITY_NORMAL
+    return PRIORITY_LOW
+
+
+class ServiceDetailsMetrics:
+    def __init__(self):
+        """Counters of the lookups made through a ServiceDetailsCache."""
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.evictions = 0
+
+    def record(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+                "evictions": self.evictions,
+                # Coalesced lookups did not make a request of their own either
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3)
+                if lookups
+                else 0.0,
+            }
+
+
+class _InFlight:
+    __slots__ = ("done", "value")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+class ServiceDetailsCache:
+    def __init__(
+        self,
+        fetch: Callable[[str, int], Optional[str]],
+        ttl_seconds: float = 120,
+        max_entries: int = 5000,
+    ):
+        """A TTL and LRU bounded cache of service details keyed by serviceID.
+
+        Args:
+            fetch (Callable[[str, int], Optional[str]]): Looks up a serviceID at a
+                rate limiter priority and returns its details, or None if it has
+                none. Exceptions are counted as failures and not cached.
+            ttl_seconds (float, optional): How long details are used before they
+                are looked up again
+            max_entries (int, optional): Details kept before the least recently
+                used are evicted
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.metrics = ServiceDetailsMetrics()
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, _InFlight] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, service_id: str, priority: int = PRIORITY_NORMAL) -> Optional[str]:
+        """Returns the details of a service, looking them up if they are not cached
+        or have expired.
+
+        Args:
+            service_id (str): The serviceID from a board
+            priority (int, optional): Rate limiter priority of the lookup
+
+        Returns:
+            Optional[str]: The details, or None if the lookup failed
+        """
+        with self._lock:
+            entry = self._entries.get(service_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(service_id)
+                self.metrics.record("hits")
+                return entry[1]
+            in_flight = self._in_flight.get(service_id)
+            is_leader = in_flight is None
+            if is_leader:
+                in_flight = _InFlight()
+                self._in_flight[service_id] = in_flight
+
+        if not is_leader:
+            self.metrics.record("coalesced")
+            in_flight.done.wait()
+            return in_flight.value
+
+        self.metrics.record("misses")
+        try:
+            in_flight.value = self._fetch(service_id, priority)
+        except Exception:
+            self.metrics.record("failures")
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[service_id]
+                if in_flight.value is not None:
+                    self.__store(service_id, in_flight.value)
+            in_flight.done.set()
+        return in_flight.value
+
+    def __store(self, service_id: str, value: str) -> None:
+        self._entries[service_id] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(service_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.metrics.record("evictions")
@@ -0,0 +1,262 @@
+"""This module reads the raw snapshots railtimes.py stores in blob storage.  A day's
+blobs are listed by prefix, fetched in parallel and kept in a size-bounded local
+cache, so a day read before is served from local disk.  Cached blobs are checked
+against the ETag returned by the listing, so a blob which changed since it was
+cached, such as an NDJSON append blob, is fetched again.
+
+The cache mirrors the blob names under its directory, so a synced day is an
+ordinary raw/YYYY/MM/DD directory which raw_snapshots.iter_snapshots can read.
+
+LocalDirectoryStorage serves a directory through the same interface as
+AzureBlobStorage, for tests and for data which has already been copied locally.
+AzureBlobStorage also works against Azurite given its connection string.
+"""
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple, Optional, Set
+
+DEFAULT_CONTAINER_NAME = "nationalrail"
+CACHE_INDEX_FILE_NAME = "cache.sqlite"
+
+
+class BlobInfo(NamedTuple):
+    name: str
+    etag: str
+    size: int
+
+
+class SnapshotStorage(ABC):
+    """Interface of the stores snapshots can be read from."""
+
+    @abstractmethod
+    def list_blobs(self, prefix: str) -> List[BlobInfo]:
+        pass
+
+    @abstractmethod
+    def download(self, name: str) -> bytes:
+        pass
+
+
+class LocalDirectoryStorage(SnapshotStorage):
+    def __init__(self, root: str):
+        """Serves the files under a directory as blobs named by their relative
+        path.  The ETag is derived from the modification time and size.
+
+        Args:
+            root (str): Directory standing in for the container
+        """
+        self.root = root
+
+    def list_blobs(self, prefix: str) -> List[BlobInfo]:
+        directory = os.path.join(self.root, os.path.dirname(prefix))
+        if not os.path.isdir(directory):
+            return []
+        blobs = []
+        for directory_path, _, file_names in os.walk(directory):
+            for file_name in file_names:
+                file_path = os.path.join(directory_path, file_name)
+                name = os.path.relpath(file_path, self.root).replace(os.sep, "/")
+                if not name.startswith(prefix):
+                    continue
+                stat = os.stat(file_path)
+                blobs.append(
+                    BlobInfo(name, f"{stat.st_mtime_ns}-{stat.st_size}", stat.st_size)
+                )
+        return sorted(blobs)
+
+    def download(self, name: str) -> bytes:
+        with open(os.path.join(self.root, name), "rb") as blob_file:
+            return blob_file.read()
+
+
+class AzureBlobStorage(SnapshotStorage):
+    def __init__(
+        self, connection_string: str, container_name: str = DEFAULT_CONTAINER_NAME
+    ):
+        """Reads blobs from an Azure storage container, or from Azurite.
+
+        Args:
+            connection_string (str): The AZURE_STORAGE_CONNECTION_STRING
+            container_name (str, optional): Container holding the snapshots
+        """
+        # Imported here so reading local snapshots does not need the azure SDK
+        from azure.storage.blob import BlobServiceClient
+
+        self._container_client = BlobServiceClient.from_connection_string(
+            connection_string
+        ).get_container_client(container_name)
+
+    def list_blobs(self, prefix: str) -> List[BlobInfo]:
+        return sorted(
+            BlobInfo(blob.name, blob.etag, blob.size)
+            for blob in self._container_client.list_blobs(name_starts_with=prefix)
+        )
+
+    def download(self, name: str) -> bytes:
+        return self._container_client.download_blob(name).readall()
+
+
+class LocalBlobCache:
+    def __init__(self, cache_directory: str, max_bytes: int = 1024 ** 3):
+        """Keeps downloaded blobs on local disk, evicting the least recently used
+        once the cache holds more than max_bytes.
+
+        Args:
+            cache_directory (str): Directory the blobs are stored under
+            max_bytes (int, optional): Size the cache is trimmed back to
+        """
+        self.cache_directory = cache_directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cached_blobs ("
+                "name TEXT PRIMARY KEY, etag TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(
+            os.path.join(self.cache_directory, CACHE_INDEX_FILE_NAME), timeout=30
+        )
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def path_of(self, name: str) -> str:
+        return os.path.join(self.cache_directory, *name.split("/"))
+
+    def lookup(self, blob: BlobInfo) -> Optional[str]:
+        """Finds a cached copy of a blob matching its current ETag.
+
+        Returns:
+            Optional[str]: Path of the cached copy, or None if it must be fetched
+        """
+        with self._lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT etag FROM cached_blobs WHERE name = ?", (blob.name,)
+            ).fetchone()
+            if row is None or row[0] != blob.etag:
+                return None
+            if not os.path.exists(self.path_of(blob.name)):
+                return None
+            connection.execute(
+                "UPDATE cached_blobs SET last_used = ? WHERE name = ?",
+                (time.time(), blob.name),
+            )
+        return self.path_of(blob.name)
+
+    def store(self, blob: BlobInfo, data: bytes) -> str:
+        """Writes a fetched blob to the cache.
+
+        Returns:
+            str: Path of the cached copy
+        """
+        file_path = self.path_of(blob.name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        temporary_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as cache_file:
+            cache_file.write(data)
+        os.replace(temporary_path, file_path)
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cached_blobs VALUES (?, ?, ?, ?)",
+                (blob.name, blob.etag, len(data), time.time()),
+            )
+        return file_path
+
+    def size(self) -> int:
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cached_blobs"
+            ).fetchone()[0]
+
+    def evict(self, keep: Optional[Set[str]] = None) -> int:
+        """Removes the least recently used blobs until the cache fits max_bytes.
+
+        Args:
+            keep (Set[str], optional): Blob names which must not be evicted, such
+                as those of the day being read
+
+        Returns:
+            int: The number of blobs evicted
+        """
+        keep = keep or set()
+        evicted = 0
+        with self._lock, self._connect() as connection:
+            total = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cached_blobs"
+            ).fetchone()[0]
+            rows = connection.execute(
+                "SELECT name, size FROM cached_blobs ORDER BY last_used"
+            ).fetchall()
+            for name, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if name in keep:
+                    continue
+                try:
+                    os.remove(self.path_of(name))
+                except FileNotFoundError:
+                    pass
+                connection.execute("DELETE FROM cached_blobs WHERE name = ?", (name,))
+                total -= size
+                evicted += 1
+        return evicted
+
+
+class SnapshotReader:
+    def __init__(
+        self, storage: SnapshotStorage, cache: LocalBlobCache, max_workers: int = 8
+    ):
+        """Makes days of snapshots in blob storage available as local directories.
+
+        Args:
+            storage (SnapshotStorage): Where the snapshots are stored
+            cache (LocalBlobCache): Local cache the blobs are fetched into
+            max_workers (int, optional): Blobs fetched in parallel
+        """
+        self.storage = storage
+        self.cache = cache
+        self.max_workers = max_workers
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def day_prefix(day: datetime.date) -> str:
+        return day.strftime("raw/%Y/%m/%d/")
+
+    def sync_day(self, day: datetime.date) -> str:
+        """Lists a day's blobs and fetches those missing from the cache or changed
+        since they were cached.
+
+        Args:
+            day (datetime.date): The day of the snapshots
+
+        Returns:
+            str: The local day directory, readable with raw_snapshots.iter_snapshots
+        """
+        prefix = self.day_prefix(day)
+        blobs = self.storage.list_blobs(prefix)
+        misses = [blob for blob in blobs if self.cache.lookup(blob) is None]
+        self.hits += len(blobs) - len(misses)
+        self.misses += len(misses)
+        if misses:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # list() so any download error is raised here
+                list(executor.map(self.__fetch, misses))
+        self.cache.evict(keep={blob.name for blob in blobs})
+        return self.cache.path_of(prefix.rstrip("/"))
+
+    def __fetch(self, blob: BlobInfo) -> str:
+        return self.cache.store(blob, self.storage.download(blob.name))
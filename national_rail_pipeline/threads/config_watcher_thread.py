@@ -0,0 +1,88 @@
+from national_rail_pipeline.threads.looping_thread import LoopingThread
+
+from national_rail_pipeline.utils.config import Config
+from national_rail_pipeline.utils.exceptions import InvalidConfigError
+
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class ConfigWatcher(LoopingThread):
+    def __init__(
+        self,
+        config: Config,
+        interval_timeout: float,
+        required_precision: Optional[float] = None,
+        name: str = "ConfigWatcher",
+    ):
+        """Periodically checks whether the yaml configuration file has changed and
+        applies changed values to the running threads.
+        A stat call per interval is all it costs while the file is unchanged.
+        Changes which fail validation or cannot be read are logged and ignored.
+
+        Args:
+            config (Config): The application configuration to reload
+            interval_timeout (float): Interval between checks in seconds
+            required_precision (float, optional): required precision for the interval
+        """
+        LoopingThread.__init__(
+            self,
+            name=name,
+            interval_timeout=interval_timeout,
+            required_precision=required_precision,
+            daemon=True,
+        )
+
+        self._config = config
+        self._callbacks: Dict[str, List[Callable[[Any], None]]] = {}
+        self._file_signature: Optional[Tuple[int, int, int]] = None
+
+    def on_change(self, key: str, callback: Callable[[Any], None]) -> None:
+        """Registers a callback to receive the new value whenever a key changes.
+
+        Args:
+            key (str): The yaml configuration key to watch
+            callback (Callable[[Any], None]): Called with the new value
+        """
+        self._callbacks.setdefault(key, []).append(callback)
+
+    def setup(self) -> None:
+        self._file_signature = self.__read_file_signature()
+
+    def loop(self) -> None:
+        file_signature = self.__read_file_signature()
+        if file_signature == self._file_signature:
+            return
+        self._file_signature = file_signature
+
+        try:
+            changes = self._config.reload()
+        except InvalidConfigError as e:
+            self.logger.error(f"Ignoring invalid configuration change: {e.message}")
+            return
+        except FileNotFoundError as e:
+            self.logger.error(f"Ignoring configuration change: {e}")
+            return
+        except Exception as e:
+            # Such as a yaml syntax error, the next change is tried again
+            self.logger.exception(f"Ignoring unreadable configuration change: {e}")
+            return
+
+        for key, value in changes.items():
+            self.logger.info(f"Configuration {key} changed to {value}")
+            for callback in self._callbacks.get(key, []):
+                try:
+                    callback(value)
+                except Exception as e:
+                    self.logger.exception(f"Failed to apply change to {key}: {e}")
+
+    def teardown(self) -> None:
+        pass
+
+    def __read_file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self._config.config_path)
+        except (OSError, TypeError):
+            return None
+        # The inode changes when an editor replaces the file instead of writing it
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
@@ -1,18 +1,80 @@
-from national_rail_pipeline.threads.looping_thread import LoopingThread
-from national_rail_pipeline.api import RailQuerier
+import datetime
+import json
+import os
+import zlib
+from functools import partial
+from threading import Event, Lock
+from typing import Dict, List, Optional, Set
 
-from national_rail_pipeline.departure_board_schema import validate_departure_board
+from marshmallow import ValidationError
 
+from national_rail_pipeline.api import RailQuerier
+from national_rail_pipeline.board_flattening import (
+    ARRIVALS,
+    BOARD_MODE_ARRIVALS,
+    BOARD_MODE_ARRIVALS_AND_DEPARTURES,
+    BOARD_MODE_DEPARTURES,
+    BOARD_MODES,
+    DEPARTURES,
+    Row,
+    flatten_board,
+    flatten_service_details,
+)
+from national_rail_pipeline.calling_point_store import (
+    CallingPointStore,
+    STORE_FILE_NAME,
+)
+from national_rail_pipeline.departure_board_schema import validate_departure_board
+from national_rail_pipeline.network_state import NetworkStateStore
+from national_rail_pipeline.response_decoding import (
+    board_operation,
+    create_decode_pool,
+    decode_board,
+    to_attribute_dict,
+)
+from national_rail_pipeline.segment_writer import SegmentWriter
+from national_rail_pipeline.service_details import (
+    ServiceDetailsCache,
+    imminence_priority,
+)
+from national_rail_pipeline.threads.looping_thread import LoopingThread
+from national_rail_pipeline.utils.circuit_breaker import (
+    FAILURE_EMPTY_BOARD,
+    FAILURE_VALIDATION,
+    StationHealthRegistry,
+    classify_exception,
+)
+from national_rail_pipeline.utils.exceptions import InvalidConfigError
+from national_rail_pipeline.utils.instrumentation import StageTimer
+from national_rail_pipeline.utils.rate_limiter import PRIORITY_CLASSES, PRIORITY_NORMAL
+from national_rail_pipeline.utils.stage_pipeline import BoundedStage
 from national_rail_pipeline.utils.util import create_directory_if_not_exists
 
-import os
-import json
-import csv
-from threading import Lock
 
-from marshmallow import ValidationError
+class _StationTask:
+    __slots__ = (
+        "crs",
+        "board_mode",
+        "segment_stems",
+        "failed_crs_codes",
+        "result",
+        "rows_by_stem",
+    )
 
-from typing import List, Dict, Union, Optional
+    def __init__(
+        self,
+        crs: str,
+        board_mode: str,
+        segment_stems: Dict[str, str],
+        failed_crs_codes: List[str],
+    ):
+        """A station's board as it passes through the stages of one cycle."""
+        self.crs = crs
+        self.board_mode = board_mode
+        self.segment_stems = segment_stems
+        self.failed_crs_codes = failed_crs_codes
+        self.result = None
+        self.rows_by_stem = None
 
 
 class DeparturesQuerier(LoopingThread):
@@ -24,6 +86,25 @@ class DeparturesQuerier(LoopingThread):
         interval_timeout: float,
         required_precision: Optional[float] = None,
         name: str = "DeparturesQuerier",
+        default_board_mode: str = BOARD_MODE_DEPARTURES,
+        station_board_modes: Optional[Dict[str, str]] = None,
+        num_rows: int = 10,
+        time_window: Optional[int] = None,
+        deduplicate_calling_points: bool = False,
+        station_priorities: Optional[Dict[str, str]] = None,
+        base_backoff_seconds: Optional[float] = None,
+        max_backoff_seconds: float = 3600,
+        stage_timer: Optional[StageTimer] = None,
+        segment_writer: Optional[SegmentWriter] = None,
+        network_state: Optional[NetworkStateStore] = None,
+        fetch_concurrency: int = 1,
+        parse_concurrency: int = 1,
+        sink_concurrency: int = 1,
+        stage_queue_size: int = 64,
+        service_details_ttl_seconds: Optional[float] = None,
+        service_details_max_entries: int = 5000,
+        enrich_concurrency: int = 1,
+        decode_processes: Optional[int] = None,
     ):
         """Periodically queries the National Rail API for new departures
          at a given list of stations.
@@ -38,6 +119,50 @@ class DeparturesQuerier(LoopingThread):
             archive_interval (float): Interval at which files are moved to archive
             interval_timeout (float): Interval between queries in seconds
             required_precision (float, optional): required precision for the interval
+            default_board_mode (str, optional): Board mode used for stations without
+                an entry in station_board_modes. One of "dep", "arr" or "arr+dep".
+            station_board_modes (Dict[str, str], optional): Board mode per CRS code.
+                Stations in "arr+dep" mode are fetched with a single combined
+                request and split into arrival and departure rows.
+            num_rows (int, optional): Maximum number of services requested per board
+            time_window (int, optional): Minutes ahead to request services for
+            deduplicate_calling_points (bool, optional): Store each distinct calling
+                point list once in a shared content-addressed store and only keep
+                its reference in the rows
+            station_priorities (Dict[str, str], optional): Rate limiter priority
+                class ("high", "normal" or "low") per CRS code. Higher priority
+                stations are queried first and win under contention.
+            base_backoff_seconds (float, optional): How long a failing station is
+                skipped for when its circuit first opens. The backoff doubles
+                each time a probe fails. If set to None, defaults to twice the
+                interval.
+            max_backoff_seconds (float, optional): Upper bound for the backoff
+            stage_timer (StageTimer, optional): Collects fetch, validate, flatten and
+                write timings. If set to None, timing is disabled.
+            segment_writer (SegmentWriter, optional): Writes rows to the rolling
+                segment files in out_directory. Share it with the FileArchiver so
+                it can request rollovers. If set to None, a new one is created.
+            network_state (NetworkStateStore, optional): Every valid board is
+                merged into it. If set to None, boards are only written to file.
+            fetch_concurrency (int, optional): Threads fetching boards from the API
+            parse_concurrency (int, optional): Threads validating and flattening
+                boards
+            sink_concurrency (int, optional): Threads writing rows to segments.
+                Each station is always written by the same thread.
+            stage_queue_size (int, optional): Boards queued in front of each stage
+                before the stage before it has to wait
+            service_details_ttl_seconds (float, optional): Look up each service's
+                whole journey with GetServiceDetails and add it to its rows as
+                journey_calling_points, reusing the details for this long. If set
+                to None, services are not looked up.
+            service_details_max_entries (int, optional): Services whose details
+                are kept before the least recently used are dropped
+            enrich_concurrency (int, optional): Threads looking up service details
+            decode_processes (int, optional): Decode boards in this many worker
+                processes, so fetch threads only download the responses and parse
+                threads wait for the rows. The rows are the same as when boards
+                are decoded in the parse threads. If set to None, boards are
+                decoded in the parse threads.
         """
         LoopingThread.__init__(
             self,
@@ -49,113 +174,461 @@ class DeparturesQuerier(LoopingThread):
 
         self._live_file_access_lock = log_file_access_lock
 
+        self._station_lock = Lock()
+        self._draining = Event()
         self.crs_codes = crs_codes
         self.out_directory = out_directory
 
+        self.default_board_mode = default_board_mode
+        self.station_board_modes = station_board_modes or {}
+        for mode in [self.default_board_mode, *self.station_board_modes.values()]:
+            if mode not in BOARD_MODES:
+                raise InvalidConfigError(
+                    f"Unknown board mode {mode}, expected one of {BOARD_MODES}"
+                )
+        self.num_rows = num_rows
+        self.time_window = time_window
+
+        self.station_priorities = {}
+        for crs, priority_class in (station_priorities or {}).items():
+            if priority_class not in PRIORITY_CLASSES:
+                raise InvalidConfigError(
+                    f"Unknown priority class {priority_class} for {crs}, "
+                    f"expected one of {list(PRIORITY_CLASSES)}"
+                )
+            self.station_priorities[crs] = PRIORITY_CLASSES[priority_class]
+
         self._rail_querier = RailQuerier()
-        self.out_file_paths = {}
+        self.segment_writer = (
+            segment_writer
+            if segment_writer is not None
+            else SegmentWriter(self.out_directory)
+        )
+        self.segment_stems = {}
+        self.network_state = network_state
+        self.stage_timer = (
+            stage_timer if stage_timer is not None else StageTimer(enabled=False)
+        )
+
+        self.station_health = StationHealthRegistry(
+            base_backoff_seconds=(
+                base_backoff_seconds
+                if base_backoff_seconds is not None
+                else 2 * interval_timeout
+            ),
+            max_backoff_seconds=max_backoff_seconds,
+        )
+
+        # Boards flow through fetch, parse and sink stages connected by bounded
+        # queues, so API calls, parsing and disk writes overlap
+        self._fetch_stage = BoundedStage(
+            "fetch",
+            self.__fetch,
+            concurrency=fetch_concurrency,
+            queue_size=stage_queue_size,
+            logger=self.logger,
+        )
+        self._parse_stage = BoundedStage(
+            "parse",
+            self.__parse,
+            concurrency=parse_concurrency,
+            queue_size=stage_queue_size,
+            logger=self.logger,
+        )
+        self.decode_processes = decode_processes
+        self._decode_pool = None
+        self.service_details = None
+        self._enrich_stage = None
+        if service_details_ttl_seconds is not None:
+            self.service_details = ServiceDetailsCache(
+                self.__fetch_service_details,
+                ttl_seconds=service_details_ttl_seconds,
+                max_entries=service_details_max_entries,
+            )
+            self._enrich_stage = BoundedStage(
+                "enrich",
+                self.__enrich,
+                concurrency=enrich_concurrency,
+                queue_size=stage_queue_size,
+                logger=self.logger,
+            )
+        self._sink_stages = []
+        for index in range(sink_concurrency):
+            sink_stems = set()
+            self._sink_stages.append(
+                BoundedStage(
+                    f"sink{index}",
+                    partial(self.__write, sink_stems),
+                    queue_size=stage_queue_size,
+                    logger=self.logger,
+                    idle_handler=partial(self.__seal_idle_segments, sink_stems),
+                    # Dirty segments are committed when a sink goes quiet
+                    idle_seconds=min(1, self.segment_writer.group_commit_seconds),
+                )
+            )
+
+        self._calling_point_store = None
+        if deduplicate_calling_points:
+            self._calling_point_store = CallingPointStore(
+                os.path.join(self.out_directory, STORE_FILE_NAME)
+            )
 
     def setup(self) -> None:
         self.logger.debug("Setting up")
 
         with self._live_file_access_lock:
             create_directory_if_not_exists(self.out_directory)
+        self.segment_writer.open()
 
-        self.out_file_paths = {
-            crs: os.path.join(self.out_directory, f"{crs}.csv")
-            for crs in self.crs_codes
-        }
+        with self._station_lock:
+            self.segment_stems = self.__build_segment_stems(self.crs_codes)
+        if self._calling_point_store is not None:
+            self._calling_point_store.open()
+        if self.decode_processes is not None:
+            self._decode_pool = create_decode_pool(self.decode_processes)
+        for stage in self.__stages():
+            stage.profiler = self.profiler
+            stage.start()
         self.logger.debug("Set up Complete")
 
-    def loop(self) -> None:
-        failed_crs_codes = []
-        for crs in self.crs_codes:
-            try:
-                result = self._rail_querier.get_departure_board(crs)
-            except Exception as e:
-                self.logger.exception(f"ERROR DURING API QUERY {e}")
-                failed_crs_codes.append(crs)
-                continue
+    def update_crs_codes(self, crs_codes: List[str]) -> None:
+        """Replaces the stations queried from the next cycle onwards.
 
-            try:
-                validate_departure_board(result)
-            except ValidationError as e:
-                self.logger.debug(result)
-                self.logger.exception(f"VALIDATION THREW ERROR {e}")
-                failed_crs_codes.append(crs)
-                continue
+        Args:
+            crs_codes (List[str]): CRS codes of stations to query
+        """
+        with self._station_lock:
+            removed_crs_codes = set(self.crs_codes) - set(crs_codes)
+            added_crs_codes = set(crs_codes) - set(self.crs_codes)
+            self.crs_codes = list(crs_codes)
+            self.segment_stems = self.__build_segment_stems(self.crs_codes)
+        for crs in removed_crs_codes:
+            self.station_health.forget(crs)
+        self.logger.info(
+            f"Updated stations, added {sorted(added_crs_codes)}, "
+            f"removed {sorted(removed_crs_codes)}"
+        )
 
-            if not result.trainServices:
-                self.logger.warning(f"No services currently scheduled from {crs}")
-                failed_crs_codes.append(crs)
-                continue
+    def loop(self) -> None:
+        with self._station_lock:
+            crs_codes = list(self.crs_codes)
+            segment_stems = self.segment_stems
 
-            row_results = self.__flatten_departure_board(result)
-            self.__append_to_csv_file(self.out_file_paths[crs], row_results)
-            self.logger.debug(f"Wrote new logs for {crs}")
+        failed_crs_codes = []
+        skipped_crs_codes = []
+        for crs in sorted(crs_codes, key=self.__station_priority):
+            if not self.station_health.allow_request(crs):
+                skipped_crs_codes.append(crs)
+                continue
+            self._fetch_stage.put(
+                _StationTask(
+                    crs,
+                    self.station_board_modes.get(crs, self.default_board_mode),
+                    segment_stems[crs],
+                    failed_crs_codes,
+                )
+            )
+        # Wait for this cycle's boards to be fetched and parsed, but not written,
+        # so slow writes do not hold up the next cycle
+        self._fetch_stage.join()
+        self._parse_stage.join()
+        if self._enrich_stage is not None:
+            self._enrich_stage.join()
 
         if len(failed_crs_codes) > 0:
-            self.logger.warning(f"Failed to get departures for {failed_crs_codes}")
+            self.logger.warning("Failed to get departures for %s", failed_crs_codes)
+        if len(skipped_crs_codes) > 0:
+            self.logger.info(
+                "Skipped stations with open circuits: %s",
+                self.station_health.unhealthy_stations(),
+            )
         successful_departures = [
-            item for item in self.crs_codes if item not in failed_crs_codes
+            item
+            for item in crs_codes
+            if item not in failed_crs_codes and item not in skipped_crs_codes
         ]
-        self.logger.info(f"Successfully got new departures for {successful_departures}")
+        self.logger.info(
+            "Successfully got new departures for %s", successful_departures
+        )
+        if self._rail_querier.rate_limiter is not None:
+            self.logger.debug(
+                "Rate limiter metrics: %s",
+                self._rail_querier.rate_limiter.metrics.snapshot(),
+            )
+        self.logger.debug("Stage metrics: %s", self.stage_metrics())
+        if self.service_details is not None:
+            self.logger.debug(
+                "Service details cache holds %s services, metrics: %s",
+                len(self.service_details),
+                self.service_details.metrics.snapshot(),
+            )
+        if self.network_state is not None:
+            self.logger.debug(
+                "Network state holds %s services in about %s bytes",
+                len(self.network_state),
+                self.network_state.estimated_bytes,
+            )
+        self.stage_timer.maybe_emit(self.logger)
         return successful_departures, failed_crs_codes
 
     def teardown(self) -> None:
-        pass
-
-    def __flatten_departure_board(
-        self, result
-    ) -> List[Dict[str, Union[str, int, float, bool, None]]]:
-        return_row_list = []
-
-        for trainservice in result.trainServices.service:
-            service = {}
-            service["service_from"] = result.locationName
-            service["dt_timestamp"] = str(result.generatedAt)
-            service["origin"] = trainservice.origin.location[0].locationName
-            service["destination"] = trainservice.destination.location[0].locationName
-            service["sched_dep"] = trainservice.std
-            service["curr_dep"] = trainservice.etd
-            service["platform"] = trainservice.platform
-            service["operator"] = trainservice.operator
-            service["length"] = trainservice.length
-            service["id"] = trainservice.serviceID
-
-            calling_points = []
-            if (
-                trainservice.subsequentCallingPoints
-                and trainservice.subsequentCallingPoints.callingPointList
-            ):
-                for cp in trainservice.subsequentCallingPoints.callingPointList[
-                    0
-                ].callingPoint:
-                    calling_point = {}
-                    calling_point["name"] = cp.locationName
-                    calling_point["is_cancelled"] = cp.isCancelled
-                    calling_point["sched_time"] = cp.st
-                    calling_point["est_time"] = cp.et
-                    calling_points.append(calling_point)
-
-            service["calling_points"] = json.dumps(calling_points)
-
-            return_row_list.append(service)
-
-        return return_row_list
-
-    def __append_to_csv_file(
-        self, file_path: str, rows: List[Dict[str, Union[str, int, float, bool, None]]]
-    ):
-        with self._live_file_access_lock:
-            is_new_file = False
-            if not os.path.exists(file_path):
-                is_new_file = True
+        # Stopped in order so every queued board is written before closing
+        for stage in self.__stages():
+            stage.stop()
+        self.logger.info("Drained stages on teardown: %s", self.stage_metrics())
+        if self._decode_pool is not None:
+            self._decode_pool.shutdown()
+            self._decode_pool = None
+        self.segment_writer.close()
+        if self._calling_point_store is not None:
+            self._calling_point_store.close()
+
+    def stop(self) -> None:
+        # Boards already being fetched are finished and written, the rest of the
+        # cycle is dropped
+        self._draining.set()
+        LoopingThread.stop(self)
+
+    def stage_metrics(self) -> Dict[str, Dict[str, float]]:
+        """Queue depth, throughput and back pressure of each pipeline stage."""
+        return {
+            stage.name: stage.metrics_snapshot()
+            for stage in self.__stages()
+        }
+
+    def __stages(self) -> List[BoundedStage]:
+        enrich_stages = [self._enrich_stage] if self._enrich_stage is not None else []
+        return [
+            self._fetch_stage,
+            self._parse_stage,
+            *enrich_stages,
+            *self._sink_stages,
+        ]
+
+    def __fetch(self, task: "_StationTask") -> None:
+        if self._draining.is_set():
+            return
+        try:
+            with self.stage_timer.stage("fetch"):
+                if self._decode_pool is not None:
+                    task.result = self._decode_pool.submit(
+                        decode_board,
+                        task.board_mode,
+                        self.__fetch_raw_board(task.crs, task.board_mode),
+                        self.network_state is not None,
+                    )
+                else:
+                    task.result = self.__fetch_board(task.crs, task.board_mode)
+        except Exception as e:
+            self.logger.exception(f"ERROR DURING API QUERY {e}")
+            self.station_health.record_failure(task.crs, classify_exception(e))
+            task.failed_crs_codes.append(task.crs)
+            return
+        self._parse_stage.put(task)
+
+    def __parse(self, task: "_StationTask") -> None:
+        try:
+            if self._decode_pool is not None:
+                self.__collect_decoded(task)
+            else:
+                self.__parse_board(task)
+        except Exception as e:
+            self.__fail_station(task, "PARSING", e)
+
+    def __parse_board(self, task: "_StationTask") -> None:
+        crs = task.crs
+        result = task.result
+        try:
+            with self.stage_timer.stage("validate"):
+                validate_departure_board(result)
+        except ValidationError as e:
+            self.logger.debug(result)
+            self.logger.exception(f"VALIDATION THREW ERROR {e}")
+            self.station_health.record_failure(crs, FAILURE_VALIDATION)
+            task.failed_crs_codes.append(crs)
+            return
+
+        if not result.trainServices:
+            self.logger.warning("No services currently scheduled from %s", crs)
+            self.station_health.record_failure(crs, FAILURE_EMPTY_BOARD)
+            task.failed_crs_codes.append(crs)
+            return
+
+        if self.network_state is not None:
+            with self.stage_timer.stage("network_state"):
+                self.network_state.merge_board(result)
+
+        with self.stage_timer.stage("flatten"):
+            rows_by_direction = flatten_board(result, task.board_mode)
+            self.__replace_calling_points(rows_by_direction)
+        self.__route_rows(task, rows_by_direction)
+
+    def __collect_decoded(self, task: "_StationTask") -> None:
+        crs = task.crs
+        try:
+            with self.stage_timer.stage("decode"):
+                decoded = task.result.result()
+        except Exception as e:
+            # The worker died or the response could not be sent to it
+            self.logger.exception(f"DECODING FAILED {e}")
+            self.station_health.record_failure(crs, classify_exception(e))
+            task.failed_crs_codes.append(crs)
+            return
 
-            with open(file_path, "a", newline="") as csv_file:
-                writer = csv.DictWriter(csv_file, fieldnames=rows[0].keys())
+        if decoded.failure == FAILURE_EMPTY_BOARD:
+            self.logger.warning("No services currently scheduled from %s", crs)
+        elif decoded.failure == FAILURE_VALIDATION:
+            self.logger.error(f"VALIDATION THREW ERROR {decoded.error}")
+        elif decoded.failure is not None:
+            self.logger.error(f"ERROR DURING API QUERY {decoded.error}")
+        if decoded.failure is not None:
+            self.station_health.record_failure(crs, decoded.failure)
+            task.failed_crs_codes.append(crs)
+            return
 
-                if is_new_file:
-                    writer.writeheader()
+        if self.network_state is not None:
+            with self.stage_timer.stage("network_state"):
+                self.network_state.merge_board(to_attribute_dict(decoded.board))
+        with self.stage_timer.stage("flatten"):
+            self.__replace_calling_points(decoded.rows_by_direction)
+        self.__route_rows(task, decoded.rows_by_direction)
 
-                writer.writerows(rows)
+    def __replace_calling_points(
+        self, rows_by_direction: Dict[str, List[Row]]
+    ) -> None:
+        if self._calling_point_store is not None:
+            for row_results in rows_by_direction.values():
+                self._calling_point_store.replace_calling_points(row_results)
+
+    def __route_rows(
+        self, task: "_StationTask", rows_by_direction: Dict[str, List[Row]]
+    ) -> None:
+        task.result = None
+        task.rows_by_stem = {
+            task.segment_stems[direction]: row_results
+            for direction, row_results in rows_by_direction.items()
+            if row_results
+        }
+        if self._enrich_stage is not None:
+            self._enrich_stage.put(task)
+        else:
+            self.__put_to_sink(task)
+
+    def __enrich(self, task: "_StationTask") -> None:
+        try:
+            self.__enrich_rows(task)
+        except Exception as e:
+            self.__fail_station(task, "ENRICHMENT", e)
+            return
+        self.__put_to_sink(task)
+
+    def __enrich_rows(self, task: "_StationTask") -> None:
+        rows = [
+            row for row_results in task.rows_by_stem.values() for row in row_results
+        ]
+        with self.stage_timer.stage("enrich"):
+            priorities = {}
+            for row in rows:
+                if row["id"] not in priorities:
+                    priorities[row["id"]] = imminence_priority(
+                        row.get("sched_dep") or row.get("sched_arr"),
+                        datetime.datetime.fromisoformat(row["dt_timestamp"]),
+                    )
+            # Services leaving soonest are looked up first
+            journeys = {}
+            for service_id in sorted(priorities, key=priorities.get):
+                try:
+                    journeys[service_id] = self.service_details.get(
+                        service_id, priorities[service_id]
+                    )
+                except Exception as e:
+                    self.logger.warning(
+                        "Failed to get details of service %s: %s", service_id, e
+                    )
+                    journeys[service_id] = None
+            for row in rows:
+                row["journey_calling_points"] = journeys[row["id"]]
+
+    def __put_to_sink(self, task: "_StationTask") -> None:
+        # A station always goes to the same sink, which is then the only writer
+        # of its segments
+        crs = task.crs
+        self._sink_stages[zlib.crc32(crs.encode()) % len(self._sink_stages)].put(task)
+
+    def __write(self, sink_stems: Set[str], task: "_StationTask") -> None:
+        try:
+            with self.stage_timer.stage("write"):
+                for stem, row_results in task.rows_by_stem.items():
+                    self.segment_writer.append(stem, row_results)
+                    sink_stems.add(stem)
+                self.segment_writer.commit(sink_stems)
+        except Exception as e:
+            self.__fail_station(task, "WRITING", e)
+            self.logger.error(
+                "Lost %s rows of %s",
+                sum(len(row_results) for row_results in task.rows_by_stem.values()),
+                task.crs,
+            )
+            return
+        # Only a board whose rows were written counts as a success
+        self.station_health.record_success(task.crs)
+        self.logger.debug("Wrote new logs for %s", task.crs)
+
+    def __fail_station(
+        self, task: "_StationTask", stage: str, exception: Exception
+    ) -> None:
+        # Every stage reports its station's outcome, otherwise a half-open
+        # circuit would wait forever for the result of its probe
+        self.logger.exception(f"ERROR DURING {stage} OF {task.crs} {exception}")
+        self.station_health.record_failure(task.crs, classify_exception(exception))
+        task.failed_crs_codes.append(task.crs)
+
+    def __seal_idle_segments(self, sink_stems: Set[str]) -> None:
+        self.segment_writer.commit(sink_stems, force=True)
+        # Segments of stations not written to since a rollover are sealed here
+        sealed_count = self.segment_writer.seal_stale_segments(sink_stems)
+        if sealed_count:
+            self.logger.debug("Sealed %s idle segments", sealed_count)
+
+    @staticmethod
+    def __build_segment_stems(crs_codes: List[str]) -> Dict[str, Dict[str, str]]:
+        return {
+            crs: {DEPARTURES: crs, ARRIVALS: f"{crs}_arr"}
+            for crs in crs_codes
+        }
+
+    def __fetch_service_details(
+        self, service_id: str, priority: int
+    ) -> Optional[str]:
+        details = self._rail_querier.get_service_details(
+            service_id, priority=priority
+        )
+        if details is None:
+            return None
+        return json.dumps(flatten_service_details(details))
+
+    def __station_priority(self, crs: str) -> int:
+        return self.station_priorities.get(crs, PRIORITY_NORMAL)
+
+    def __fetch_raw_board(self, crs: str, board_mode: str):
+        return self._rail_querier.fetch_raw_response(
+            board_operation(board_mode),
+            priority=self.__station_priority(crs),
+            numRows=self.num_rows,
+            crs=crs,
+            timeWindow=self.time_window,
+        )
+
+    def __fetch_board(self, crs: str, board_mode: str):
+        if board_mode == BOARD_MODE_ARRIVALS:
+            fetch = self._rail_querier.get_arrival_board
+        elif board_mode == BOARD_MODE_ARRIVALS_AND_DEPARTURES:
+            fetch = self._rail_querier.get_arr_dep_board
+        else:
+            fetch = self._rail_querier.get_departure_board
+        return fetch(
+            crs,
+            num_rows=self.num_rows,
+            time_window=self.time_window,
+            priority=self.__station_priority(crs),
+        )
@@ -1,9 +1,15 @@
 from national_rail_pipeline.threads.looping_thread import LoopingThread
 
+from national_rail_pipeline.archive_manifest import ArchiveManifest, MANIFEST_FILE_NAME
+from national_rail_pipeline.segment_writer import (
+    SEALED_SEGMENT_EXTENSION,
+    SegmentWriter,
+)
+
+from national_rail_pipeline.utils.instrumentation import StageTimer
 from national_rail_pipeline.utils.util import create_directory_if_not_exists
 
 from threading import Lock
-from datetime import datetime
 import os
 from typing import Optional
 
@@ -17,6 +23,8 @@ class FileArchiver(LoopingThread):
         interval_timeout: float,
         required_precision: Optional[float] = None,
         name: str = "FileArchiver",
+        stage_timer: Optional[StageTimer] = None,
+        segment_writer: Optional[SegmentWriter] = None,
     ):
         """Periodically queries the National Rail API for new departures
          at a given list of stations.
@@ -29,6 +37,12 @@ class FileArchiver(LoopingThread):
             archive_access_lock (threading.Lock): Locks access to the archived log files
             interval_timeout (float): Interval at which files are moved to archive
             required_precision (float, optional): required precision for the interval
+            stage_timer (StageTimer, optional): Collects archive timings. If set to
+                None, timing is disabled.
+            segment_writer (SegmentWriter, optional): The DeparturesQuerier's
+                segment writer, asked to roll its segments over each interval.
+                If set to None, only segments sealed by the querier at start up
+                are archived.
         """
         LoopingThread.__init__(
             self,
@@ -44,7 +58,18 @@ class FileArchiver(LoopingThread):
         self._log_file_access_lock = log_file_access_lock
         self._archive_access_lock = archive_access_lock
 
+        self.segment_writer = (
+            segment_writer
+            if segment_writer is not None
+            else SegmentWriter(self.out_directory)
+        )
+
         self.is_first_run = True
+        self._is_set_up = False
+        self.manifest = None
+        self.stage_timer = (
+            stage_timer if stage_timer is not None else StageTimer(enabled=False)
+        )
 
     def setup(self) -> None:
         self.logger.debug("Setting up")
@@ -52,6 +77,8 @@ class FileArchiver(LoopingThread):
             create_directory_if_not_exists(self.out_directory)
         with self._archive_access_lock:
             create_directory_if_not_exists(self.archive_directory)
+            self.manifest = self.__open_manifest()
+        self._is_set_up = True
         self.logger.debug("Finished Setting Up")
 
     def loop(self) -> None:
@@ -62,23 +89,67 @@ class FileArchiver(LoopingThread):
 
         self.logger.debug("Starting archival of log files")
 
-        file_counter = 0
-        with self._log_file_access_lock, self._archive_access_lock:
-            for file_name in os.listdir(self.out_directory):
-                if file_name.endswith(".csv"):
-                    self.__archive_log_file(os.path.join(self.out_directory, file_name))
-                    file_counter += 1
-        self.logger.info(f"Archived {file_counter} files")
+        # The querier seals its segments on its next write, they are archived by
+        # the next run
+        generation = self.segment_writer.request_rollover()
+        self.logger.debug(f"Requested segment rollover {generation}")
+        self.__archive_sealed_segments()
 
     def teardown(self) -> None:
-        pass
-
-    def __archive_log_file(self, file_path: str) -> None:
+        # Once the querier has stopped and closed the writer, the segments it was
+        # writing are sealed and archived now rather than on the next start
+        sealed_paths = self.segment_writer.seal_closed_segments()
+        if not self._is_set_up:
+            return
+        archived_count = self.__archive_sealed_segments()
+        self.logger.info(
+            f"Sealed {len(sealed_paths)} active segments and archived "
+            f"{archived_count} files on shutdown"
+        )
 
-        file_name, file_ext = os.path.splitext(os.path.basename(file_path))
-        time_str = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    def __archive_sealed_segments(self) -> int:
+        archived_file_paths = []
+        with self.stage_timer.stage("archive"), self._archive_access_lock:
+            for segment_path in self.segment_writer.sealed_segments():
+                archived_file_path = self.__archive_log_file(segment_path)
+                if archived_file_path is not None:
+                    archived_file_paths.append(archived_file_path)
+        self.logger.info(f"Archived {len(archived_file_paths)} files")
+
+        with self.stage_timer.stage("manifest"), self._archive_access_lock:
+            for archived_file_path in archived_file_paths:
+                self.__record_in_manifest(archived_file_path)
+        self.stage_timer.maybe_emit(self.logger)
+        return len(archived_file_paths)
+
+    def __open_manifest(self) -> Optional[ArchiveManifest]:
+        manifest_path = os.path.join(self.archive_directory, MANIFEST_FILE_NAME)
+        is_new_manifest = not os.path.exists(manifest_path)
+        manifest = ArchiveManifest(self.archive_directory)
+        if not is_new_manifest:
+            return manifest
+        try:
+            file_counter = manifest.rebuild()
+        except Exception as e:
+            # Files are still archived, and the manifest is built again from all
+            # of them on the next start
+            self.logger.exception(f"Failed to build the archive manifest: {e}")
+            os.remove(manifest_path)
+            return None
+        self.logger.info(f"Built archive manifest of {file_counter} files")
+        return manifest
+
+    def __record_in_manifest(self, file_path: str) -> None:
+        if self.manifest is None:
+            return
+        try:
+            self.manifest.record(file_path)
+        except Exception as e:
+            self.logger.exception(f"Failed to add {file_path} to the manifest: {e}")
 
-        new_file = f"{file_name}-{time_str}{file_ext}"
+    def __archive_log_file(self, file_path: str) -> Optional[str]:
+        # Sealed segments are already named after the time they were sealed
+        new_file = os.path.basename(file_path)[: -len(SEALED_SEGMENT_EXTENSION)]
 
         destination_file_path = os.path.join(self.archive_directory, new_file)
         self.logger.debug(
@@ -88,6 +159,7 @@ class FileArchiver(LoopingThread):
             self.logger.warning(
                 f"File {destination_file_path} already exists. Skipping..."
             )
-            return
+            return None
 
         os.rename(file_path, destination_file_path)
+        return destination_file_path
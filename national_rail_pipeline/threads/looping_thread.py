@@ -38,6 +38,8 @@ class LoopingThread(threading.Thread):
             else self.interval_timeout / 10
         )
         self.last_run_time = 0
+        # Set to a LoopProfiler to profile the first cycles of the loop
+        self.profiler = None
 
     def get_stop_event(self) -> bool:
         with self.stop_event_lock:
@@ -51,6 +53,23 @@ class LoopingThread(threading.Thread):
         with self.stop_event_lock:
             self.stop_event.clear()
 
+    def set_interval(
+        self, interval_timeout: float, required_precision: Optional[float] = None
+    ) -> None:
+        """Changes the interval of a running thread, effective from the next run.
+
+        Args:
+            interval_timeout (float): Interval this thread will use to run.
+            required_precision (float, optional): The required precision for
+                the interval. If set to None, defaults to 1/10 of the interval.
+        """
+        self.required_precision = (
+            required_precision
+            if required_precision is not None
+            else interval_timeout / 10
+        )
+        self.interval_timeout = interval_timeout
+
     def stop(self) -> None:
         self.set_stop_event()
         self.logger.debug("Thread stopped externally.")
@@ -98,7 +117,10 @@ class LoopingThread(threading.Thread):
 
             self.last_run_time = time.time()
             try:
-                self.loop()
+                if self.profiler is not None:
+                    self.profiler.run(self.loop)
+                else:
+                    self.loop()
             except Exception as e:
                 self.logger.exception(e)
                 try:
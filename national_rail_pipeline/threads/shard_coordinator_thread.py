@@ -0,0 +1,128 @@
+from national_rail_pipeline.threads.looping_thread import LoopingThread
+from national_rail_pipeline.threads.departures_querier_thread import DeparturesQuerier
+
+from national_rail_pipeline.utils.sharding import ConsistentHashRing, ShardLeaseTable
+
+import time
+from threading import Lock
+from typing import List, Optional
+
+
+class ShardCoordinator(LoopingThread):
+    def __init__(
+        self,
+        worker_id: str,
+        crs_codes: List[str],
+        departures_querier: DeparturesQuerier,
+        coordination_db_path: str,
+        interval_timeout: float,
+        lease_seconds: Optional[float] = None,
+        required_precision: Optional[float] = None,
+        name: str = "ShardCoordinator",
+    ):
+        """Periodically renews this worker's lease in the coordination database and
+        hands the worker's share of the stations to its DeparturesQuerier.
+        Shares are decided by a consistent hash ring over the live workers, so
+        they are rebalanced whenever a worker joins or its lease expires.
+
+        Args:
+            worker_id (str): Identifier of this worker, unique across the host
+            crs_codes (List[str]): CRS codes of every station to be covered
+            departures_querier (DeparturesQuerier): Querier polling this shard
+            coordination_db_path (str): Path of the SQLite coordination database
+            interval_timeout (float): Interval between lease renewals in seconds
+            lease_seconds (float, optional): How long a lease lasts without renewal.
+                If set to None, defaults to three renewal intervals.
+            required_precision (float, optional): required precision for the interval
+        """
+        LoopingThread.__init__(
+            self,
+            name=name,
+            interval_timeout=interval_timeout,
+            required_precision=required_precision,
+            daemon=True,
+        )
+
+        self.worker_id = worker_id
+        self.crs_codes = crs_codes
+        self._departures_querier = departures_querier
+        self._lease_table = ShardLeaseTable(
+            coordination_db_path,
+            lease_seconds if lease_seconds is not None else 3 * interval_timeout,
+        )
+        self.assigned_crs_codes: Optional[List[str]] = None
+        # Rebalances run on this thread and on the config watcher's
+        self._rebalance_lock = Lock()
+        self._last_renewed_at = time.monotonic()
+
+    def setup(self) -> None:
+        pass
+
+    def loop(self) -> None:
+        try:
+            self.rebalance()
+        except Exception as e:
+            # Such as the coordination database staying locked, retried on the
+            # next renewal
+            self.logger.exception(f"Failed to renew shard leases: {e}")
+            self.__drop_share_if_lease_expired()
+
+    def teardown(self) -> None:
+        self.logger.info(f"Releasing shard leases for {self.worker_id}")
+        self._lease_table.release(self.worker_id)
+
+    def update_crs_codes(self, crs_codes: List[str]) -> None:
+        """Replaces the stations to be covered and rebalances straight away.
+
+        Args:
+            crs_codes (List[str]): CRS codes of every station to be covered
+        """
+        self.crs_codes = list(crs_codes)
+        self.rebalance()
+
+    def rebalance(self) -> List[str]:
+        """Renews this worker's leases and applies any change in its share.
+
+        Returns:
+            List[str]: CRS codes this worker now polls
+        """
+        with self._rebalance_lock:
+            live_workers = self._lease_table.heartbeat(self.worker_id)
+            ring = ConsistentHashRing(live_workers)
+            assigned_crs_codes = ring.assign(self.crs_codes)[self.worker_id]
+            self._lease_table.claim(self.worker_id, assigned_crs_codes)
+            self._last_renewed_at = time.monotonic()
+
+            if assigned_crs_codes != self.assigned_crs_codes:
+                self.logger.info(
+                    f"Worker {self.worker_id} now polls {len(assigned_crs_codes)} "
+                    f"of {len(self.crs_codes)} stations across "
+                    f"{len(live_workers)} workers"
+                )
+                self._departures_querier.update_crs_codes(assigned_crs_codes)
+                self.assigned_crs_codes = assigned_crs_codes
+
+        coverage = self._lease_table.coverage(self.crs_codes)
+        self.logger.debug(f"Shard load: {coverage['load']}")
+        if coverage["uncovered"]:
+            self.logger.warning(
+                f"{len(coverage['uncovered'])} stations have no live lease: "
+                f"{coverage['uncovered']}"
+            )
+        return assigned_crs_codes
+
+    def __drop_share_if_lease_expired(self) -> None:
+        # Once the leases have expired other workers take the stations over, so
+        # this worker stops polling them until it can renew again
+        with self._rebalance_lock:
+            lease_age = time.monotonic() - self._last_renewed_at
+            if not self.assigned_crs_codes or (
+                lease_age < self._lease_table.lease_seconds
+            ):
+                return
+            self.logger.error(
+                f"Shard leases of {self.worker_id} expired {lease_age:.0f}s after "
+                "the last renewal, pausing its stations"
+            )
+            self._departures_querier.update_crs_codes([])
+            self.assigned_crs_codes = []
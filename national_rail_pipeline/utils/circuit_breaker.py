@@ -0,0 +1,200 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from marshmallow import ValidationError
+from requests.exceptions import ConnectionError, Timeout
+from zeep.exceptions import Fault, TransportError
+
+FAILURE_TRANSIENT = "transient"
+FAILURE_SOAP_FAULT = "soap_fault"
+FAILURE_VALIDATION = "validation"
+FAILURE_EMPTY_BOARD = "empty_board"
+FAILURE_UNKNOWN = "unknown"
+
+# Consecutive failures of each kind before the circuit opens. A SOAP fault usually
+# means a bad CRS code, so it opens straight away, while a network blip is retried.
+FAILURE_THRESHOLDS = {
+    FAILURE_TRANSIENT: 3,
+    FAILURE_SOAP_FAULT: 1,
+    FAILURE_VALIDATION: 2,
+    FAILURE_EMPTY_BOARD: 1,
+    FAILURE_UNKNOWN: 3,
+}
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+def classify_exception(exception: Exception) -> str:
+    """Maps an exception raised while querying a station to a failure kind.
+
+    Args:
+        exception (Exception): Exception raised by the API call or validation
+
+    Returns:
+        str: One of the FAILURE_* kinds
+    """
+    if isinstance(exception, Fault):
+        return FAILURE_SOAP_FAULT
+    if isinstance(exception, ValidationError):
+        return FAILURE_VALIDATION
+    if isinstance(exception, (TransportError, ConnectionError, Timeout, OSError)):
+        return FAILURE_TRANSIENT
+    return FAILURE_UNKNOWN
+
+
+class StationCircuitBreaker:
+    def __init__(
+        self,
+        base_backoff_seconds: float = 60,
+        max_backoff_seconds: float = 3600,
+        empty_board_max_backoff_seconds: float = 900,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Tracks the failures of a single station.
+        Once the failure threshold for a kind of failure is reached the circuit
+        opens and the station is skipped until its backoff expires.  The circuit
+        then half-opens to let one probe request through; success closes it again
+        and failure reopens it with twice the backoff.  A probe which reports
+        neither within the backoff is given up on and another is let through.
+
+        Args:
+            base_backoff_seconds (float, optional): Backoff after the first trip
+            max_backoff_seconds (float, optional): Upper bound for the backoff
+            empty_board_max_backoff_seconds (float, optional): Upper bound for the
+                backoff after empty boards, which are expected overnight
+            clock (Callable[[], float], optional): Source of the current time
+        """
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.empty_board_max_backoff_seconds = empty_board_max_backoff_seconds
+        self._clock = clock
+
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.last_failure_kind: Optional[str] = None
+        self.trip_count = 0
+        self.backoff_seconds = 0.0
+        self.open_until = 0.0
+
+    def allow_request(self) -> bool:
+        if self.state == STATE_CLOSED:
+            return True
+        now = self._clock()
+        if now < self.open_until:
+            return False
+        # Either the backoff has expired or the last probe never reported back,
+        # in which case waiting for it would skip the station forever
+        self.state = STATE_HALF_OPEN
+        self.open_until = now + self.backoff_seconds
+        return True
+
+    def record_success(self) -> None:
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.last_failure_kind = None
+        self.trip_count = 0
+
+    def record_failure(self, failure_kind: str) -> None:
+        self.consecutive_failures += 1
+        self.last_failure_kind = failure_kind
+        if (
+            self.state == STATE_HALF_OPEN
+            or self.consecutive_failures >= FAILURE_THRESHOLDS[failure_kind]
+        ):
+            self.__trip(failure_kind)
+
+    def __trip(self, failure_kind: str) -> None:
+        max_backoff_seconds = self.max_backoff_seconds
+        if failure_kind == FAILURE_EMPTY_BOARD:
+            max_backoff_seconds = min(
+                max_backoff_seconds, self.empty_board_max_backoff_seconds
+            )
+        backoff_seconds = min(
+            max_backoff_seconds, self.base_backoff_seconds * 2 ** self.trip_count
+        )
+        # Jitter keeps stations which failed together from probing together
+        backoff_seconds *= random.uniform(0.9, 1.1)
+
+        self.trip_count += 1
+        self.state = STATE_OPEN
+        self.backoff_seconds = backoff_seconds
+        self.open_until = self._clock() + backoff_seconds
+
+
+class StationHealthRegistry:
+    def __init__(
+        self,
+        base_backoff_seconds: float = 60,
+        max_backoff_seconds: float = 3600,
+        empty_board_max_backoff_seconds: float = 900,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Holds a circuit breaker per station so that broken stations are backed
+        off independently of healthy ones.
+
+        Args:
+            base_backoff_seconds (float, optional): Backoff after the first trip
+            max_backoff_seconds (float, optional): Upper bound for the backoff
+            empty_board_max_backoff_seconds (float, optional): Upper bound for the
+                backoff after empty boards
+            clock (Callable[[], float], optional): Source of the current time
+        """
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.empty_board_max_backoff_seconds = empty_board_max_backoff_seconds
+        self._clock = clock
+        # Stations are forgotten from the config watcher and shard coordinator
+        # threads while the querier's threads look them up
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, StationCircuitBreaker] = {}
+
+    def breaker(self, crs: str) -> StationCircuitBreaker:
+        with self._lock:
+            if crs not in self._breakers:
+                self._breakers[crs] = StationCircuitBreaker(
+                    base_backoff_seconds=self.base_backoff_seconds,
+                    max_backoff_seconds=self.max_backoff_seconds,
+                    empty_board_max_backoff_seconds=(
+                        self.empty_board_max_backoff_seconds
+                    ),
+                    clock=self._clock,
+                )
+            return self._breakers[crs]
+
+    def allow_request(self, crs: str) -> bool:
+        return self.breaker(crs).allow_request()
+
+    def record_success(self, crs: str) -> None:
+        self.breaker(crs).record_success()
+
+    def record_failure(self, crs: str, failure_kind: str) -> None:
+        self.breaker(crs).record_failure(failure_kind)
+
+    def forget(self, crs: str) -> None:
+        with self._lock:
+            self._breakers.pop(crs, None)
+
+    def unhealthy_stations(self) -> Dict[str, Dict]:
+        """Summarises every station whose circuit is not closed.
+
+        Returns:
+            Dict[str, Dict]: State, last failure kind and seconds until the next
+                probe for each unhealthy station
+        """
+        now = self._clock()
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return {
+            crs: {
+                "state": breaker.state,
+                "last_failure_kind": breaker.last_failure_kind,
+                "consecutive_failures": breaker.consecutive_failures,
+                "retry_in_seconds": max(0.0, round(breaker.open_until - now, 1)),
+            }
+            for crs, breaker in breakers
+            if breaker.state != STATE_CLOSED
+        }
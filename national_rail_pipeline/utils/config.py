@@ -1,10 +1,48 @@
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 import logging
+import numbers
 
 from dotenv import load_dotenv
 
 from national_rail_pipeline.utils.parsers import YAMLParser, ArgParser
-from national_rail_pipeline.utils.exceptions import NoFileSpecified
+from national_rail_pipeline.utils.exceptions import InvalidConfigError, NoFileSpecified
+
+POSITIVE_NUMBER_KEYS = (
+    "QUERY_FREQUENCY_SECONDS",
+    "QUERY_FREQUENCY_PRECISION_SECONDS",
+    "LOG_FILE_ROLLOVER_PERIOD_SECONDS",
+    "LOG_FILE_ROLLOVER_PERIOD_PRECISION_SECONDS",
+    "NETWORK_STATE_MEMORY_MB",
+    "SERVICE_DETAILS_TTL_SECONDS",
+    "SEGMENT_GROUP_COMMIT_MS",
+    "SHUTDOWN_DEADLINE_SECONDS",
+    "DECODE_PROCESSES",
+)
+
+
+def validate_run_config(run_config: Dict) -> None:
+    """Checks the values which can be changed while the application is running.
+
+    Args:
+        run_config (Dict): The parsed yaml configuration
+
+    Raises:
+        InvalidConfigError: If a value is of the wrong type or out of range
+    """
+    stations = run_config.get("STATIONS_TO_QUERY")
+    if stations is not None and (
+        not isinstance(stations, list)
+        or not all(isinstance(crs, str) and len(crs) == 3 for crs in stations)
+    ):
+        raise InvalidConfigError("STATIONS_TO_QUERY must be a list of CRS codes")
+    for key in POSITIVE_NUMBER_KEYS:
+        value = run_config.get(key)
+        if value is not None and (
+            not isinstance(value, numbers.Number)
+            or isinstance(value, bool)
+            or value <= 0
+        ):
+            raise InvalidConfigError(f"{key} must be a positive number")
 
 
 class Config:
@@ -23,6 +61,31 @@ class Config:
         self._logger = None
         self._load_dotenv(self.command_line_args.dotenv)
 
+    @property
+    def config_path(self) -> Optional[str]:
+        return self.command_line_args.config
+
+    def reload(self) -> Dict[str, Any]:
+        """Re-reads the yaml configuration and replaces the run config if it is valid.
+
+        Raises:
+            InvalidConfigError: If the new configuration is invalid, in which case
+                the current run config is kept
+
+        Returns:
+            Dict[str, Any]: The keys whose values changed, mapped to their new
+                values. Removed keys map to None.
+        """
+        run_config = self._parse_yaml_config_and_apply_overwrites()
+        validate_run_config(run_config)
+        changes = {
+            key: run_config.get(key)
+            for key in set(run_config) | set(self.run_config)
+            if run_config.get(key) != self.run_config.get(key)
+        }
+        self.run_config = run_config
+        return changes
+
     def log_config(self):
         if self._logger is None:
             self._logger = logging.getLogger(__name__)
@@ -91,19 +154,65 @@ class Config:
             help="The path where data is logged by the application",
         )
 
+        command_line_parser.add_argument(
+            "--worker-id",
+            default=None,
+            action="store",
+            type=str,
+            required=False,
+            help="Identifies this worker when the station list is sharded across\
+                  several workers. Must stay the same across restarts.",
+        )
+
+        command_line_parser.add_argument(
+            "--profile",
+            default=None,
+            action="store",
+            choices=["cprofile", "sampling"],
+            required=False,
+            help="Profiles the first cycles of the worker threads with cProfile or\
+                  a sampling profiler and dumps the stats to --profile-dir",
+        )
+
+        command_line_parser.add_argument(
+            "--profile-cycles",
+            default=10,
+            action="store",
+            type=int,
+            required=False,
+            help="The number of loop cycles to profile when --profile is set",
+        )
+
+        command_line_parser.add_argument(
+            "--profile-dir",
+            default="profiles",
+            action="store",
+            type=str,
+            required=False,
+            help="The path where profiler stats files are written",
+        )
+
         return command_line_parser
 
     def _parse_yaml_config(self) -> Dict:
+        config_path = self._command_line_parser.get_args().config
         try:
-            return YAMLParser().read_yaml(
-                filepath=self._command_line_parser.get_args().config
-            )
+            run_config = YAMLParser().read_yaml(filepath=config_path)
         except NoFileSpecified:
             return {}
+        # An empty file, such as while an editor is saving it, parses to None
+        if not isinstance(run_config, dict):
+            raise InvalidConfigError(
+                f"{config_path} must hold a mapping of configuration keys"
+            )
+        return run_config
 
     def _parse_yaml_config_and_apply_overwrites(self) -> Dict:
         run_config = self._parse_yaml_config()
         # Overwrite Log Dir from cli arguments
         if self.command_line_args.logdir is not None:
             run_config["LOG_FILE_DIRECTORY"] = self.command_line_args.logdir
+        # Overwrite Shard Worker ID from cli arguments
+        if self.command_line_args.worker_id is not None:
+            run_config["SHARD_WORKER_ID"] = self.command_line_args.worker_id
         return run_config
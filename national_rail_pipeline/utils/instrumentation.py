@@ -0,0 +1,290 @@
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import nullcontext
+from typing import Callable, Deque, Dict, Iterable, Set
+
+PROFILE_CPROFILE = "cprofile"
+PROFILE_SAMPLING = "sampling"
+PROFILE_MODES = (PROFILE_CPROFILE, PROFILE_SAMPLING)
+
+_NULL_CONTEXT = nullcontext()
+
+
+class _StageContext:
+    __slots__ = ("_timer", "_name", "_start")
+
+    def __init__(self, timer: "StageTimer", name: str):
+        self._timer = timer
+        self._name = name
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self._timer.record(self._name, time.perf_counter() - self._start)
+
+
+class StageTimer:
+    def __init__(
+        self,
+        enabled: bool = True,
+        window: int = 1000,
+        emit_interval_seconds: float = 60,
+    ):
+        """Times named pipeline stages and keeps a rolling window of durations per
+        stage from which percentiles are reported.  When disabled, stage() hands
+        back a shared no-op context so timing costs nothing.
+
+        Args:
+            enabled (bool, optional): Whether to record timings
+            window (int, optional): Number of recent durations kept per stage
+            emit_interval_seconds (float, optional): Minimum interval between
+                reports logged by maybe_emit
+        """
+        self.enabled = enabled
+        self.window = window
+        self.emit_interval_seconds = emit_interval_seconds
+        self._durations: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._last_emit_time = time.monotonic()
+
+    def stage(self, name: str):
+        """Returns a context manager timing the enclosed block as the given stage."""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _StageContext(self, name)
+
+    def record(self, name: str, seconds: float) -> None:
+        durations = self._durations.get(name)
+        if durations is None:
+            with self._lock:
+                durations = self._durations.setdefault(
+                    name, deque(maxlen=self.window)
+                )
+        durations.append(seconds)
+
+    def percentiles(self) -> Dict[str, Dict[str, float]]:
+        """Summarises the rolling window of each stage.
+
+        Returns:
+            Dict[str, Dict[str, float]]: Count, p50, p90, p99 and max in
+                milliseconds per stage
+        """
+        with self._lock:
+            stages = list(self._durations.items())
+        summary = {}
+        for name, durations in stages:
+            ordered = sorted(durations)
+            if not ordered:
+                continue
+            summary[name] = {
+                "count": len(ordered),
+                "p50_ms": round(1000 * _percentile(ordered, 0.5), 3),
+                "p90_ms": round(1000 * _percentile(ordered, 0.9), 3),
+                "p99_ms": round(1000 * _percentile(ordered, 0.99), 3),
+                "max_ms": round(1000 * ordered[-1], 3),
+            }
+        return summary
+
+    def maybe_emit(self, logger: logging.Logger) -> None:
+        """Logs the stage percentiles if the emit interval has passed."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now - self._last_emit_time < self.emit_interval_seconds:
+            return
+        self._last_emit_time = now
+        logger.info("Stage timings: %s", self.percentiles())
+
+
+def _percentile(ordered, fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _SamplingProfiler:
+    def __init__(
+        self, thread_ids: Callable[[], Iterable[int]], interval_seconds: float
+    ):
+        """Periodically records the stacks of some threads from a background thread.
+        thread_ids is called before each sample for the threads to record."""
+        self._thread_ids = thread_ids
+        self._interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+        self.stack_counts = Counter()
+        self._thread = threading.Thread(
+            target=self.__sample, name="SamplingProfiler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+
+    def __sample(self) -> None:
+        while not self._stop_event.wait(self._interval_seconds):
+            frames = sys._current_frames()
+            for thread_id in self._thread_ids():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{os.path.basename(code.co_filename)}:{code.co_name}"
+                        f":{frame.f_lineno}"
+                    )
+                    frame = frame.f_back
+                if stack:
+                    self.stack_counts[";".join(reversed(stack))] += 1
+
+
+class LoopProfiler:
+    def __init__(
+        self,
+        mode: str,
+        cycles: int,
+        out_directory: str,
+        name: str,
+        sampling_interval_seconds: float = 0.005,
+    ):
+        """Profiles the first cycles of a LoopingThread and dumps the stats to a
+        file.  cProfile output can be read with pstats or snakeviz, and the
+        sampling profiler writes collapsed stacks for flame graph tools.
+        Handlers run through run_handler by the loop's stage workers are
+        profiled along with the loop thread.
+
+        Args:
+            mode (str): Either "cprofile" or "sampling"
+            cycles (int): Number of loop cycles to profile
+            out_directory (str): Directory the stats file is written to
+            name (str): Name used for the stats file
+            sampling_interval_seconds (float, optional): Interval between samples
+                in sampling mode
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode}")
+        self.mode = mode
+        self.cycles = cycles
+        self.out_directory = out_directory
+        self.name = name
+        self.sampling_interval_seconds = sampling_interval_seconds
+        self.completed_cycles = 0
+        self._profile = cProfile.Profile() if mode == PROFILE_CPROFILE else None
+        self._stack_counts = Counter()
+        self._cycle_running = False
+        self._loop_thread_id = None
+        # cProfile only profiles the thread which enabled it, so each stage worker
+        # gets its own profile, merged with the loop's when dumped
+        self._handlers_done = threading.Condition()
+        self._running_handlers = 0
+        self._worker_profiles: Dict[int, cProfile.Profile] = {}
+        self._sampled_thread_ids: Set[int] = set()
+
+    @property
+    def is_active(self) -> bool:
+        return self.completed_cycles < self.cycles
+
+    def run(self, loop: Callable[[], None]) -> None:
+        """Runs one loop cycle, profiling it while profiling cycles remain."""
+        if not self.is_active:
+            loop()
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._cycle_running = True
+        try:
+            if self._profile is not None:
+                self._profile.enable()
+                try:
+                    loop()
+                finally:
+                    self._profile.disable()
+            else:
+                sampler = _SamplingProfiler(
+                    self.__sampled_thread_ids, self.sampling_interval_seconds
+                )
+                sampler.start()
+                try:
+                    loop()
+                finally:
+                    sampler.stop()
+                    self._stack_counts.update(sampler.stack_counts)
+        finally:
+            self._cycle_running = False
+
+        self.completed_cycles += 1
+        if not self.is_active:
+            # Handlers still running, such as writes the loop does not wait for,
+            # must leave their profiles before they are read
+            with self._handlers_done:
+                self._handlers_done.wait_for(lambda: self._running_handlers == 0)
+            self.dump()
+
+    def run_handler(self, handler: Callable, *args) -> None:
+        """Runs a handler on a stage worker thread of the profiled loop, profiling
+        it if it starts while a profiled cycle is running."""
+        if not self._cycle_running:
+            handler(*args)
+            return
+
+        thread_id = threading.get_ident()
+        with self._handlers_done:
+            self._running_handlers += 1
+            if self._profile is not None:
+                profile = self._worker_profiles.setdefault(
+                    thread_id, cProfile.Profile()
+                )
+            else:
+                self._sampled_thread_ids.add(thread_id)
+        try:
+            if self._profile is not None:
+                profile.enable()
+                try:
+                    handler(*args)
+                finally:
+                    profile.disable()
+            else:
+                handler(*args)
+        finally:
+            with self._handlers_done:
+                self._running_handlers -= 1
+                self._sampled_thread_ids.discard(thread_id)
+                self._handlers_done.notify_all()
+
+    def __sampled_thread_ids(self) -> Iterable[int]:
+        with self._handlers_done:
+            return [self._loop_thread_id, *self._sampled_thread_ids]
+
+    def dump(self) -> str:
+        """Writes the collected stats.
+
+        Returns:
+            str: Path of the stats file
+        """
+        os.makedirs(self.out_directory, exist_ok=True)
+        time_str = time.strftime("%Y-%m-%d-%H-%M-%S")
+        if self._profile is not None:
+            file_path = os.path.join(
+                self.out_directory, f"{self.name}-{time_str}.prof"
+            )
+            stats = pstats.Stats(self._profile)
+            with self._handlers_done:
+                worker_profiles = list(self._worker_profiles.values())
+            if worker_profiles:
+                stats.add(*worker_profiles)
+            stats.dump_stats(file_path)
+        else:
+            file_path = os.path.join(
+                self.out_directory, f"{self.name}-{time_str}.folded"
+            )
+            with open(file_path, "w") as stats_file:
+                for stack, count in self._stack_counts.most_common():
+                    stats_file.write(f"{stack} {count}\n")
+        return file_path
@@ -0,0 +1,194 @@
+import fcntl
+import heapq
+import itertools
+import os
+import struct
+import threading
+import time
+from typing import Dict, Optional
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+PRIORITY_CLASSES = {
+    "high": PRIORITY_HIGH,
+    "normal": PRIORITY_NORMAL,
+    "low": PRIORITY_LOW,
+}
+
+RATE_LIMIT_ENV = "LDB_RATE_LIMIT_PER_SECOND"
+BURST_ENV = "LDB_RATE_LIMIT_BURST"
+STATE_FILE_ENV = "LDB_RATE_LIMIT_STATE_FILE"
+
+_BUCKET_STATE = struct.Struct("<dd")
+
+
+class RateLimiterMetrics:
+    def __init__(self):
+        """Counts requests and the time spent waiting for tokens per priority class."""
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def record(self, priority: int, waited_seconds: float, throttled: bool) -> None:
+        with self._lock:
+            metrics = self._metrics.setdefault(
+                priority,
+                {
+                    "requests": 0,
+                    "throttled_requests": 0,
+                    "total_wait_seconds": 0.0,
+                    "max_wait_seconds": 0.0,
+                },
+            )
+            metrics["requests"] += 1
+            # waited_seconds is never quite zero, as taking a token takes time
+            if throttled:
+                metrics["throttled_requests"] += 1
+                metrics["total_wait_seconds"] += waited_seconds
+                metrics["max_wait_seconds"] = max(
+                    metrics["max_wait_seconds"], waited_seconds
+                )
+
+    def snapshot(self) -> Dict[int, Dict[str, float]]:
+        with self._lock:
+            return {priority: dict(m) for priority, m in self._metrics.items()}
+
+
+class _MemoryBucketState:
+    def __init__(self, capacity: float):
+        self._tokens = capacity
+        self._last_refill = time.time()
+
+    def try_take(self, rate: float, capacity: float) -> float:
+        now = time.time()
+        self._tokens = min(capacity, self._tokens + (now - self._last_refill) * rate)
+        self._last_refill = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / rate
+
+
+class _FileBucketState:
+    def __init__(self, file_path: str, capacity: float):
+        """Keeps the bucket in a small file guarded by flock so that every process
+        on the host using the same file draws from the same bucket."""
+        self.file_path = file_path
+        self._capacity = capacity
+
+    def try_take(self, rate: float, capacity: float) -> float:
+        fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.time()
+            raw_state = os.pread(fd, _BUCKET_STATE.size, 0)
+            if len(raw_state) == _BUCKET_STATE.size:
+                tokens, last_refill = _BUCKET_STATE.unpack(raw_state)
+            else:
+                tokens, last_refill = self._capacity, now
+            tokens = min(capacity, tokens + max(0.0, now - last_refill) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            os.pwrite(fd, _BUCKET_STATE.pack(tokens, now), 0)
+            return wait
+        finally:
+            os.close(fd)
+
+
+class TokenBucketRateLimiter:
+    def __init__(
+        self,
+        rate_per_second: float,
+        capacity: Optional[float] = None,
+        state_file: Optional[str] = None,
+    ):
+        """A thread safe token bucket limiting the rate of API requests.
+        Waiting callers are served in priority order, so requests for hot
+        stations win when the bucket is contended.  If a state file is given the
+        bucket is shared with every other process on the host using that file.
+
+        Args:
+            rate_per_second (float): Rate at which tokens are added to the bucket
+            capacity (float, optional): Maximum number of tokens held, which sets
+                the burst size. If set to None, defaults to one second of tokens.
+            state_file (str, optional): Path of a file to share the bucket through
+        """
+        if rate_per_second <= 0:
+            raise ValueError("rate_per_second must be positive")
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_second)
+        if state_file is None:
+            self._state = _MemoryBucketState(self.capacity)
+        else:
+            self._state = _FileBucketState(state_file, self.capacity)
+
+        self.metrics = RateLimiterMetrics()
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    def acquire(self, priority: int = PRIORITY_NORMAL) -> float:
+        """Blocks until a token is available for the caller.
+
+        Args:
+            priority (int, optional): Priority class, lower values are served first
+
+        Returns:
+            float: Seconds spent waiting for the token
+        """
+        start = time.monotonic()
+        ticket = (priority, next(self._sequence))
+        throttled = False
+        with self._condition:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiters[0] == ticket:
+                        timeout = self._state.try_take(
+                            self.rate_per_second, self.capacity
+                        )
+                        if timeout <= 0:
+                            break
+                    throttled = True
+                    self._condition.wait(timeout)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+        waited_seconds = time.monotonic() - start
+        self.metrics.record(priority, waited_seconds, throttled)
+        return waited_seconds
+
+
+_shared_rate_limiter_lock = threading.Lock()
+_shared_rate_limiter: Optional[TokenBucketRateLimiter] = None
+
+
+def get_shared_rate_limiter() -> Optional[TokenBucketRateLimiter]:
+    """Returns the process wide rate limiter configured through the environment.
+    LDB_RATE_LIMIT_PER_SECOND enables the limiter, LDB_RATE_LIMIT_BURST sets the
+    bucket capacity and LDB_RATE_LIMIT_STATE_FILE shares the bucket between
+    processes.
+
+    Returns:
+        Optional[TokenBucketRateLimiter]: The limiter, or None if it is not enabled
+    """
+    global _shared_rate_limiter
+    rate = os.environ.get(RATE_LIMIT_ENV)
+    if not rate:
+        return None
+    with _shared_rate_limiter_lock:
+        if _shared_rate_limiter is None:
+            burst = os.environ.get(BURST_ENV)
+            _shared_rate_limiter = TokenBucketRateLimiter(
+                rate_per_second=float(rate),
+                capacity=float(burst) if burst else None,
+                state_file=os.environ.get(STATE_FILE_ENV) or None,
+            )
+        return _shared_rate_limiter
@@ -0,0 +1,145 @@
+import bisect
+import hashlib
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List
+
+
+def _ring_position(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    def __init__(self, worker_ids: Iterable[str], replicas: int = 64):
+        """Maps CRS codes onto workers so that a worker joining or leaving only
+        moves the codes it gains or loses, rather than reshuffling every code.
+
+        Args:
+            worker_ids (Iterable[str]): Identifiers of the live workers
+            replicas (int, optional): Virtual nodes per worker, more gives an
+                evener spread of codes
+        """
+        self.worker_ids = sorted(set(worker_ids))
+        self._ring = sorted(
+            (_ring_position(f"{worker_id}#{replica}"), worker_id)
+            for worker_id in self.worker_ids
+            for replica in range(replicas)
+        )
+        self._positions = [position for position, _ in self._ring]
+
+    def worker_for(self, crs: str) -> str:
+        if not self._ring:
+            raise LookupError("No live workers on the hash ring")
+        index = bisect.bisect(self._positions, _ring_position(crs)) % len(self._ring)
+        return self._ring[index][1]
+
+    def assign(self, crs_codes: Iterable[str]) -> Dict[str, List[str]]:
+        assignment = {worker_id: [] for worker_id in self.worker_ids}
+        for crs in crs_codes:
+            assignment[self.worker_for(crs)].append(crs)
+        return assignment
+
+
+class ShardLeaseTable:
+    def __init__(self, db_path: str, lease_seconds: float):
+        """Coordinates workers through a small SQLite database on the shared host.
+        Each worker holds a heartbeat lease on its membership and a lease per CRS
+        code it polls.  Workers whose heartbeat lease expires are dropped from the
+        hash ring and their codes move to the remaining workers.
+
+        Args:
+            db_path (str): Path of the SQLite coordination database
+            lease_seconds (float): How long a lease lasts without being renewed
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS shard_workers ("
+                "worker_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS shard_leases ("
+                "crs TEXT PRIMARY KEY, worker_id TEXT NOT NULL, "
+                "expires_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def heartbeat(self, worker_id: str) -> List[str]:
+        """Renews the membership lease of a worker and expires dead workers.
+
+        Args:
+            worker_id (str): Identifier of the calling worker
+
+        Returns:
+            List[str]: Identifiers of every live worker
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO shard_workers VALUES (?, ?)",
+                (worker_id, now + self.lease_seconds),
+            )
+            connection.execute("DELETE FROM shard_workers WHERE expires_at < ?", (now,))
+            connection.execute("DELETE FROM shard_leases WHERE expires_at < ?", (now,))
+            rows = connection.execute("SELECT worker_id FROM shard_workers").fetchall()
+        return [worker_id for (worker_id,) in rows]
+
+    def claim(self, worker_id: str, crs_codes: List[str]) -> None:
+        """Takes the leases for a worker's codes and releases any it no longer owns.
+
+        Args:
+            worker_id (str): Identifier of the calling worker
+            crs_codes (List[str]): Every code the worker now polls
+        """
+        expires_at = time.time() + self.lease_seconds
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM shard_leases WHERE worker_id = ?", (worker_id,)
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO shard_leases VALUES (?, ?, ?)",
+                [(crs, worker_id, expires_at) for crs in crs_codes],
+            )
+
+    def release(self, worker_id: str) -> None:
+        """Drops a worker and its leases so its codes move on straight away."""
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM shard_leases WHERE worker_id = ?", (worker_id,)
+            )
+            connection.execute(
+                "DELETE FROM shard_workers WHERE worker_id = ?", (worker_id,)
+            )
+
+    def coverage(self, crs_codes: Iterable[str]) -> Dict:
+        """Reports which codes are leased and how many each worker holds.
+
+        Args:
+            crs_codes (Iterable[str]): Every code which should be polled
+
+        Returns:
+            Dict: The per worker load and the codes nobody holds a lease for
+        """
+        now = time.time()
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT crs, worker_id FROM shard_leases WHERE expires_at >= ?", (now,)
+            ).fetchall()
+        leased = dict(rows)
+        load = {}
+        for worker_id in leased.values():
+            load[worker_id] = load.get(worker_id, 0) + 1
+        return {
+            "load": load,
+            "uncovered": sorted(crs for crs in crs_codes if crs not in leased),
+        }
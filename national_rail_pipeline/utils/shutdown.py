@@ -0,0 +1,96 @@
+"""This module contains the supervisor which stops the application's threads when the
+process is asked to stop.  SIGTERM, which Docker sends on stop, and SIGINT both
+wake the main thread straight away instead of waiting out a sleep.
+
+Threads are stopped one at a time in the order given, each waiting for the one
+before it to finish its teardown, so the querier drains its in-flight boards into
+the segments before the archiver seals and archives them.  Every thread shares a
+single deadline, after which the remaining ones are left to die with the process.
+"""
+import logging
+import signal
+import threading
+import time
+from typing import Dict, List, Optional
+
+from national_rail_pipeline.threads.looping_thread import LoopingThread
+
+
+class ShutdownSupervisor:
+    def __init__(
+        self,
+        threads: List[LoopingThread],
+        deadline_seconds: float = 30,
+        logger: Optional[logging.Logger] = None,
+    ):
+        """Waits for a stop signal, then stops threads in order within a deadline.
+
+        Args:
+            threads (List[LoopingThread]): The threads in the order they should be
+                stopped, producers before the consumers they feed
+            deadline_seconds (float, optional): Time allowed for every thread to
+                finish its teardown
+            logger (logging.Logger, optional): Logger for the shutdown report
+        """
+        self.threads = threads
+        self.deadline_seconds = deadline_seconds
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self._stop_requested = threading.Event()
+        self._signal_name = None
+
+    def install_signal_handlers(self) -> None:
+        """Handles SIGTERM and SIGINT.  Must be called from the main thread."""
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signal_number, self.__handle_signal)
+
+    def request_stop(self, reason: str = "request") -> None:
+        if self._signal_name is None:
+            self._signal_name = reason
+        self._stop_requested.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until a stop is requested.
+
+        Returns:
+            bool: Whether a stop was requested, False if the timeout passed first
+        """
+        return self._stop_requested.wait(timeout)
+
+    def shutdown(self) -> Dict[str, Dict]:
+        """Stops the threads in order, giving each what is left of the deadline.
+
+        Returns:
+            Dict[str, Dict]: Per thread, whether it stopped in time and how long
+                it took
+        """
+        start = time.monotonic()
+        deadline = start + self.deadline_seconds
+        self.logger.info(
+            f"Stopping {len(self.threads)} threads after {self._signal_name}, "
+            f"deadline {self.deadline_seconds}s"
+        )
+        report = {}
+        for thread in self.threads:
+            thread_start = time.monotonic()
+            thread.stop()
+            if thread.is_alive():
+                thread.join(max(0, deadline - time.monotonic()))
+            stopped = not thread.is_alive()
+            report[thread.name] = {
+                "stopped": stopped,
+                "seconds": round(time.monotonic() - thread_start, 3),
+            }
+            if not stopped:
+                self.logger.error(
+                    f"Thread {thread.name} did not stop within the deadline"
+                )
+        self.logger.info(f"Shutdown took {time.monotonic() - start:.3f}s: {report}")
+        return report
+
+    def __handle_signal(self, signal_number, frame) -> None:
+        signal_name = signal.Signals(signal_number).name
+        if self._stop_requested.is_set():
+            self.logger.warning(f"Received {signal_name}, already shutting down")
+            return
+        self.logger.warning(f"Received {signal_name}, shutting down")
+        self.request_stop(signal_name)
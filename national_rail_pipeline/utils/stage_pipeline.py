@@ -0,0 +1,154 @@
+"""This module contains the building block of the querier's staged pipeline: a bounded
+queue drained by a fixed number of worker threads.  Stages are chained by having
+one stage's handler put items on the next.  When a stage falls behind its queue
+fills and put blocks, so back pressure reaches the producer instead of memory
+growing without bound.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+_STOP = object()
+
+
+class StageMetrics:
+    def __init__(self):
+        """Counters of a single stage, updated by its producers and workers."""
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.blocked_puts = 0
+        self.blocked_seconds = 0.0
+
+    def record_put(self, depth: int, blocked_seconds: Optional[float]) -> None:
+        with self._lock:
+            if depth > self.max_depth:
+                self.max_depth = depth
+            if blocked_seconds is not None:
+                self.blocked_puts += 1
+                self.blocked_seconds += blocked_seconds
+
+    def record_done(self, failed: bool) -> None:
+        with self._lock:
+            self.processed += 1
+            if failed:
+                self.failed += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "processed": self.processed,
+                "failed": self.failed,
+                "max_depth": self.max_depth,
+                "blocked_puts": self.blocked_puts,
+                "blocked_seconds": round(self.blocked_seconds, 3),
+            }
+
+
+class BoundedStage:
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], None],
+        concurrency: int = 1,
+        queue_size: int = 64,
+        logger: Optional[logging.Logger] = None,
+        idle_handler: Optional[Callable[[], None]] = None,
+        idle_seconds: float = 1,
+    ):
+        """A bounded queue of items processed by worker threads.
+
+        Args:
+            name (str): Name of the stage, used for its threads and metrics
+            handler (Callable[[Any], None]): Called by a worker for each item.
+                Exceptions are logged and counted as failures.
+            concurrency (int, optional): Number of worker threads
+            queue_size (int, optional): Items queued before put blocks
+            logger (logging.Logger, optional): Logger for handler exceptions
+            idle_handler (Callable[[], None], optional): Called by a worker when
+                no item arrived for idle_seconds
+            idle_seconds (float, optional): How long a worker waits before it is
+                considered idle
+        """
+        if concurrency < 1:
+            raise ValueError(f"Stage {name} needs at least one worker")
+        self.name = name
+        self.concurrency = concurrency
+        self.metrics = StageMetrics()
+        self._handler = handler
+        self._idle_handler = idle_handler
+        self._idle_seconds = idle_seconds
+        self._logger = logger if logger is not None else logging.getLogger(__name__)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads: List[threading.Thread] = []
+        # Set to the LoopProfiler of the loop feeding the stage to profile its
+        # handlers along with the loop
+        self.profiler = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        for index in range(self.concurrency):
+            thread = threading.Thread(
+                target=self.__work, name=f"{self.name}-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, item: Any) -> None:
+        """Queues an item, blocking while the queue is full."""
+        blocked_seconds = None
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            start = time.perf_counter()
+            self._queue.put(item)
+            blocked_seconds = time.perf_counter() - start
+        self.metrics.record_put(self._queue.qsize(), blocked_seconds)
+
+    def join(self) -> None:
+        """Waits until every queued item has been processed."""
+        self._queue.join()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Lets the workers finish the items already queued, then stops them."""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def metrics_snapshot(self) -> Dict[str, float]:
+        return {"depth": self.depth, **self.metrics.snapshot()}
+
+    def __work(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self._idle_seconds)
+            except queue.Empty:
+                if self._idle_handler is not None:
+                    self.__call(self._idle_handler)
+                continue
+            try:
+                if item is _STOP:
+                    return
+                failed = not self.__call(self._handler, item)
+                self.metrics.record_done(failed)
+            finally:
+                self._queue.task_done()
+
+    def __call(self, handler: Callable, *args) -> bool:
+        try:
+            if self.profiler is not None:
+                self.profiler.run_handler(handler, *args)
+            else:
+                handler(*args)
+            return True
+        except Exception as e:
+            self._logger.exception(f"Stage {self.name} failed: {e}")
+            return False
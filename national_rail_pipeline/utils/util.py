@@ -1,11 +1,82 @@
+import atexit
+import itertools
+import json
 import logging
+import queue
 import sys
 import os
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
 
+DEFAULT_LOG_FORMAT = "[%(name)s][%(levelname)s][%(asctime)s] %(message)s"
 
-def configure_logging(logger, debug=False) -> None:
+
+class LazyQueueHandler(QueueHandler):
+    """Enqueues records without formatting them, so that building the message
+    happens on the listener thread rather than in the logging thread.  Arguments
+    are formatted shortly after the call, so they should not be mutated after
+    being logged."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, sample_every: int):
+        """Lets through one in every sample_every records logged with
+        extra={"sampled": True}.  Other records always pass.
+
+        Args:
+            sample_every (int): Keep one sampled record out of this many
+        """
+        super().__init__()
+        self.sample_every = sample_every
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or self.sample_every <= 1:
+            return True
+        return next(self._counter) % self.sample_every == 0
+
+
+class JSONLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "name": record.name,
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(
+    logger,
+    debug=False,
+    json_lines=False,
+    sample_every=1,
+    log_format=DEFAULT_LOG_FORMAT,
+) -> Optional[QueueListener]:
+    """Logs through a queue so that the threads calling the logger never wait on
+    formatting or stdout.  A listener thread formats and writes the records.
+
+    Args:
+        logger (logging.Logger): The logger to configure
+        debug (bool, optional): Log at DEBUG rather than INFO level
+        json_lines (bool, optional): Write one JSON object per record
+        sample_every (int, optional): Keep one in this many records logged with
+            extra={"sampled": True}
+        log_format (str, optional): Format used when json_lines is False
+
+    Returns:
+        Optional[QueueListener]: The listener, or None if the logger was already
+            configured. It is stopped, and the queue flushed, at exit.
+    """
     if len(logger.handlers) > 0:
-        return
+        return None
 
     log_level = logging.INFO
     if debug:
@@ -14,11 +85,55 @@ def configure_logging(logger, debug=False) -> None:
     logger.setLevel(log_level)
     ch = logging.StreamHandler(sys.stdout)
     ch.setLevel(log_level)
-    formatter = logging.Formatter("[%(name)s][%(levelname)s][%(asctime)s] %(message)s")
+    if json_lines:
+        formatter = JSONLinesFormatter()
+    else:
+        formatter = logging.Formatter(log_format)
     ch.setFormatter(formatter)
-    logger.addHandler(ch)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.setLevel(log_level)
+    queue_handler.addFilter(SamplingFilter(sample_every))
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, ch, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
 
 
 def create_directory_if_not_exists(directory: str) -> None:
     if not os.path.exists(directory):
         os.makedirs(directory)
+
+
+def truncate_torn_tail(file_path: str, chunk_size: int = 64 * 1024) -> int:
+    """Removes a partial last line left by a process killed mid-write, so the next
+    append starts on a line of its own.
+
+    Args:
+        file_path (str): A CSV or NDJSON file written one line at a time
+        chunk_size (int, optional): Bytes read at a time while looking backwards
+            for the last complete line
+
+    Returns:
+        int: The number of bytes removed
+    """
+    with open(file_path, "r+b") as file:
+        size = file.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - chunk_size)
+            file.seek(start)
+            chunk = file.read(end - start)
+            newline_index = chunk.rfind(b"\n")
+            if newline_index != -1:
+                end = start + newline_index + 1
+                break
+            end = start
+        if end != size:
+            file.truncate(end)
+            file.flush()
+            os.fsync(file.fileno())
+        return size - end
@@ -1,59 +1,97 @@
-import json
+import datetime
 import os
-import re
 import sys
 
+from national_rail_pipeline.raw_snapshots import iter_snapshots
+from national_rail_pipeline.snapshot_storage import (
+    AzureBlobStorage,
+    LocalBlobCache,
+    LocalDirectoryStorage,
+    SnapshotReader,
+)
+
 path = './data/2025/01/16'
 # file = '162748-NCL.json'
 
-latest_services = []
 
-# Need to sort filenames or returned in random order
-# Sorting by filename...
-file_list = sorted(os.scandir(path),key=lambda e: e.name)
+def consolidate_services(path):
+    latest_services = []
 
-# Iterate over all files in the directory
-for entry in file_list:
-    print(f'..got {entry.name}..')
-    if entry.is_file() and not re.search('^\..*', entry.name):
-        file = entry.name
-        # if file == '.DS_Store':
-        #     break
+    # Snapshots come back sorted by name whether they are separate files,
+    # appended NDJSON or a packed day
+    for snapshot in iter_snapshots(path):
+        file = snapshot["name"]
         print(f'Processing {file}')
 
-        # For each file, read contents and 
-        with open(path + '/' + file, 'r') as fh:
-            rawdata = fh.read()
-            services = json.loads(rawdata)
-
-            for service in services:
-                print('{} -  {} {} {} (arr:{}) -> {} (dep:{})'.format(file, service["id"], service["operatorCode"], service["origin"], service["sched_arr"], service["destination"], service["sched_dep"]))
-                service_added = False
-                for latest in latest_services:
-                    if latest["id"] == service["id"] and not service_added:
-                        # Remove the old record and add the new one
-                        latest_services.remove(latest)
-                        # Retain the first file details
-                        service["meta_first_file"] = latest["meta_first_file"]
-                        # Add this latest file
-                        service["meta_last_file"] = path + '/' + file
-                        latest_services.append(service)
-                        service_added = True
-                        print('Replaced...')
-                # Add if this is first time we have seen this service
-                if not service_added:
-                    service["meta_first_file"] = path + '/' + file
+        services = snapshot["services"]
+
+        for service in services:
+            print('{} -  {} {} {} (arr:{}) -> {} (dep:{})'.format(file, service["id"], service["operatorCode"], service["origin"], service["sched_arr"], service["destination"], service["sched_dep"]))
+            service_added = False
+            for latest in latest_services:
+                if latest["id"] == service["id"] and not service_added:
+                    # Remove the old record and add the new one
+                    latest_services.remove(latest)
+                    # Retain the first file details
+                    service["meta_first_file"] = latest["meta_first_file"]
+                    # Add this latest file
+                    service["meta_last_file"] = path + '/' + file
                     latest_services.append(service)
-                    print('Added...')
-                
-print('===========================================')
-
-for service in latest_services:
-    # print(service)
-    # Attempt to pull out last file - may not be present if only seen once
-    try:
-        lastfile = service["meta_last_file"]
-    except:
-        lastfile = ''
+                    service_added = True
+                    print('Replaced...')
+            # Add if this is first time we have seen this service
+            if not service_added:
+                service["meta_first_file"] = path + '/' + file
+                latest_services.append(service)
+                print('Added...')
+
+    return latest_services
+
+
+def print_services(latest_services):
+    print('===========================================')
+
+    for service in latest_services:
+        # print(service)
+        # Attempt to pull out last file - may not be present if only seen once
+        try:
+            lastfile = service["meta_last_file"]
+        except:
+            lastfile = ''
     
-    print('{} ({}) -> {} {} {} (arr:{}) -> {} (dep:{})'.format(service["meta_first_file"], lastfile, service["id"], service["operatorCode"], service["origin"], service["sched_arr"], service["destination"], service["sched_dep"]))
+        print('{} ({}) -> {} {} {} (arr:{}) -> {} (dep:{})'.format(service["meta_first_file"], lastfile, service["id"], service["operatorCode"], service["origin"], service["sched_arr"], service["destination"], service["sched_dep"]))
+
+
+def snapshot_reader():
+    # Read the day from blob storage, or from a local copy of the container,
+    # through the local cache instead of a hand synced ./data directory
+    connect_str = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
+    source_directory = os.getenv('SNAPSHOT_SOURCE_DIRECTORY')
+    if connect_str:
+        storage = AzureBlobStorage(connect_str)
+    elif source_directory:
+        storage = LocalDirectoryStorage(source_directory)
+    else:
+        return None
+    cache = LocalBlobCache(
+        os.getenv('SNAPSHOT_CACHE_DIRECTORY', './cache'),
+        int(float(os.getenv('SNAPSHOT_CACHE_MB', '1024')) * 1024 * 1024),
+    )
+    return SnapshotReader(storage, cache)
+
+
+if __name__ == "__main__":
+    reader = snapshot_reader()
+    if len(sys.argv) > 1:
+        if reader is None:
+            sys.exit(
+                f'Cannot read {sys.argv[1]}: set AZURE_STORAGE_CONNECTION_STRING '
+                'or SNAPSHOT_SOURCE_DIRECTORY to where the snapshots are stored'
+            )
+        day = datetime.datetime.strptime(sys.argv[1], '%Y-%m-%d').date()
+        path = reader.sync_day(day)
+        print(
+            f'Synced {day}: {reader.misses} fetched, {reader.hits} from cache',
+            file=sys.stderr,
+        )
+    print_services(consolidate_services(path))
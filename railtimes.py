@@ -3,6 +3,16 @@
 # from national_rail_pipeline.utils.config import Config
 # from national_rail_pipeline.utils.util import configure_logging
 from national_rail_pipeline.api import RailQuerier
+from national_rail_pipeline.raw_snapshots import (
+    NDJSON_EXTENSION,
+    append_snapshot,
+    day_directory,
+    snapshot_line,
+    snapshot_name,
+)
+from national_rail_pipeline.utils.util import (
+    configure_logging as configure_queue_logging,
+)
 
 from dotenv import load_dotenv
 # import sys
@@ -12,9 +22,6 @@ import json
 import datetime
 import sys
 
-from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
-
 #     Ver    Author          Date       Comments
 #     ===    =============== ========== =======================================
 ver = 0.1  # ajpowell        2022-06-14 Initial code
@@ -22,17 +29,20 @@ ver = 0.1  # ajpowell        2022-06-14 Initial code
 
 def configure_logging():
     # Initialise logging module
+    # Records are formatted and written on a listener thread, and the per service
+    # lines can be sampled with LOG_SERVICE_SAMPLE_EVERY
     logging.root.handlers = []
-    logging.basicConfig(
-        format='%(asctime)s %(levelname)-8s %(message)s',
-        # datefmt='%Y-%m-%d %H:%M:%S',
-        level=logging.INFO
-        # level=logging.DEBUG
+    configure_queue_logging(
+        logging.getLogger(),
+        debug=os.environ.get("LOG_DEBUG") == "1",
+        json_lines=os.environ.get("LOG_JSON") == "1",
+        sample_every=int(os.environ.get("LOG_SERVICE_SAMPLE_EVERY", "1")),
+        log_format='%(asctime)s %(levelname)-8s %(message)s',
         )
 
 
 def main():
-    logging.debug('Using API Token: {}'.format(os.environ.get("LDB_TOKEN")))
+    logging.debug('Using API Token: %s', os.environ.get("LDB_TOKEN"))
     logging.info('')
 
     crs = os.environ.get("CRS")
@@ -46,10 +56,17 @@ def main():
         logging.error('LDB_TOKEN is not set. Exiting.')
         sys.exit()
 
-    output_file_dirs = datetime.datetime.now().strftime('raw/%Y/%m/%d')
-    output_file_name = datetime.datetime.now().strftime('%H%M%S')
+    polled_at = datetime.datetime.now()
+    output_file_dirs = day_directory(polled_at)
+    output_file_name = snapshot_name(polled_at, crs)
+
+    output_file_path = os.path.join(output_file_dirs, output_file_name)
 
-    output_file_path = os.path.join(output_file_dirs, output_file_name + '-' + crs + '.json')
+    # RAW_OUTPUT_MODE=ndjson appends each poll to one file per station per day
+    # instead of writing a file per poll
+    output_mode = os.environ.get('RAW_OUTPUT_MODE', 'files')
+    if output_mode == 'ndjson':
+        output_file_path = os.path.join(output_file_dirs, crs + NDJSON_EXTENSION)
 
     rq = RailQuerier()
 
@@ -62,7 +79,9 @@ def main():
     return_row_list = []
 
     for trainservice in result.trainServices.service:
-        logging.debug(trainservice)
+        # Only build the repr of the zeep object when debug is enabled
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug('%r', trainservice)
         service = {}
         service["service_from"] = result.locationName
         service["dt_timestamp"] = str(result.generatedAt)
@@ -85,9 +104,37 @@ def main():
 
         # logging.info('{} - {} - Plat. {} - {} -> {}; Sched_dep: {}; Curr_dep: {}'.format(service["id"], service["operator"], service["platform"],service["origin"], service["destination"],  service["sched_dep"], service["curr_dep"]))
         if service["sched_arr"] is None:
-            logging.info('{} ({}) - {} - Plat. {} - {} ({}) -> {} ({}); Sched_dep: {}; Curr_dep: {}'.format(service["id"], service["rsid"], service["operatorCode"], service["platform"], service["origin"], service["origin_crs"], service["destination"], service["destination_crs"],  service["sched_dep"], service["curr_dep"]))
+            logging.info(
+                '%s (%s) - %s - Plat. %s - %s (%s) -> %s (%s); '
+                'Sched_dep: %s; Curr_dep: %s',
+                service["id"],
+                service["rsid"],
+                service["operatorCode"],
+                service["platform"],
+                service["origin"],
+                service["origin_crs"],
+                service["destination"],
+                service["destination_crs"],
+                service["sched_dep"],
+                service["curr_dep"],
+                extra={"sampled": True},
+            )
         else:
-            logging.info('{} ({}) - {} - Plat. {} - {} ({}) -> {} ({}); Sched_arr: {}; Curr_arr: {}'.format(service["id"], service["rsid"], service["operatorCode"], service["platform"], service["origin"], service["origin_crs"], service["destination"], service["destination_crs"],  service["sched_arr"], service["curr_arr"]))
+            logging.info(
+                '%s (%s) - %s - Plat. %s - %s (%s) -> %s (%s); '
+                'Sched_arr: %s; Curr_arr: %s',
+                service["id"],
+                service["rsid"],
+                service["operatorCode"],
+                service["platform"],
+                service["origin"],
+                service["origin_crs"],
+                service["destination"],
+                service["destination_crs"],
+                service["sched_arr"],
+                service["curr_arr"],
+                extra={"sampled": True},
+            )
 
         calling_points = []
         if (trainservice.subsequentCallingPoints and
@@ -109,8 +156,30 @@ def main():
     logging.info('')
 
     connect_str = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
+    local_directory = os.getenv('RAW_OUTPUT_DIRECTORY')
+
+    if local_directory:
+        # Write under a local directory instead of blob storage
+        local_file_dirs = os.path.join(local_directory, output_file_dirs)
+        if output_mode == 'ndjson':
+            # RAW_OUTPUT_DURABILITY=strict fsyncs each appended line
+            durable = os.environ.get('RAW_OUTPUT_DURABILITY', 'none') == 'strict'
+            stored_path = append_snapshot(
+                local_file_dirs, output_file_name, crs, return_row_list, durable=durable
+            )
+        else:
+            os.makedirs(local_file_dirs, exist_ok=True)
+            stored_path = os.path.join(local_file_dirs, output_file_name)
+            with open(stored_path, 'w') as fh:
+                json.dump(return_row_list, fh)
+
+        logging.info(f'Stored data in : {stored_path}')
+
+    elif connect_str:
+        # Imported here as the azure SDK takes longer to import than the rest of
+        # the script, and is not needed until the board has been fetched
+        from azure.storage.blob import BlobServiceClient
 
-    if connect_str:
         # Create the BlobServiceClient object
         blob_service_client = BlobServiceClient.from_connection_string(connect_str)
 
@@ -122,13 +191,27 @@ def main():
         # Create a blob client using the local file name as the name for the blob
         blob_client = blob_service_client.get_blob_client(container=container_name, blob=output_file_path)
 
-        blob_client.upload_blob(json.dumps(return_row_list))
+        if output_mode == 'ndjson':
+            from azure.core.exceptions import ResourceNotFoundError
+
+            data = snapshot_line(output_file_name, crs, return_row_list)
+            try:
+                blob_client.append_block(data)
+            except ResourceNotFoundError:
+                # First poll of the day for this station
+                blob_client.create_append_blob()
+                blob_client.append_block(data)
+        else:
+            blob_client.upload_blob(json.dumps(return_row_list))
 
         logging.info(f'Stored data in : {output_file_path}')
         # print(json.dumps(return_row_list))
 
     else:
-        logging.error('AZURE_STORAGE_CONNECTION_STRING is not set. Exiting.')
+        logging.error(
+            'Neither AZURE_STORAGE_CONNECTION_STRING nor RAW_OUTPUT_DIRECTORY '
+            'is set. Exiting.'
+        )
         sys.exit()
 
 if __name__ == "__main__":